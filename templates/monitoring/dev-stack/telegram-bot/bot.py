@@ -24,25 +24,50 @@ Based on:
 
 import os
 import asyncio
+import ast
 import logging
 import json
 import hashlib
+import hmac
+import gzip
+import html
+import math
+import operator
+import re
+import shlex
+import signal
+import sqlite3
+import ssl
+import struct
+import tempfile
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urlparse
 from datetime import datetime, time, timedelta
+from time import monotonic
 from typing import Optional, Dict, List
-from collections import defaultdict
+from collections import defaultdict, deque, OrderedDict
 import pytz
 import aiohttp
+import yaml
 
 import docker
 import psutil
+from cryptography import x509
+from cryptography.x509.oid import NameOID
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application,
     CommandHandler,
     CallbackQueryHandler,
     ContextTypes,
+    TypeHandler,
+    ApplicationHandlerStop,
 )
 from telegram.constants import ParseMode
+from telegram.error import BadRequest, Forbidden, RetryAfter
 from aiohttp import web
 
 # ============================================
@@ -56,6 +81,195 @@ PROMETHEUS_URL = os.environ.get("PROMETHEUS_URL", "http://prometheus:9090")
 GRAFANA_URL = os.environ.get("GRAFANA_URL", "https://grafana.yourdomain.com")
 RUNBOOK_BASE_URL = os.environ.get("RUNBOOK_BASE_URL", "https://github.com/your-repo/runbooks/blob/main")
 
+# Local runbooks and alert rules, indexed at startup for /runbook and alert messages
+RUNBOOK_DIR = os.environ.get("RUNBOOK_DIR", "/app/runbooks")
+ALERT_RULES_FILE = os.environ.get("ALERT_RULES_FILE", "/app/alerts.yml")
+
+# SSL certificate scanner
+# Extra hosts to check besides project urls, e.g. "api.example.com,mail.example.com:8443"
+SSL_DOMAINS = [d.strip() for d in os.environ.get("SSL_DOMAINS", "").split(",") if d.strip()]
+SSL_SCAN_CONCURRENCY = int(os.environ.get("SSL_SCAN_CONCURRENCY", "10"))
+SSL_SCAN_TIMEOUT = float(os.environ.get("SSL_SCAN_TIMEOUT", "10"))
+SSL_CACHE_TTL = int(os.environ.get("SSL_CACHE_TTL", "21600"))
+SSL_CA_FILE = os.environ.get("SSL_CA_FILE")
+
+# Shared HTTP client
+HTTP_POOL_LIMIT = int(os.environ.get("HTTP_POOL_LIMIT", "20"))
+
+# Uptime prober for project urls
+UPTIME_PROBE_INTERVAL = int(os.environ.get("UPTIME_PROBE_INTERVAL", "60"))
+UPTIME_PROBE_TIMEOUT = float(os.environ.get("UPTIME_PROBE_TIMEOUT", "10"))
+UPTIME_WINDOW = 3600
+
+# /logs streaming
+LOGS_DEFAULT_TAIL = int(os.environ.get("LOGS_DEFAULT_TAIL", "30"))
+LOGS_FOLLOW_MAX = int(os.environ.get("LOGS_FOLLOW_MAX", "600"))
+LOGS_FOLLOW_EDIT_INTERVAL = float(os.environ.get("LOGS_FOLLOW_EDIT_INTERVAL", "3"))
+LOGS_MESSAGE_LIMIT = 3500
+LOGS_QUEUE_SIZE = 256
+
+# Loki log search
+LOKI_URL = os.environ.get("LOKI_URL", "http://loki:3100")
+LOKI_MAX_RANGE = int(os.environ.get("LOKI_MAX_RANGE", "86400"))
+LOKI_MAX_BYTES = int(os.environ.get("LOKI_MAX_BYTES", str(2 * 1024**3)))
+LOKI_PAGE_SIZE = int(os.environ.get("LOKI_PAGE_SIZE", "25"))
+LOKI_MAX_PAGES = int(os.environ.get("LOKI_MAX_PAGES", "20"))
+LOKI_CACHE_BUCKET = 60
+LOKI_LINE_LIMIT = 200
+
+# /top container stats
+TOP_STATS_WORKERS = int(os.environ.get("TOP_STATS_WORKERS", "8"))
+TOP_CACHE_TTL = int(os.environ.get("TOP_CACHE_TTL", "10"))
+TOP_BASELINE_MAX_AGE = 300
+TOP_N = 10
+
+# /procs host process snapshots
+# Point HOST_PROC at a mounted host /proc (or run with pid: host) to see host processes
+HOST_PROC = os.environ.get("HOST_PROC", "/proc")
+PROCS_SAMPLE_INTERVAL = int(os.environ.get("PROCS_SAMPLE_INTERVAL", "15"))
+PROCS_TOP_N = 15
+
+# Grafana panel rendering (needs the grafana-image-renderer plugin/service)
+GRAFANA_RENDER_URL = os.environ.get("GRAFANA_RENDER_URL", "http://grafana:3000")
+GRAFANA_API_TOKEN = os.environ.get("GRAFANA_API_TOKEN", "")
+GRAFANA_RENDER_CONCURRENCY = int(os.environ.get("GRAFANA_RENDER_CONCURRENCY", "2"))
+GRAFANA_RENDER_TIMEOUT = int(os.environ.get("GRAFANA_RENDER_TIMEOUT", "60"))
+GRAFANA_RENDER_BUCKET = int(os.environ.get("GRAFANA_RENDER_BUCKET", "60"))
+GRAFANA_RENDER_CACHE_SIZE = 32
+GRAFANA_RENDER_WIDTH = 1000
+GRAFANA_RENDER_HEIGHT = 500
+ALERT_ATTACH_PANELS = os.environ.get("ALERT_ATTACH_PANELS", "false").lower() == "true"
+GRAFANA_ALERT_PANEL_RANGE = "3h"
+
+# /graph Prometheus range charts
+GRAPH_RESOLUTION = 240
+GRAPH_MIN_STEP = 15
+GRAPH_MAX_RANGE = 30 * 86400
+GRAPH_SPARK_WIDTH = 32
+GRAPH_PNG_WIDTH = 640
+GRAPH_PNG_HEIGHT = 240
+GRAPH_MAX_SERIES = 6
+GRAPH_CACHE_SIZE = 64
+
+# /status and /health source: "local" (psutil + Docker socket) or "prometheus"
+# (node-exporter, cAdvisor, blackbox and DB exporters, graded by alerts.yml)
+STATUS_SOURCE = os.environ.get("STATUS_SOURCE", "local").lower()
+PROM_QUERY_TIMEOUT = float(os.environ.get("PROM_QUERY_TIMEOUT", "3"))
+PROM_CACHE_TTL = 15
+
+# /db: instances per page, and how old a sample must be to compare trends against
+DB_PAGE_SIZE = 6
+DB_TREND_MIN_AGE = 60
+DB_TREND_TOLERANCE = 0.05  # relative change shown as →
+
+# /traffic: Traefik rate window, result cache and routers per page
+TRAFFIC_WINDOW = "5m"
+TRAFFIC_CACHE_TTL = 5
+TRAFFIC_PAGE_SIZE = 8
+
+# Backups: targets as "name=command" pairs, run by /backup and daily at BACKUP_TIME ("" disables).
+# BACKUP_DIR is mounted at the same path as on the host, for the scripts' `docker run -v`.
+BACKUP_DIR = os.environ.get("BACKUP_DIR", "/home/deploy/backups")
+BACKUP_TARGETS = {
+    name.strip(): command.strip()
+    for name, command in (
+        item.split("=", 1) for item in os.environ.get("BACKUP_TARGETS", "stack=/app/scripts/backup.sh").split(",") if "=" in item
+    )
+}
+BACKUP_TIME = os.environ.get("BACKUP_TIME", "03:00")
+BACKUP_CONCURRENCY = 1
+BACKUP_TIMEOUT = int(os.environ.get("BACKUP_TIMEOUT", "7200"))
+BACKUP_STALE_AFTER = int(os.environ.get("BACKUP_STALE_AFTER", str(26 * 3600)))
+BACKUP_CHECK_INTERVAL = 600
+
+# /du: scanned roots as "name=path" pairs (host paths mounted under /host). Docker
+# volumes are root-only on the host; /dockerdf lists their sizes from the daemon.
+DU_ROOTS = {
+    name.strip(): path.strip().rstrip("/")
+    for name, path in (
+        item.split("=", 1)
+        for item in os.environ.get("DU_ROOTS", f"logs=/host/log,backups={BACKUP_DIR}").split(",")
+        if "=" in item
+    )
+}
+DU_INDEX_FILE = os.environ.get("DU_INDEX_FILE", "/app/data/du.json")
+DU_SCAN_INTERVAL = int(os.environ.get("DU_SCAN_INTERVAL", "3600"))
+DU_FULL_RESCAN = 24 * 3600    # also relist unchanged directories once a day
+DU_WORKERS = 2
+DU_BIG_FILE = 1024 * 1024     # files re-statted on every scan, even in unchanged directories
+DU_TOP = 10
+
+# /dockerdf: `docker system df` cache and json-file log sizes. The log directory
+# is root-only, so a throwaway helper container (as in backup.sh) stats the logs.
+DOCKERDF_CACHE_TTL = 60
+DOCKER_HELPER_IMAGE = os.environ.get("DOCKER_HELPER_IMAGE", "alpine")
+DOCKER_LOG_WARN = 100 * 1024 * 1024
+DOCKER_TOP_VOLUMES = 5
+DOCKER_PRUNE_PLAN_TTL = 300
+
+# Fleet mode: "standalone" (default), "agent" (serves /agent/snapshot, no Telegram)
+# or "hub" (polls FLEET_AGENTS, e.g. "web1=http://10.0.0.2:5001,web2=http://10.0.0.3:5001")
+BOT_MODE = os.environ.get("BOT_MODE", "standalone").lower()
+NODE_NAME = os.environ.get("NODE_NAME") or os.uname().nodename
+FLEET_AGENTS = {
+    name.strip(): url.strip().rstrip("/")
+    for name, url in (item.split("=", 1) for item in os.environ.get("FLEET_AGENTS", "").split(",") if "=" in item)
+}
+FLEET_TOKEN = os.environ.get("FLEET_TOKEN", "")
+FLEET_POLL_INTERVAL = int(os.environ.get("FLEET_POLL_INTERVAL", "30"))
+FLEET_TIMEOUT = float(os.environ.get("FLEET_TIMEOUT", "5"))
+FLEET_STALE_AFTER = FLEET_POLL_INTERVAL * 3
+
+# Shared state for running several replicas:
+# "memory://" (default, single instance), "sqlite:////app/data/state.db"
+# or "redis://[:password@]host:6379/0" (any Redis-protocol server)
+STATE_URL = os.environ.get("STATE_URL", "memory://")
+STATE_TIMEOUT = float(os.environ.get("STATE_TIMEOUT", "3"))
+LEADER_LEASE_TTL = int(os.environ.get("LEADER_LEASE_TTL", "15"))
+ALERT_DEDUP_TTL = int(os.environ.get("ALERT_DEDUP_TTL", "300"))
+NOTIFY_RATE_LIMIT = int(os.environ.get("NOTIFY_RATE_LIMIT", "20"))  # messages per chat per minute
+INSTANCE_ID = f"{NODE_NAME}-{os.getpid()}-{os.urandom(3).hex()}"
+
+# Outbound notification spool (survives Telegram outages and restarts)
+SPOOL_DIR = os.environ.get("SPOOL_DIR", "/app/data/spool")
+SPOOL_SEGMENT_SIZE = 1024 * 1024
+SPOOL_FSYNC_INTERVAL = float(os.environ.get("SPOOL_FSYNC_INTERVAL", "0.05"))
+SPOOL_MAX_BACKOFF = 60
+SPOOL_DRAIN_TIMEOUT = float(os.environ.get("SPOOL_DRAIN_TIMEOUT", "8"))
+
+# Incident statistics (/stats, daily report): hourly buckets, saved by the leader
+STATS_FILE = os.environ.get("STATS_FILE", "/app/data/stats.json")
+STATS_RETENTION = 30 * 86400
+STATS_SAVE_INTERVAL = 300
+STATS_SKETCH_ACCURACY = 0.02  # relative error of MTTA/MTTR percentiles
+
+# Host metric sampler: hourly rollups for reports, saved with the incident stats
+HOST_SAMPLE_INTERVAL = int(os.environ.get("HOST_SAMPLE_INTERVAL", "30"))
+ROLLUP_FILE = os.environ.get("ROLLUP_FILE", "/app/data/rollups.json")
+ROLLUP_RETENTION = 15 * 86400
+HOURLY_REPORT = os.environ.get("HOURLY_REPORT", "false").lower() == "true"
+
+# Early-warning detector on sampled host metrics (EWMA z-score + fill trend)
+ANOMALY_DETECTION = os.environ.get("ANOMALY_DETECTION", "true").lower() == "true"
+ANOMALY_EWMA_ALPHA = 0.02     # baseline memory of roughly 50 samples
+ANOMALY_WARMUP = 60           # samples before the detector speaks up
+ANOMALY_Z_THRESHOLD = float(os.environ.get("ANOMALY_Z_THRESHOLD", "4"))
+ANOMALY_SUSTAIN = 4           # consecutive anomalous samples before warning
+ANOMALY_DISK_HORIZON = int(os.environ.get("ANOMALY_DISK_HORIZON", str(24 * 3600)))
+ANOMALY_MEMORY_HORIZON = int(os.environ.get("ANOMALY_MEMORY_HORIZON", str(2 * 3600)))
+
+# Alerts raised by the bot are posted to Alertmanager and re-posted while they
+# fire; Alertmanager resolves them if BOT_ALERT_TTL passes without a refresh
+BOT_ALERT_REFRESH = 60
+BOT_ALERT_TTL = 300
+
+# Paginated message views kept for ◀️/▶️ callbacks
+PAGINATED_VIEW_LIMIT = 50
+
+# Hot-reloaded config file (projects, runbooks, dashboards, severity, thresholds)
+CONFIG_FILE = os.environ.get("BOT_CONFIG_FILE", "/app/config/bot.yml")
+CONFIG_POLL_INTERVAL = int(os.environ.get("CONFIG_POLL_INTERVAL", "10"))
+
 # Timezone
 TIMEZONE = pytz.timezone(os.environ.get("TIMEZONE", "UTC"))
 
@@ -69,6 +283,9 @@ logger = logging.getLogger(__name__)
 # Docker client
 docker_client = docker.from_env()
 
+# psutil reads every /proc file relative to this path
+psutil.PROCFS_PATH = HOST_PROC
+
 # ============================================
 # CONSTANTS & MAPPINGS
 # ============================================
@@ -108,32 +325,84 @@ CATEGORY_CONFIG = {
     "backup": {"icon": "💾", "name": "Backup"},
 }
 
+# Built-in defaults below can be overridden in BOT_CONFIG_FILE without a rebuild
+
 # Runbook URLs - Update RUNBOOK_BASE_URL env var for your repo
+# Alerts are mapped by the "runbook" annotation in alerts.yml (RUNBOOK INDEX);
+# entries here or in the config file take precedence
 RUNBOOKS = {
-    "YuksekCPU": f"{RUNBOOK_BASE_URL}/cpu-high.md",
-    "KritikCPU": f"{RUNBOOK_BASE_URL}/cpu-high.md",
-    "YuksekBellek": f"{RUNBOOK_BASE_URL}/memory-high.md",
-    "KritikBellek": f"{RUNBOOK_BASE_URL}/memory-high.md",
-    "DusukDisk": f"{RUNBOOK_BASE_URL}/disk-low.md",
-    "KritikDisk": f"{RUNBOOK_BASE_URL}/disk-low.md",
-    "RedisKritikBellek": f"{RUNBOOK_BASE_URL}/postgres-redis.md",
-    "TraefikDown": f"{RUNBOOK_BASE_URL}/website-down.md",
-    "ContainerDown": f"{RUNBOOK_BASE_URL}/container-down.md",
-    "WebsiteDown": f"{RUNBOOK_BASE_URL}/website-down.md",
-    "PostgreSQLDown": f"{RUNBOOK_BASE_URL}/postgres-redis.md",
     "default": RUNBOOK_BASE_URL,
 }
 
-# Grafana dashboards - customize based on your setup
+# Grafana dashboards by uid (the "uid" in grafana/provisioning/dashboards/json)
 GRAFANA_DASHBOARDS = {
     "host": "vps-overview",
-    "container": "docker-host-container",
+    "container": "4dMaCsRZz",  # docker-host-container.json
     "database": "databases-detailed",
-    "infrastructure": "traefik",
+    "infrastructure": "n5bu_kv45",  # traefik.json
     "monitoring": "alerts-overview",
     "default": "vps-overview",
 }
 
+# /grafana link buttons: (label, dashboard uid)
+GRAFANA_LINKS = [
+    ("📊 VPS Overview", "vps-overview"),
+    ("🔔 Alerts", "alerts-overview"),
+    ("🐳 Docker", "4dMaCsRZz"),
+    ("🌐 Traefik", "n5bu_kv45"),
+    ("📜 Logs", "logs-explorer"),
+    ("🔒 Uptime & SSL", "website-uptime"),
+]
+
+# Panel id attached to alert notifications per category (ALERT_ATTACH_PANELS)
+GRAFANA_ALERT_PANELS = {
+    "host": 7,            # vps-overview: CPU & Memory Over Time
+    "container": 1,       # docker-host-container: CPU Usage per Container
+    "database": 7,        # databases-detailed: PostgreSQL Connections
+    "infrastructure": 7,  # traefik: Requests per Entrypoint
+    "monitoring": 6,      # alerts-overview: Alerts Over Time
+    "default": 7,
+}
+
+# /graph presets: name -> (title, PromQL, unit)
+GRAPH_PRESETS = {
+    "cpu": ("CPU Usage", '100 - (avg by(instance) (irate(node_cpu_seconds_total{mode="idle"}[5m])) * 100)', "%"),
+    "memory": ("Memory Usage", "(1 - (node_memory_MemAvailable_bytes / node_memory_MemTotal_bytes)) * 100", "%"),
+    "disk": ("Disk Usage /", '(1 - node_filesystem_avail_bytes{mountpoint="/"} / node_filesystem_size_bytes{mountpoint="/"}) * 100', "%"),
+    "load": ("Load (5m)", "node_load5", ""),
+    "net": ("Network In", 'sum by(instance) (rate(node_network_receive_bytes_total{device!~"lo|docker.*|veth.*"}[5m]))', "B/s"),
+    "containers": ("Container CPU", 'topk(5, sum by(name) (rate(container_cpu_usage_seconds_total{name!=""}[3m])) * 100)', "%"),
+}
+
+# /status rows in Prometheus mode: (section, label, alert rules, unit)
+# The value query and the 🟡/🔴 levels come from the rules' expressions in alerts.yml
+PROM_STATUS_ROWS = [
+    ("host", "CPU", ("HighCPU", "CriticalCPU"), "%"),
+    ("host", "Memory", ("HighMemory", "CriticalMemory"), "%"),
+    ("host", "Disk free /", ("LowDisk", "CriticalDisk"), "%"),
+    ("host", "Load (5m)", ("HighLoad",), ""),
+    ("host", "Network in", ("HighNetworkTraffic",), "B/s"),
+    ("containers", "Top CPU", ("ContainerHighCPU",), "%"),
+    ("containers", "Top memory of limit", ("ContainerHighMemory",), "%"),
+    ("containers", "Restarts (1h)", ("ContainerRestartLoop",), ""),
+    ("traffic", "5xx rate", ("HighErrorRate", "CriticalErrorRate"), "%"),
+    ("traffic", "p95 latency", ("HighLatency",), "s"),
+    ("traffic", "Slowest probe", ("WebsiteSlow",), "s"),
+    ("traffic", "SSL expiry", ("SSLCertificateExpiringSoon", "SSLCertificateCritical"), "duration"),
+    ("database", "Postgres cache hit", ("PostgreSQLLowCacheHitRatio",), "ratio"),
+    ("database", "Postgres longest tx", ("PostgreSQLSlowQueries",), "s"),
+    ("database", "Redis memory", ("RedisHighMemory", "RedisCriticalMemory"), "%"),
+    ("database", "Redis hit rate", ("RedisLowHitRate",), "ratio"),
+    ("database", "Redis clients", ("RedisHighConnectionCount",), ""),
+]
+
+# Extra /status counters in Prometheus mode: label -> (up query, total query)
+PROM_STATUS_COUNTS = {
+    "🐳 Containers": ('count(time() - container_last_seen{name!=""} < 60)', 'count(container_last_seen{name!=""})'),
+    "🌐 Sites": ('sum(probe_success{job="blackbox-http"})', 'count(probe_success{job="blackbox-http"})'),
+    "🎯 Targets": ("sum(up)", "count(up)"),
+}
+
 # Container status emojis
 STATUS_EMOJI = {
     "running": "🟢",
@@ -144,7 +413,9 @@ STATUS_EMOJI = {
     "dead": "💀",
 }
 
-# Project groupings - CUSTOMIZE THIS for your projects
+# Project overrides - projects are discovered from compose labels
+# (com.docker.compose.project). Entries here set the display name and
+# url of a project and can pin containers that have no compose labels.
 PROJECT_GROUPS = {
     # Example projects - customize for your setup
     "app": {
@@ -164,20 +435,328 @@ PROJECT_GROUPS = {
     },
 }
 
-# Alert history (in-memory, for production use Redis)
-alert_history: Dict[str, dict] = {}
-acknowledged_alerts: Dict[str, datetime] = {}
+# Resource thresholds (percent) for status emojis and health checks
+THRESHOLDS = {
+    "cpu": {"warn": 70, "crit": 90},
+    "memory": {"warn": 75, "crit": 90},
+    "disk": {"warn": 75, "crit": 90},
+}
+
+# Project index maintained from Docker events
+# container name -> {"id", "status", "project", "service"}
+container_index: Dict[str, dict] = {}
+# project id -> {"name", "url", "containers": set of names}
+project_index: Dict[str, dict] = {}
+project_index_ready = False
+# container name -> how its last run ended: "crashed" or "stopped" (by a user)
+container_exits: Dict[str, str] = {}
+
+# Alert history and acks live in the state store (see SHARED STATE)
+# Only the leader replica polls Telegram and runs the scheduled jobs
+is_leader = False
+leader_renewed_at: Optional[float] = None
+
+# SSL certificate cache, keyed by "host:port"
+ssl_cert_cache: Dict[str, dict] = {}
+ssl_cache_updated_at: Optional[datetime] = None
+ssl_scan_lock = asyncio.Lock()
+
+# /du directory index per root: path -> {"mtime", "files", "big", "dirs", "size"}
+du_index: Dict[str, Dict[str, dict]] = {}
+du_scanned_at: Dict[str, float] = {}
+du_full_scan_at = 0.0
+du_scan_lock = asyncio.Lock()
+
+# Uptime probe samples per URL: (timestamp, status, ttfb, total, ok)
+uptime_samples: Dict[str, deque] = defaultdict(
+    lambda: deque(maxlen=UPTIME_WINDOW // UPTIME_PROBE_INTERVAL + 1)
+)
+
+# Paginated views by id
+paginated_views: OrderedDict = OrderedDict()
+
+# Container stats: bounded pool, last counter snapshot per container id
+stats_executor = ThreadPoolExecutor(max_workers=TOP_STATS_WORKERS, thread_name_prefix="stats")
+container_counters: Dict[str, tuple] = {}
+top_lock = asyncio.Lock()
+
+# Latest process snapshot plus per-process state keyed by (pid, create_time)
+process_snapshot: List[dict] = []
+process_snapshot_at: Optional[datetime] = None
+process_containers: Dict[tuple, Optional[str]] = {}
+process_io_counters: Dict[tuple, tuple] = {}
+
+# Grafana renders in flight, shared by identical concurrent requests
+render_inflight: Dict[tuple, asyncio.Future] = {}
+render_semaphore = asyncio.Semaphore(GRAFANA_RENDER_CONCURRENCY)
+
+# Fleet nodes (hub mode): name -> {"url", "snapshot", "updated_at", "error"}
+fleet_nodes: Dict[str, dict] = {}
+
+# Alerts raised by the bot itself (early warnings, backups) that are still firing,
+# and the keys of those notified directly because Alertmanager was unreachable
+bot_alerts: Dict[str, dict] = {}
+bot_alerts_direct: set = set()
+
+# Background tasks kept referenced until they finish
+background_tasks: set = set()
+
+# Shared keep-alive HTTP session, created lazily inside the event loop
+http_session: Optional[aiohttp.ClientSession] = None
 
 # Escalation log file
 ESCALATION_LOG_FILE = os.environ.get("ESCALATION_LOG_FILE", "/var/log/telegram-bot/escalations.log")
 
+# ============================================
+# CONFIGURATION FILE (hot-reloaded)
+# ============================================
+
+class AlertRouter:
+    """Compiled routing rules: alert labels -> (chat id, topic) destinations.
+
+    Rules are tried in order; the first match wins unless it sets
+    continue. Rules only look at severity, category and project, so
+    results are memoized per combination and a repeat alert costs one
+    dict lookup.
+    """
+
+    LABELS = ("severity", "category", "project")
+
+    def __init__(self, routes: List[dict], default: tuple):
+        self.routes = routes
+        self.default = default
+        self.cache: Dict[tuple, tuple] = {}
+
+    @staticmethod
+    def _matches(value: str, matcher) -> bool:
+        return value in matcher if isinstance(matcher, frozenset) else matcher.fullmatch(value) is not None
+
+    def route(self, labels: dict) -> tuple:
+        key = tuple(labels.get(label, "") for label in self.LABELS)
+        found = self.cache.get(key)
+        if found is None:
+            values = dict(zip(self.LABELS, key))
+            matched = []
+            for route in self.routes:
+                if all(self._matches(values[label], matcher) for label, matcher in route["matchers"]):
+                    matched.extend(d for d in route["to"] if d not in matched)
+                    if not route["continue"]:
+                        break
+            found = self.cache[key] = tuple(matched) or self.default
+        return found
+
+
+def _require_mapping(value, path: str) -> dict:
+    if not isinstance(value, dict):
+        raise ValueError(f"{path}: expected a mapping")
+    return value
+
+
+def _require_str(value, path: str) -> str:
+    if not isinstance(value, str) or not value:
+        raise ValueError(f"{path}: expected a non-empty string")
+    return value
+
+
+def build_config(raw: dict) -> dict:
+    """Validate a raw config mapping and compile it over the built-in defaults.
+
+    Sections that are present replace (projects) or extend (runbooks,
+    dashboards, alert_panels, severity, thresholds, chats) the constants above. The result also
+    carries precompiled lookup tables so hot paths never scan lists.
+    """
+    raw = _require_mapping(raw or {}, "config")
+    unknown = set(raw) - {
+        "projects", "runbooks", "dashboards", "alert_panels", "severity", "thresholds", "chats", "routing",
+    }
+    if unknown:
+        raise ValueError(f"config: unknown sections {sorted(unknown)}")
+
+    projects = PROJECT_GROUPS
+    if "projects" in raw:
+        projects = {}
+        for project_id, info in _require_mapping(raw["projects"], "projects").items():
+            path = f"projects.{project_id}"
+            info = _require_mapping(info, path)
+            containers = info.get("containers", [])
+            if not isinstance(containers, list) or not all(isinstance(c, str) for c in containers):
+                raise ValueError(f"{path}.containers: expected a list of names")
+            projects[str(project_id)] = {
+                "name": _require_str(info.get("name", str(project_id)), f"{path}.name"),
+                "containers": containers,
+                "url": _require_str(info["url"], f"{path}.url") if info.get("url") else None,
+            }
+
+    runbooks = dict(RUNBOOKS)
+    for alertname, target in _require_mapping(raw.get("runbooks", {}), "runbooks").items():
+        target = _require_str(target, f"runbooks.{alertname}")
+        runbooks[alertname] = target if "://" in target else f"{RUNBOOK_BASE_URL}/{target.lstrip('/')}"
+
+    dashboards = dict(GRAFANA_DASHBOARDS)
+    for category, uid in _require_mapping(raw.get("dashboards", {}), "dashboards").items():
+        dashboards[category] = _require_str(uid, f"dashboards.{category}")
+
+    alert_panels = dict(GRAFANA_ALERT_PANELS)
+    for category, panel_id in _require_mapping(raw.get("alert_panels", {}), "alert_panels").items():
+        if not isinstance(panel_id, int):
+            raise ValueError(f"alert_panels.{category}: expected a panel id")
+        alert_panels[category] = panel_id
+
+    severity = {level: dict(values) for level, values in SEVERITY_CONFIG.items()}
+    for level, values in _require_mapping(raw.get("severity", {}), "severity").items():
+        values = _require_mapping(values, f"severity.{level}")
+        merged = {**severity.get(level, severity["warning"]), **values}
+        if not isinstance(merged["priority"], int):
+            raise ValueError(f"severity.{level}.priority: expected an integer")
+        severity[level] = merged
+
+    thresholds = {metric: dict(levels) for metric, levels in THRESHOLDS.items()}
+    for metric, levels in _require_mapping(raw.get("thresholds", {}), "thresholds").items():
+        if metric not in thresholds:
+            raise ValueError(f"thresholds.{metric}: unknown metric")
+        merged = {**thresholds[metric], **_require_mapping(levels, f"thresholds.{metric}")}
+        if not all(isinstance(merged[k], (int, float)) for k in ("warn", "crit")):
+            raise ValueError(f"thresholds.{metric}: warn and crit must be numbers")
+        if not 0 <= merged["warn"] < merged["crit"] <= 100:
+            raise ValueError(f"thresholds.{metric}: expected 0 <= warn < crit <= 100")
+        thresholds[metric] = merged
+
+    # TELEGRAM_CHAT_ID is always the "main" chat with every command
+    chats = {ALLOWED_CHAT_ID: {"name": "main", "topic": None, "commands": None}}
+    chat_names = {"main": ALLOWED_CHAT_ID}
+    for name, info in _require_mapping(raw.get("chats", {}), "chats").items():
+        path = f"chats.{name}"
+        info = _require_mapping(info, path)
+        if not isinstance(info.get("id"), int):
+            raise ValueError(f"{path}.id: expected a chat id")
+        if info.get("topic") is not None and not isinstance(info["topic"], int):
+            raise ValueError(f"{path}.topic: expected a forum topic id")
+        commands = info.get("commands", ["*"])
+        if not isinstance(commands, list) or not all(isinstance(c, str) for c in commands):
+            raise ValueError(f"{path}.commands: expected a list of command names")
+        chats[info["id"]] = {
+            "name": str(name),
+            "topic": info.get("topic"),
+            "commands": None if "*" in commands else frozenset(c.lstrip("/").lower() for c in commands),
+        }
+        chat_names[str(name)] = info["id"]
+
+    def destinations(targets, path: str) -> tuple:
+        if not isinstance(targets, list) or not targets:
+            raise ValueError(f"{path}: expected a list of chat names")
+        resolved = []
+        for target in targets:
+            if target not in chat_names:
+                raise ValueError(f"{path}: unknown chat {target!r}")
+            chat_id = chat_names[target]
+            resolved.append((chat_id, chats[chat_id]["topic"]))
+        return tuple(resolved)
+
+    routing = _require_mapping(raw.get("routing", {}), "routing")
+    routes = []
+    for index, route in enumerate(routing.get("routes", [])):
+        path = f"routing.routes[{index}]"
+        route = _require_mapping(route, path)
+        matchers = []
+        for label, value in _require_mapping(route.get("match", {}), f"{path}.match").items():
+            values = value if isinstance(value, list) else [value]
+            matchers.append((label, frozenset(str(v) for v in values)))
+        for label, pattern in _require_mapping(route.get("match_re", {}), f"{path}.match_re").items():
+            try:
+                matchers.append((label, re.compile(f"(?:{_require_str(pattern, f'{path}.match_re.{label}')})")))
+            except re.error as e:
+                raise ValueError(f"{path}.match_re.{label}: {e}")
+        for label, _ in matchers:
+            if label not in AlertRouter.LABELS:
+                raise ValueError(f"{path}: can only match {', '.join(AlertRouter.LABELS)}")
+        routes.append({
+            "matchers": tuple(matchers),
+            "to": destinations(route.get("to"), f"{path}.to"),
+            "continue": bool(route.get("continue", False)),
+        })
+    default = destinations(routing.get("default", ["main"]), "routing.default")
+
+    return {
+        "projects": projects,
+        "runbooks": runbooks,
+        "dashboards": dashboards,
+        "alert_panels": alert_panels,
+        "severity": severity,
+        "thresholds": thresholds,
+        "chats": chats,
+        # Compiled lookups
+        "router": AlertRouter(routes, default),
+        "container_projects": {
+            name: project_id for project_id, info in projects.items() for name in info["containers"]
+        },
+    }
+
+
+def load_config_file() -> Optional[dict]:
+    """Read and compile CONFIG_FILE, None if it does not exist."""
+    if not os.path.exists(CONFIG_FILE):
+        return None
+    with open(CONFIG_FILE) as f:
+        return build_config(yaml.safe_load(f))
+
+
+def config_file_mtime() -> Optional[tuple]:
+    """Change marker for CONFIG_FILE, None if it does not exist."""
+    try:
+        stat = os.stat(CONFIG_FILE)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+async def reload_config_if_changed(context: ContextTypes.DEFAULT_TYPE = None) -> None:
+    """Poll the config file and swap in a new config when it changes.
+
+    The new config is fully validated and replaces the old one as a whole,
+    so a single lookup never sees a half-applied file. Handlers look config
+    up as they go, so one already running when the swap lands may read
+    from both the old and the new version.
+    """
+    global config, config_mtime
+
+    mtime = config_file_mtime()
+    if mtime == config_mtime:
+        return
+
+    try:
+        new_config = load_config_file() or build_config({})
+    except Exception as e:
+        # Keep serving the previous config, retry on next change
+        logger.error(f"Config reload failed, keeping previous config: {e}")
+        config_mtime = mtime
+        return
+
+    config = new_config
+    config_mtime = mtime
+    reindex_projects()
+    logger.info(f"Config loaded from {CONFIG_FILE}" if mtime else "Config file removed, using defaults")
+
+
+# Active config, replaced as a whole on reload
+config = build_config({})
+config_mtime = None
+
+
 # ============================================
 # HELPER FUNCTIONS
 # ============================================
 
 def is_authorized(chat_id: int) -> bool:
     """Check if the chat is authorized."""
-    return chat_id == ALLOWED_CHAT_ID
+    return chat_id in config["chats"]
+
+
+def is_command_allowed(chat_id: int, command: str) -> bool:
+    """Per-chat command permissions from the chats config section."""
+    chat = config["chats"].get(chat_id)
+    if chat is None:
+        return False
+    return chat["commands"] is None or command in chat["commands"] or command in ("start", "help", "commands")
 
 
 def get_alert_hash(alert: dict) -> str:
@@ -188,6 +767,10 @@ def get_alert_hash(alert: dict) -> str:
 
 def get_container_status(name: str) -> str:
     """Get container status emoji."""
+    if project_index_ready:
+        entry = container_index.get(name)
+        return STATUS_EMOJI.get(entry["status"], "❓") if entry else "❌"
+
     try:
         container = docker_client.containers.get(name)
         return STATUS_EMOJI.get(container.status, "❓")
@@ -222,6 +805,15 @@ def format_uptime(seconds: float) -> str:
     return " ".join(parts) if parts else "< 1m"
 
 
+def parse_duration(value: str) -> int:
+    """Parse a duration like 30s, 10m, 2h or 1d into seconds."""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    value = value.strip().lower()
+    if value[-1:] in units:
+        return int(value[:-1]) * units[value[-1]]
+    return int(value)
+
+
 def format_duration(start_time: str) -> str:
     """Format alert duration from start time."""
     try:
@@ -239,17 +831,103 @@ def format_duration(start_time: str) -> str:
         return "?"
 
 
+def get_threshold_emoji(metric: str, percent: float) -> str:
+    """Status emoji for a resource percentage using configured thresholds."""
+    levels = config["thresholds"][metric]
+    if percent >= levels["crit"]:
+        return "🔴"
+    elif percent >= levels["warn"]:
+        return "🟡"
+    return "🟢"
+
+
 def get_runbook_url(alertname: str) -> str:
     """Get runbook URL for an alert."""
-    return RUNBOOKS.get(alertname, RUNBOOKS["default"])
+    runbooks = config["runbooks"]
+    if alertname in runbooks:
+        return runbooks[alertname]
+    runbook = runbook_index.runbook_for(alertname)
+    if runbook:
+        return f"{RUNBOOK_BASE_URL}/{runbook}"
+    return runbooks["default"]
 
 
 def get_grafana_url(category: str) -> str:
     """Get Grafana dashboard URL for a category."""
-    dashboard = GRAFANA_DASHBOARDS.get(category, GRAFANA_DASHBOARDS["default"])
+    dashboards = config["dashboards"]
+    dashboard = dashboards.get(category, dashboards["default"])
     return f"{GRAFANA_URL}/d/{dashboard}"
 
 
+async def write_json_file(path: str, payload: str) -> None:
+    """Replace `path` with `payload` atomically, off the event loop."""
+    def write():
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(payload)
+        os.replace(tmp, path)
+
+    await asyncio.to_thread(write)
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Return the shared keep-alive HTTP session."""
+    global http_session
+    if http_session is None or http_session.closed:
+        connector = aiohttp.TCPConnector(limit=HTTP_POOL_LIMIT, keepalive_timeout=60, ttl_dns_cache=300)
+        http_session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=30),
+        )
+    return http_session
+
+
+class TTLCache:
+    """Small in-memory cache with per-entry expiry and LRU eviction."""
+
+    def __init__(self, ttl: float, maxsize: int = 256):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires, value = item
+        if expires < monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: Optional[float] = None) -> None:
+        self._data[key] = (monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def spawn(coro) -> asyncio.Task:
+    """Run a coroutine in the background without losing the task reference."""
+    task = asyncio.ensure_future(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of a list of values (q in 0-100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
 def log_escalation(alert_hash: str, message: str, user: str = "telegram-user"):
     """Log escalation to file for audit trail."""
     try:
@@ -262,1190 +940,6136 @@ def log_escalation(alert_hash: str, message: str, user: str = "telegram-user"):
 
 
 # ============================================
-# PROFESSIONAL ALERT FORMATTING
+# SHARED STATE (alerts, acks, dedup, rate limits, leader lease)
 # ============================================
 
-def format_alert_message(alerts: List[dict], status: str) -> str:
-    """Format alerts into professional message."""
-    if not alerts:
-        return ""
+class StateStore(ABC):
+    """State shared between bot replicas.
 
-    # Get first alert for common info
-    first_alert = alerts[0]
-    labels = first_alert.get("labels", {})
-    severity = labels.get("severity", "warning")
-    category = labels.get("category", "unknown")
+    Alerts and acks are plain key/value maps. claim(), hit() and
+    acquire_lease() are the atomic primitives behind notification dedup,
+    the per-chat rate limiter and leader election.
+    """
 
-    sev_config = SEVERITY_CONFIG.get(severity, SEVERITY_CONFIG["warning"])
-    cat_config = CATEGORY_CONFIG.get(category, {"icon": "📋", "name": category})
+    @abstractmethod
+    async def get_alert(self, alert_hash: str) -> Optional[dict]:
+        ...
 
-    is_firing = status == "firing"
-    alert_count = len(alerts)
+    @abstractmethod
+    async def put_alert(self, alert_hash: str, info: dict) -> None:
+        ...
 
-    # Header
-    if is_firing:
-        header = f"{sev_config['emoji']} <b>{sev_config['title']}</b>"
-    else:
-        header = "✅ <b>RESOLVED</b>"
+    @abstractmethod
+    async def list_alerts(self) -> Dict[str, dict]:
+        """All alerts, oldest first."""
 
-    if alert_count > 1:
-        header += f" ({alert_count} alerts)"
+    @abstractmethod
+    async def set_ack(self, alert_hash: str, at: datetime) -> None:
+        ...
 
-    lines = [header, ""]
+    @abstractmethod
+    async def get_acks(self) -> Dict[str, str]:
+        ...
 
-    # Category and timestamp
-    lines.append(f"{cat_config['icon']} <b>Category:</b> {cat_config['name']}")
-    lines.append(f"🕐 <b>Time:</b> {datetime.now(TIMEZONE).strftime('%H:%M:%S')}")
-    lines.append("")
+    @abstractmethod
+    async def clear_alerts(self) -> None:
+        """Drop alert history and acks."""
 
-    # Alert details
-    for i, alert in enumerate(alerts[:5]):  # Max 5 alerts
-        alert_labels = alert.get("labels", {})
-        annotations = alert.get("annotations", {})
-        alertname = alert_labels.get("alertname", "Unknown")
-        instance = alert_labels.get("instance", "")
+    @abstractmethod
+    async def put_backup(self, target: str, info: dict) -> None:
+        """Latest run of a backup target."""
 
-        if alert_count > 1:
-            lines.append(f"<b>#{i+1} {alertname}</b>")
-        else:
-            lines.append(f"<b>{alertname}</b>")
+    @abstractmethod
+    async def get_backups(self) -> Dict[str, dict]:
+        ...
 
-        if instance:
-            lines.append(f"📍 {instance}")
+    @abstractmethod
+    async def claim(self, key: str, ttl: int) -> bool:
+        """Set key if absent; True for the first caller within ttl seconds."""
 
-        # Description
-        description = annotations.get("description", annotations.get("summary", ""))
-        if description:
-            # Truncate long descriptions
-            if len(description) > 200:
-                description = description[:200] + "..."
-            lines.append(f"💬 {description}")
+    @abstractmethod
+    async def release(self, key: str) -> None:
+        """Drop a claim so the next claim() of key wins again."""
 
-        # Duration for firing alerts
-        if is_firing and alert.get("startsAt"):
-            duration = format_duration(alert["startsAt"])
-            lines.append(f"⏱️ Duration: {duration}")
+    @abstractmethod
+    async def hit(self, key: str, ttl: int) -> int:
+        """Increment a counter that expires ttl seconds after its first hit."""
 
-        if i < len(alerts) - 1:
-            lines.append("")
+    @abstractmethod
+    async def acquire_lease(self, name: str, owner: str, ttl: int) -> bool:
+        """Take the lease if free or expired, or renew it if owner holds it."""
 
-    if alert_count > 5:
-        lines.append(f"\n<i>... and {alert_count - 5} more alerts</i>")
+    async def close(self) -> None:
+        pass
 
-    return "\n".join(lines)
 
+def sort_alerts(items) -> Dict[str, dict]:
+    return dict(sorted(items, key=lambda item: item[1].get("received_at", "")))
 
-def create_alert_keyboard(alerts: List[dict], status: str) -> InlineKeyboardMarkup:
-    """Create interactive keyboard for alerts."""
-    if status != "firing" or not alerts:
-        return None
 
-    first_alert = alerts[0]
-    labels = first_alert.get("labels", {})
-    alertname = labels.get("alertname", "")
-    instance = labels.get("instance", "")
-    category = labels.get("category", "unknown")
-    alert_hash = get_alert_hash(first_alert)
+class MemoryStateStore(StateStore):
+    """Process-local state, for a single instance."""
 
-    keyboard = []
+    def __init__(self):
+        self.alerts: Dict[str, dict] = {}
+        self.acks: Dict[str, str] = {}
+        self.backups: Dict[str, dict] = {}
+        self.keys: Dict[str, tuple] = {}  # key -> (value, expires_at)
 
-    # Row 1: Acknowledge & Silence
-    row1 = [
-        InlineKeyboardButton("✅ ACK", callback_data=f"ack_{alert_hash}"),
-        InlineKeyboardButton("🔕 1h Silence", callback_data=f"silence_1h_{alert_hash}"),
-        InlineKeyboardButton("🔕 4h Silence", callback_data=f"silence_4h_{alert_hash}"),
-    ]
-    keyboard.append(row1)
+    def _live(self, key: str, now: float) -> Optional[tuple]:
+        entry = self.keys.get(key)
+        return entry if entry and entry[1] > now else None
 
-    # Row 2: Actions based on alert type
-    row2 = []
+    async def get_alert(self, alert_hash: str) -> Optional[dict]:
+        return self.alerts.get(alert_hash)
 
-    # Add restart button for container alerts
-    if "container" in alertname.lower() or labels.get("name"):
-        container_name = labels.get("name", instance.split(":")[0] if instance else "")
-        if container_name:
-            row2.append(InlineKeyboardButton("🔄 Restart", callback_data=f"restart_{container_name}"))
+    async def put_alert(self, alert_hash: str, info: dict) -> None:
+        self.alerts[alert_hash] = info
 
-    # Runbook link
-    row2.append(InlineKeyboardButton("📖 Runbook", url=get_runbook_url(alertname)))
+    async def list_alerts(self) -> Dict[str, dict]:
+        return sort_alerts(self.alerts.items())
 
-    # Grafana link
-    row2.append(InlineKeyboardButton("📊 Grafana", url=get_grafana_url(category)))
+    async def set_ack(self, alert_hash: str, at: datetime) -> None:
+        self.acks[alert_hash] = at.isoformat()
 
-    if row2:
-        keyboard.append(row2)
+    async def get_acks(self) -> Dict[str, str]:
+        return dict(self.acks)
 
-    return InlineKeyboardMarkup(keyboard)
+    async def clear_alerts(self) -> None:
+        self.alerts.clear()
+        self.acks.clear()
 
+    async def put_backup(self, target: str, info: dict) -> None:
+        self.backups[target] = info
 
-# ============================================
-# ALERTMANAGER WEBHOOK HANDLER
-# ============================================
+    async def get_backups(self) -> Dict[str, dict]:
+        return dict(self.backups)
 
-async def handle_alertmanager_webhook(request: web.Request) -> web.Response:
-    """Handle incoming webhooks from Alertmanager."""
-    try:
-        data = await request.json()
-        logger.info(f"Received webhook: {json.dumps(data, indent=2)[:500]}")
+    async def claim(self, key: str, ttl: int) -> bool:
+        now = datetime.now().timestamp()
+        if self._live(key, now):
+            return False
+        self.keys[key] = (1, now + ttl)
+        return True
+
+    async def release(self, key: str) -> None:
+        self.keys.pop(key, None)
 
-        status = data.get("status", "firing")
-        alerts = data.get("alerts", [])
+    async def hit(self, key: str, ttl: int) -> int:
+        now = datetime.now().timestamp()
+        count, expires_at = self._live(key, now) or (0, now + ttl)
+        self.keys[key] = (count + 1, expires_at)
+        if len(self.keys) > 1024:
+            self.keys = {k: v for k, v in self.keys.items() if v[1] > now}
+        return count + 1
 
-        if not alerts:
-            return web.Response(text="No alerts", status=200)
+    async def acquire_lease(self, name: str, owner: str, ttl: int) -> bool:
+        now = datetime.now().timestamp()
+        entry = self._live(name, now)
+        if entry and entry[0] != owner:
+            return False
+        self.keys[name] = (owner, now + ttl)
+        return True
 
-        # Skip DeadManSwitch
-        alerts = [a for a in alerts if a.get("labels", {}).get("alertname") != "DeadManSwitch"]
 
-        if not alerts:
-            return web.Response(text="Filtered", status=200)
+class SQLiteStateStore(StateStore):
+    """State in a SQLite file, shared by replicas on one host (WAL mode).
+
+    Calls run in a worker thread; the atomic primitives use BEGIN
+    IMMEDIATE so concurrent processes serialize on the write lock.
+    """
 
-        # Group alerts by severity
-        grouped = defaultdict(list)
-        for alert in alerts:
-            severity = alert.get("labels", {}).get("severity", "warning")
-            grouped[severity].append(alert)
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS alerts (hash TEXT PRIMARY KEY, info TEXT NOT NULL, received_at TEXT);
+        CREATE TABLE IF NOT EXISTS acks (hash TEXT PRIMARY KEY, at TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS backups (target TEXT PRIMARY KEY, info TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS keys (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL);
+    """
 
-        # Get the bot application from app state
-        bot = request.app.get("bot")
-        if not bot:
-            logger.error("Bot not available")
-            return web.Response(text="Bot not ready", status=503)
+    def __init__(self, path: str):
+        self.path = path
+        self.db: Optional[sqlite3.Connection] = None
+        self.lock = threading.Lock()
 
-        # Send message for each severity group
-        for severity, severity_alerts in grouped.items():
-            message = format_alert_message(severity_alerts, status)
-            keyboard = create_alert_keyboard(severity_alerts, status)
+    def _connect(self) -> sqlite3.Connection:
+        if self.db is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=STATE_TIMEOUT, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(self.SCHEMA)
+            self.db = db
+        return self.db
 
-            try:
-                await bot.send_message(
-                    chat_id=ALLOWED_CHAT_ID,
-                    text=message,
-                    parse_mode=ParseMode.HTML,
-                    reply_markup=keyboard,
-                    disable_web_page_preview=True,
-                )
+    def _run(self, fn, *args):
+        with self.lock:
+            return fn(self._connect(), *args)
+
+    async def call(self, fn, *args):
+        return await asyncio.to_thread(self._run, fn, *args)
+
+    @staticmethod
+    def _transaction(db: sqlite3.Connection, fn, *args):
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(db, *args)
+            db.execute("COMMIT")
+            return result
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    async def get_alert(self, alert_hash: str) -> Optional[dict]:
+        row = await self.call(lambda db: db.execute("SELECT info FROM alerts WHERE hash = ?", (alert_hash,)).fetchone())
+        return json.loads(row[0]) if row else None
+
+    async def put_alert(self, alert_hash: str, info: dict) -> None:
+        await self.call(lambda db: db.execute(
+            "INSERT OR REPLACE INTO alerts (hash, info, received_at) VALUES (?, ?, ?)",
+            (alert_hash, json.dumps(info), info.get("received_at", "")),
+        ))
+
+    async def list_alerts(self) -> Dict[str, dict]:
+        rows = await self.call(lambda db: db.execute("SELECT hash, info FROM alerts ORDER BY received_at").fetchall())
+        return {alert_hash: json.loads(info) for alert_hash, info in rows}
+
+    async def set_ack(self, alert_hash: str, at: datetime) -> None:
+        await self.call(lambda db: db.execute(
+            "INSERT OR REPLACE INTO acks (hash, at) VALUES (?, ?)", (alert_hash, at.isoformat())
+        ))
+
+    async def get_acks(self) -> Dict[str, str]:
+        return dict(await self.call(lambda db: db.execute("SELECT hash, at FROM acks").fetchall()))
+
+    async def clear_alerts(self) -> None:
+        await self.call(lambda db: db.executescript("DELETE FROM alerts; DELETE FROM acks;"))
+
+    async def put_backup(self, target: str, info: dict) -> None:
+        await self.call(lambda db: db.execute(
+            "INSERT OR REPLACE INTO backups (target, info) VALUES (?, ?)", (target, json.dumps(info))
+        ))
+
+    async def get_backups(self) -> Dict[str, dict]:
+        rows = await self.call(lambda db: db.execute("SELECT target, info FROM backups").fetchall())
+        return {target: json.loads(info) for target, info in rows}
+
+    async def claim(self, key: str, ttl: int) -> bool:
+        def claim(db, now):
+            db.execute("DELETE FROM keys WHERE key = ? AND expires_at <= ?", (key, now))
+            return db.execute(
+                "INSERT OR IGNORE INTO keys (key, value, expires_at) VALUES (?, '1', ?)", (key, now + ttl)
+            ).rowcount == 1
+        return await self.call(self._transaction, claim, datetime.now().timestamp())
+
+    async def release(self, key: str) -> None:
+        await self.call(lambda db: db.execute("DELETE FROM keys WHERE key = ?", (key,)))
+
+    async def hit(self, key: str, ttl: int) -> int:
+        def hit(db, now):
+            db.execute("DELETE FROM keys WHERE expires_at <= ?", (now,))
+            row = db.execute("SELECT value FROM keys WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                db.execute("INSERT INTO keys (key, value, expires_at) VALUES (?, '1', ?)", (key, now + ttl))
+                return 1
+            db.execute("UPDATE keys SET value = ? WHERE key = ?", (str(int(row[0]) + 1), key))
+            return int(row[0]) + 1
+        return await self.call(self._transaction, hit, datetime.now().timestamp())
+
+    async def acquire_lease(self, name: str, owner: str, ttl: int) -> bool:
+        def acquire(db, now):
+            row = db.execute("SELECT value, expires_at FROM keys WHERE key = ?", (name,)).fetchone()
+            if row and row[0] != owner and row[1] > now:
+                return False
+            db.execute("INSERT OR REPLACE INTO keys (key, value, expires_at) VALUES (?, ?, ?)", (name, owner, now + ttl))
+            return True
+        return await self.call(self._transaction, acquire, datetime.now().timestamp())
+
+    async def close(self) -> None:
+        if self.db is not None:
+            await asyncio.to_thread(self.db.close)
+            self.db = None
+
+
+class RedisStateStore(StateStore):
+    """State on any Redis-protocol server (Redis, Valkey, KeyDB, Dragonfly).
+
+    Speaks RESP directly over one asyncio connection, so no client
+    library is needed; commands are serialized and the connection is
+    re-opened once on failure.
+    """
+
+    LEASE_SCRIPT = (
+        "local v = redis.call('GET', KEYS[1]) "
+        "if v == false or v == ARGV[1] then redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2]) return 1 end "
+        "return 0"
+    )
+    HIT_SCRIPT = (
+        "local n = redis.call('INCR', KEYS[1]) "
+        "if n == 1 then redis.call('PEXPIRE', KEYS[1], ARGV[1]) end "
+        "return n"
+    )
 
-                # Store alert in history
-                for alert in severity_alerts:
-                    alert_hash = get_alert_hash(alert)
-                    alert_history[alert_hash] = {
-                        "alert": alert,
-                        "status": status,
-                        "received_at": datetime.now(TIMEZONE).isoformat(),
-                    }
+    def __init__(self, url: str, prefix: str = "vpsbot:"):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.username = parsed.username
+        self.db = (parsed.path or "/0").lstrip("/") or "0"
+        self.prefix = prefix
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.lock = asyncio.Lock()
+
+    @staticmethod
+    def encode(args: tuple) -> bytes:
+        out = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(out)
+
+    async def read_reply(self):
+        line = await self.reader.readuntil(b"\r\n")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise RuntimeError(f"Redis: {payload.decode()}")
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            size = int(payload)
+            if size < 0:
+                return None
+            return (await self.reader.readexactly(size + 2))[:-2].decode()
+        if kind == b"*":
+            size = int(payload)
+            return None if size < 0 else [await self.read_reply() for _ in range(size)]
+        raise RuntimeError(f"Unexpected Redis reply: {line[:40]!r}")
+
+    async def _send(self, *args):
+        self.writer.write(self.encode(args))
+        await self.writer.drain()
+        return await self.read_reply()
+
+    async def _connect(self) -> None:
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            if self.password:
+                await self._send("AUTH", *([self.username] if self.username else []), self.password)
+            if self.db != "0":
+                await self._send("SELECT", self.db)
+        except BaseException:
+            # Never reuse a connection that is not authenticated and on the right db
+            self._reset()
+            raise
+
+    def _reset(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def command(self, *args):
+        async with self.lock:
+            for attempt in range(2):
+                try:
+                    if self.writer is None:
+                        await asyncio.wait_for(self._connect(), STATE_TIMEOUT)
+                    return await asyncio.wait_for(self._send(*args), STATE_TIMEOUT)
+                except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                    self._reset()
+                    if attempt:
+                        raise
 
-            except Exception as e:
-                logger.error(f"Failed to send message: {e}")
+    async def get_alert(self, alert_hash: str) -> Optional[dict]:
+        info = await self.command("HGET", f"{self.prefix}alerts", alert_hash)
+        return json.loads(info) if info else None
 
-        return web.Response(text="OK", status=200)
+    async def put_alert(self, alert_hash: str, info: dict) -> None:
+        await self.command("HSET", f"{self.prefix}alerts", alert_hash, json.dumps(info))
 
-    except Exception as e:
-        logger.error(f"Webhook error: {e}")
-        return web.Response(text=str(e), status=500)
+    async def list_alerts(self) -> Dict[str, dict]:
+        flat = await self.command("HGETALL", f"{self.prefix}alerts") or []
+        return sort_alerts((flat[i], json.loads(flat[i + 1])) for i in range(0, len(flat), 2))
 
+    async def set_ack(self, alert_hash: str, at: datetime) -> None:
+        await self.command("HSET", f"{self.prefix}acks", alert_hash, at.isoformat())
 
-# ============================================
-# TELEGRAM COMMAND HANDLERS
-# ============================================
+    async def get_acks(self) -> Dict[str, str]:
+        flat = await self.command("HGETALL", f"{self.prefix}acks") or []
+        return {flat[i]: flat[i + 1] for i in range(0, len(flat), 2)}
 
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Send welcome message."""
-    if not is_authorized(update.effective_chat.id):
-        await update.message.reply_text("⛔ Unauthorized access!")
-        return
+    async def clear_alerts(self) -> None:
+        await self.command("DEL", f"{self.prefix}alerts", f"{self.prefix}acks")
 
-    welcome = """
-🖥️ <b>VPS Management Bot v3.0</b>
+    async def put_backup(self, target: str, info: dict) -> None:
+        await self.command("HSET", f"{self.prefix}backups", target, json.dumps(info))
 
-Professional monitoring and alert management.
+    async def get_backups(self) -> Dict[str, dict]:
+        flat = await self.command("HGETALL", f"{self.prefix}backups") or []
+        return {flat[i]: json.loads(flat[i + 1]) for i in range(0, len(flat), 2)}
 
-📊 <b>Status:</b> /status
-🐳 <b>Docker:</b> /docker
-📁 <b>Projects:</b> /projects
-🔔 <b>Alerts:</b> /alerts
-📋 <b>Commands:</b> /help
+    async def claim(self, key: str, ttl: int) -> bool:
+        return await self.command("SET", f"{self.prefix}{key}", "1", "NX", "PX", ttl * 1000) == "OK"
 
-<i>Enterprise Edition - 2026</i>
-"""
-    await update.message.reply_text(welcome, parse_mode=ParseMode.HTML)
+    async def release(self, key: str) -> None:
+        await self.command("DEL", f"{self.prefix}{key}")
 
+    async def hit(self, key: str, ttl: int) -> int:
+        return await self.command("EVAL", self.HIT_SCRIPT, 1, f"{self.prefix}{key}", ttl * 1000)
 
-async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Show available commands organized by category."""
-    if not is_authorized(update.effective_chat.id):
-        await update.message.reply_text("⛔ Unauthorized access!")
-        return
+    async def acquire_lease(self, name: str, owner: str, ttl: int) -> bool:
+        return await self.command("EVAL", self.LEASE_SCRIPT, 1, f"{self.prefix}{name}", owner, ttl * 1000) == 1
 
-    commands = """
-📋 <b>VPS Bot v3.0 - Commands</b>
+    async def close(self) -> None:
+        async with self.lock:
+            self._reset()
 
-<b>🌐 Basic</b>
-/start - Start bot
-/help - This menu
-/settings - Settings
 
-<b>📊 System Monitor</b>
-/status - System overview
-/cpu - CPU details
-/memory - Memory usage
-/disk - Disk space
-/health - Health check
+def create_state_store(url: str) -> StateStore:
+    """State backend for STATE_URL."""
+    scheme = url.split("://", 1)[0].lower()
+    if scheme == "memory":
+        return MemoryStateStore()
+    if scheme == "sqlite":
+        return SQLiteStateStore(url.split("://", 1)[1])
+    if scheme in ("redis", "valkey"):
+        return RedisStateStore(url)
+    raise ValueError(f"Unsupported STATE_URL scheme: {scheme}")
 
-<b>🐳 Docker Management</b>
-/docker - All containers
-/projects - Project list
-/project [name] - Project details
-/up [container] - Start
-/down [container] - Stop
-/restart [container] - Restart
-/logs [container] - Recent logs
 
-<b>🚨 ChatOps & Incident</b>
-/alerts - Active alerts
-/ack [hash] - Acknowledge alert
-/silence [alert] [duration] - Silence
-/snooze [duration] - Snooze all
-/resolve [hash] - Mark resolved
-/escalate [hash] - Escalate
+state = create_state_store(STATE_URL)
 
-<b>📈 Grafana & Render</b>
-/grafana - Dashboards
-/render [dashboard] - Render panel
-/history - Alert history
 
-<b>🔧 Operations</b>
-/ssl - SSL status
-/oncall - On-call info
-/maintenance [on/off] [site] - Maintenance mode
-
-<i>Enterprise ChatOps Standards 2026</i>
-"""
-    keyboard = [
-        [
-            InlineKeyboardButton("📊 Status", callback_data="show_status"),
-            InlineKeyboardButton("🐳 Docker", callback_data="show_docker"),
-        ],
-        [
-            InlineKeyboardButton("🔔 Alerts", callback_data="show_alerts"),
-            InlineKeyboardButton("📈 Grafana", url=GRAFANA_URL),
-        ],
-    ]
-
-    await update.message.reply_text(
-        commands,
-        parse_mode=ParseMode.HTML,
-        reply_markup=InlineKeyboardMarkup(keyboard)
-    )
+async def renew_leadership(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Take or renew the leader lease.
 
+    Only the leader polls Telegram and runs the scheduled reports; the
+    others stay on standby and take over when the lease expires. Alert
+    notifications don't depend on the lease (see process_alerts). A leader that
+    cannot reach the store steps down once its lease would have expired.
+    """
+    global is_leader, leader_renewed_at
+    try:
+        leader = await state.acquire_lease("leader", INSTANCE_ID, LEADER_LEASE_TTL)
+        if leader:
+            leader_renewed_at = monotonic()
+    except Exception as e:
+        logger.error(f"Leader lease renewal failed: {e!r}")
+        leader = is_leader and leader_renewed_at is not None and monotonic() - leader_renewed_at < LEADER_LEASE_TTL
 
-async def status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Show system status with visual indicators."""
-    if not is_authorized(update.effective_chat.id):
-        await update.message.reply_text("⛔ Unauthorized access!")
+    if leader == is_leader:
         return
 
-    # System info
-    cpu_percent = psutil.cpu_percent(interval=1)
-    memory = psutil.virtual_memory()
-    disk = psutil.disk_usage("/")
-    boot_time = psutil.boot_time()
-    uptime = datetime.now().timestamp() - boot_time
-    load1, load5, load15 = psutil.getloadavg()
+    is_leader = leader
+    updater = context.application.updater
+    if leader:
+        logger.info(f"Instance {INSTANCE_ID} is now the leader")
+        await updater.start_polling(allowed_updates=Update.ALL_TYPES)
+    else:
+        logger.warning(f"Instance {INSTANCE_ID} lost leadership, standing by")
+        if updater.running:
+            await updater.stop()
 
-    # Container counts
-    containers = docker_client.containers.list(all=True)
-    running = sum(1 for c in containers if c.status == "running")
-    total = len(containers)
 
-    # Visual bars
-    def make_bar(percent, width=10):
-        filled = int(percent / 100 * width)
-        return "█" * filled + "░" * (width - filled)
+async def wait_for_send_slot(chat_id: int) -> None:
+    """Block until the shared per-chat rate limit allows another message."""
+    while True:
+        now = datetime.now().timestamp()
+        if await state.hit(f"rate:{chat_id}:{int(now // 60)}", 60) <= NOTIFY_RATE_LIMIT:
+            return
+        await asyncio.sleep(60 - now % 60)
 
-    def get_status_emoji(percent, warn=70, crit=90):
-        if percent >= crit:
-            return "🔴"
-        elif percent >= warn:
-            return "🟡"
-        return "🟢"
 
-    status_text = f"""
-📊 <b>System Status</b>
-<code>━━━━━━━━━━━━━━━━━━━━━</code>
+def get_notification_key(alerts: List[dict], status: str) -> str:
+    """Dedup key for one notification: status plus each alert's identity and start."""
+    parts = sorted(f"{get_alert_hash(a)}@{a.get('startsAt', '')}" for a in alerts)
+    return "notified:" + hashlib.sha1(f"{status}|{'|'.join(parts)}".encode()).hexdigest()
 
-🖥️ <b>Server</b>
-├ Uptime: {format_uptime(uptime)}
-├ Load: {load1:.2f} / {load5:.2f} / {load15:.2f}
-└ Time: {datetime.now(TIMEZONE).strftime("%d.%m.%Y %H:%M")}
 
-💻 <b>CPU</b> {get_status_emoji(cpu_percent)}
-└ [{make_bar(cpu_percent)}] {cpu_percent:.1f}%
+# ============================================
+# NOTIFICATION SPOOL
+# ============================================
 
-💾 <b>Memory</b> {get_status_emoji(memory.percent)}
-├ [{make_bar(memory.percent)}] {memory.percent:.1f}%
-├ Used: {format_bytes(memory.used)}
-└ Total: {format_bytes(memory.total)}
+class NotificationSpool:
+    """Append-only on-disk log of outbound Telegram messages.
+
+    Records are JSON lines in numbered segment files: "add" when a message
+    is queued and "ack" once Telegram accepted it. enqueue() returns after
+    the record is fsynced, and concurrent appends share one fsync. Each
+    chat has its own sender, so chats are served concurrently while every
+    chat gets its messages strictly in order, retried with backoff while
+    Telegram is unreachable. Segments whose messages are all acked are
+    deleted.
+    """
+
+    def __init__(self, directory: str, segment_size: int = SPOOL_SEGMENT_SIZE):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.pending: OrderedDict = OrderedDict()  # id -> add record
+        self.queues: Dict[int, OrderedDict] = defaultdict(OrderedDict)  # chat id -> its pending records
+        self.workers: Dict[int, asyncio.Task] = {}
+        self.segment_of: Dict[int, int] = {}
+        self.unacked: Dict[int, int] = defaultdict(int)  # segment -> unacked messages
+        self.segment = 0
+        self.file = None
+        self.next_id = 1
+        self.waiters: List[asyncio.Future] = []
+        self.dirty = False
+        self.flush_needed = asyncio.Event()
+        self.flush_lock = asyncio.Lock()
+        self.wakeup = asyncio.Event()
+        self.sent_total = 0
+        self.dropped_total = 0
+        self.failures_total = 0
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{segment:08d}.log")
+
+    def _track(self, record: dict, segment: int) -> None:
+        if record["op"] == "add":
+            self.pending[record["id"]] = record
+            self.queues[record["chat_id"]][record["id"]] = record
+            self.segment_of[record["id"]] = segment
+            self.unacked[segment] += 1
+            self.next_id = max(self.next_id, record["id"] + 1)
+        elif record["id"] in self.pending:
+            added = self.pending.pop(record["id"])
+            self.queues[added["chat_id"]].pop(record["id"], None)
+            self.unacked[self.segment_of.pop(record["id"])] -= 1
+
+    def load(self) -> int:
+        """Replay segments from disk and open a fresh segment; returns pending count."""
+        os.makedirs(self.directory, exist_ok=True)
+        segments = sorted(int(name[:-4]) for name in os.listdir(self.directory) if name.endswith(".log"))
+        for segment in segments:
+            self.unacked[segment] += 0  # acks-only segments are compacted too
+            with open(self._path(segment), encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._track(json.loads(line), segment)
+                    except (ValueError, KeyError):
+                        continue  # torn write at the tail of a crashed segment
+
+        # Never append after a possibly torn line
+        self._open_segment((segments[-1] if segments else 0) + 1)
+        self._compact()
+        return len(self.pending)
+
+    def _open_segment(self, segment: int) -> None:
+        self.segment = segment
+        self.unacked[segment] += 0
+        self.file = open(self._path(segment), "a", encoding="utf-8")
+
+    def _compact(self) -> None:
+        # Only a fully acked prefix can go: later segments may hold acks for
+        # messages in earlier ones, which must not be replayed again
+        for segment in sorted(self.unacked):
+            if segment == self.segment or self.unacked[segment]:
+                return
+            try:
+                os.remove(self._path(segment))
+            except FileNotFoundError:
+                pass
+            del self.unacked[segment]
+
+    def _append(self, record: dict) -> None:
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._track(record, self.segment)
+        self.dirty = True
+        self.flush_needed.set()
+
+    async def flush(self) -> None:
+        """fsync everything appended so far, wake its waiters and rotate if due."""
+        async with self.flush_lock:
+            if not self.dirty:
+                return
+            waiters, self.waiters = self.waiters, []
+            self.dirty = False
+            try:
+                self.file.flush()
+                await asyncio.to_thread(os.fsync, self.file.fileno())
+            except OSError as e:
+                logger.error(f"Spool write failed: {e}")
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+                return
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+
+            if self.file.tell() >= self.segment_size and not self.dirty:
+                self.file.close()
+                self._open_segment(self.segment + 1)
+                self._compact()
+
+    async def run_flusher(self) -> None:
+        """Group commit: one fsync per SPOOL_FSYNC_INTERVAL batch."""
+        while True:
+            await self.flush_needed.wait()
+            self.flush_needed.clear()
+            await asyncio.sleep(SPOOL_FSYNC_INTERVAL)
+            await self.flush()
+
+    async def enqueue(self, chat_id: int, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None,
+                      panel_category: Optional[str] = None, **options) -> int:
+        """Durably queue a message; returns once it is on disk."""
+        record = {
+            "op": "add",
+            "id": self.next_id,
+            "chat_id": chat_id,
+            "text": text,
+            "reply_markup": reply_markup.to_dict() if reply_markup else None,
+            "panel_category": panel_category,
+            "options": options,
+            "created_at": datetime.now().timestamp(),
+        }
+        self._append(record)
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        await waiter
+        self.wakeup.set()
+        return record["id"]
+
+    def ack(self, message_id: int) -> None:
+        self._append({"op": "ack", "id": message_id})
+        self._compact()
+
+    async def deliver(self, bot, record: dict) -> None:
+        markup = record.get("reply_markup")
+        sent = await bot.send_message(
+            chat_id=record["chat_id"],
+            text=record["text"],
+            reply_markup=InlineKeyboardMarkup.de_json(markup, bot) if markup else None,
+            **record.get("options", {}),
+        )
+        if record.get("panel_category"):
+            spawn(send_alert_panel(bot, record["chat_id"], record["panel_category"], sent.message_id))
 
-💿 <b>Disk</b> {get_status_emoji(disk.percent)}
-├ [{make_bar(disk.percent)}] {disk.percent:.1f}%
-├ Used: {format_bytes(disk.used)}
-└ Free: {format_bytes(disk.free)}
+    async def run_sender(self, bot) -> None:
+        """Start a sender for every chat with pending messages."""
+        while True:
+            self.wakeup.clear()
+            for chat_id, queue in self.queues.items():
+                if queue and chat_id not in self.workers:
+                    self.workers[chat_id] = spawn(self._send_chat(bot, chat_id))
+            await self.wakeup.wait()
+
+    async def _send_chat(self, bot, chat_id: int) -> None:
+        """Deliver one chat's messages in order, backing off while Telegram is down."""
+        queue = self.queues[chat_id]
+        backoff = 1
+        while queue:
+            message_id, record = next(iter(queue.items()))
+            try:
+                await wait_for_send_slot(chat_id)
+                await self.deliver(bot, record)
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                await asyncio.sleep(retry_after.total_seconds() if isinstance(retry_after, timedelta) else retry_after)
+                continue
+            except (BadRequest, Forbidden) as e:
+                # Retrying cannot fix these; drop instead of blocking the queue
+                logger.error(f"Dropping spooled message {message_id} for {chat_id}: {e}")
+                self.dropped_total += 1
+            except Exception as e:
+                self.failures_total += 1
+                if backoff == 1:
+                    logger.warning(f"Telegram unreachable, {len(queue)} message(s) spooled for {chat_id}: {e!r}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, SPOOL_MAX_BACKOFF)
+                continue
+            else:
+                self.sent_total += 1
+                if backoff > 1:
+                    logger.info(f"Telegram reachable again, replaying {len(queue) - 1} message(s) for {chat_id}")
+                backoff = 1
+            self.ack(message_id)
+        del self.workers[chat_id]
+
+    def oldest_age(self) -> float:
+        if not self.pending:
+            return 0.0
+        return datetime.now().timestamp() - next(iter(self.pending.values()))["created_at"]
+
+    async def close(self, timeout: float) -> None:
+        """Give the sender up to timeout seconds to drain, then fsync and close."""
+        deadline = monotonic() + timeout
+        while self.pending and monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self.pending:
+            logger.warning(f"{len(self.pending)} message(s) left in the spool for the next start")
+        await self.flush()
+        self.file.close()
+
+
+spool = NotificationSpool(SPOOL_DIR)
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    """Prometheus metrics for the spool and leader state."""
+    metrics = [
+        ("telegram_bot_spool_depth", "gauge", "Outbound messages waiting in the spool", len(spool.pending)),
+        ("telegram_bot_spool_oldest_age_seconds", "gauge", "Age of the oldest spooled message", spool.oldest_age()),
+        ("telegram_bot_spool_segments", "gauge", "Spool segment files on disk", len(spool.unacked)),
+        ("telegram_bot_spool_sent_total", "counter", "Spooled messages delivered", spool.sent_total),
+        ("telegram_bot_spool_dropped_total", "counter", "Spooled messages rejected by Telegram", spool.dropped_total),
+        ("telegram_bot_spool_send_failures_total", "counter", "Failed delivery attempts", spool.failures_total),
+        ("telegram_bot_leader", "gauge", "1 if this replica is the leader", int(is_leader)),
+    ]
+    lines = []
+    for name, kind, help_text, value in metrics:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"]
+    return web.Response(text="\n".join(lines) + "\n", content_type="text/plain")
 
-🐳 <b>Docker</b>
-└ {running}/{total} containers running
-"""
 
-    # Add keyboard for quick actions
-    keyboard = [
-        [
-            InlineKeyboardButton("🔄 Refresh", callback_data="refresh_status"),
-            InlineKeyboardButton("📊 Grafana", url=f"{GRAFANA_URL}/d/vps-overview"),
-        ],
-        [
-            InlineKeyboardButton("🔔 Alerts", callback_data="show_alerts"),
-            InlineKeyboardButton("🐳 Docker", callback_data="show_docker"),
-        ],
-    ]
+# ============================================
+# PROJECT INDEX (compose labels + Docker events)
+# ============================================
 
-    await update.message.reply_text(
-        status_text,
-        parse_mode=ParseMode.HTML,
-        reply_markup=InlineKeyboardMarkup(keyboard)
-    )
+COMPOSE_PROJECT_LABEL = "com.docker.compose.project"
+COMPOSE_SERVICE_LABEL = "com.docker.compose.service"
+
+# Docker event action -> container status
+EVENT_STATUS = {
+    "create": "created",
+    "start": "running",
+    "restart": "running",
+    "unpause": "running",
+    "pause": "paused",
+    "die": "exited",
+    "stop": "exited",
+}
 
+# kill signals that end a container on purpose (docker stop/kill, compose down)
+STOP_SIGNALS = {"2", "9", "15", "SIGINT", "SIGKILL", "SIGTERM"}
+
+
+def ensure_project(project_id: str) -> dict:
+    """Get or create a project entry, applying configured overrides."""
+    if project_id not in project_index:
+        override = config["projects"].get(project_id, {})
+        project_index[project_id] = {
+            "name": override.get("name", project_id),
+            "url": override.get("url"),
+            "containers": set(override.get("containers", [])),
+        }
+    return project_index[project_id]
+
+
+def index_container(name: str, container_id: str, status: str, labels: dict) -> None:
+    """Add or update a container in the index."""
+    compose_project = labels.get(COMPOSE_PROJECT_LABEL)
+    project_id = config["container_projects"].get(name) or compose_project
+
+    previous = container_index.get(name)
+    if previous and previous["project"] and previous["project"] != project_id:
+        unindex_container(name)
+
+    container_index[name] = {
+        "id": container_id,
+        "status": status,
+        "project": project_id,
+        "compose_project": compose_project,
+        "service": labels.get(COMPOSE_SERVICE_LABEL),
+    }
+    if project_id:
+        ensure_project(project_id)["containers"].add(name)
+
+
+def unindex_container(name: str) -> None:
+    """Remove a container, dropping discovered projects that become empty."""
+    entry = container_index.pop(name, None)
+    if not entry or not entry["project"]:
+        return
 
-async def docker_list(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """List all Docker containers grouped by project."""
-    if not is_authorized(update.effective_chat.id):
-        await update.message.reply_text("⛔ Unauthorized access!")
+    project_id = entry["project"]
+    project = project_index.get(project_id)
+    if not project:
         return
 
-    containers = docker_client.containers.list(all=True)
-    container_map = {c.name: c for c in containers}
+    pinned = config["projects"].get(project_id, {}).get("containers", [])
+    if name not in pinned:
+        project["containers"].discard(name)
+    if not project["containers"] and project_id not in config["projects"]:
+        del project_index[project_id]
 
-    running = sum(1 for c in containers if c.status == "running")
-    total = len(containers)
 
-    lines = [f"🐳 <b>Docker Containers</b> ({running}/{total})", ""]
+def load_container_states() -> List[tuple]:
+    """Read (name, id, status, labels) for all containers (blocking)."""
+    return [
+        (c.name, c.id, c.status, c.labels or {})
+        for c in docker_client.containers.list(all=True)
+    ]
 
-    # Group by project
-    for project_id, project_info in PROJECT_GROUPS.items():
-        project_containers = project_info["containers"]
-        statuses = [get_container_status(c) for c in project_containers]
-        running_count = statuses.count("🟢")
-        total_count = len(project_containers)
 
-        # Project status indicator
-        if running_count == total_count:
-            project_status = "🟢"
-        elif running_count == 0:
-            project_status = "🔴"
-        else:
-            project_status = "🟡"
+def apply_container_states(states: List[tuple]) -> None:
+    """Replace the index with a full container listing."""
+    global project_index_ready
 
-        lines.append(f"{project_status} <b>{project_info['name']}</b> ({running_count}/{total_count})")
+    container_index.clear()
+    project_index.clear()
+    for project_id in config["projects"]:
+        ensure_project(project_id)
+    for name, container_id, status, labels in states:
+        index_container(name, container_id, status, labels)
+    project_index_ready = True
 
-        # Show individual containers
-        for container_name in project_containers:
-            status = get_container_status(container_name)
-            lines.append(f"   {status} {container_name}")
 
-        lines.append("")
+def reindex_projects() -> None:
+    """Re-derive project membership after the project config changed."""
+    states = [
+        (name, entry["id"], entry["status"], {
+            COMPOSE_PROJECT_LABEL: entry["compose_project"],
+            COMPOSE_SERVICE_LABEL: entry["service"],
+        })
+        for name, entry in container_index.items()
+    ]
+    apply_container_states(states)
 
-    # Check for untracked containers
-    tracked = set()
-    for project_info in PROJECT_GROUPS.values():
-        tracked.update(project_info["containers"])
 
-    untracked = [c.name for c in containers if c.name not in tracked]
-    if untracked:
-        lines.append("❓ <b>Untracked</b>")
-        for name in untracked[:10]:  # Limit to 10
-            status = container_map[name].status
-            emoji = STATUS_EMOJI.get(status, "❓")
-            lines.append(f"   {emoji} {name}")
-        if len(untracked) > 10:
-            lines.append(f"   <i>... and {len(untracked) - 10} more</i>")
+def apply_container_event(event: dict) -> None:
+    """Update the index from a single Docker container event."""
+    action = event.get("Action", "").split(":")[0]
+    actor = event.get("Actor", {})
+    attributes = actor.get("Attributes", {})
+    name = attributes.get("name")
+    if not name:
+        return
 
-    message = "\n".join(lines)
+    if action == "destroy":
+        unindex_container(name)
+        container_exits.pop(name, None)
+        return
 
-    # Split if too long
-    if len(message) > 4000:
-        message = message[:4000] + "\n\n<i>... truncated</i>"
+    if action == "rename":
+        old_name = attributes.get("oldName", "").lstrip("/")
+        previous = container_index.get(old_name, {})
+        unindex_container(old_name)
+        index_container(name, actor.get("ID", ""), previous.get("status", "created"), attributes)
+        return
 
-    await update.message.reply_text(message, parse_mode=ParseMode.HTML)
+    previous = container_index.get(name, {})
+    status = EVENT_STATUS.get(action, previous.get("status", "created"))
+    # Restarts are Docker's restart action (docker restart, /restart) and a start
+    # right after a die nobody asked for (restart policy after a crash or OOM).
+    # A stop or kill ahead of the die marks it as wanted, so /down → /up and
+    # compose stop/start are not counted.
+    if action == "stop" or action == "kill" and attributes.get("signal", "").upper() in STOP_SIGNALS:
+        container_exits[name] = "stopped"
+    elif action == "die":
+        container_exits.setdefault(name, "crashed")
+    if action == "restart" or action == "start" and container_exits.pop(name, None) == "crashed":
+        host_rollups.count(f"restart:{name}", event.get("time") or datetime.now().timestamp())
+    # Event attributes carry the container labels alongside name/image
+    index_container(name, actor.get("ID", ""), status, attributes)
+
+
+def watch_docker_events(loop: asyncio.AbstractEventLoop, since: int) -> None:
+    """Follow Docker events forever and feed them to the index (thread target).
+
+    Events are replayed from `since`, so nothing between the initial
+    listing and the subscription is lost. After a disconnect the index
+    is rebuilt from a fresh listing before following again.
+    """
+    while True:
+        try:
+            events = docker_client.events(decode=True, since=since, filters={"type": "container"})
+            for event in events:
+                since = event.get("time", since)
+                loop.call_soon_threadsafe(apply_container_event, event)
+        except Exception as e:
+            logger.warning(f"Docker event stream lost: {e}")
 
+        threading.Event().wait(5)
+        try:
+            since = int(datetime.now().timestamp())
+            states = load_container_states()
+            loop.call_soon_threadsafe(apply_container_states, states)
+        except Exception as e:
+            logger.warning(f"Project index rebuild failed: {e}")
 
-async def alerts_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Show active Prometheus alerts."""
-    if not is_authorized(update.effective_chat.id):
-        await update.message.reply_text("⛔ Unauthorized access!")
-        return
 
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{PROMETHEUS_URL}/api/v1/alerts") as resp:
-                if resp.status != 200:
-                    await update.message.reply_text("❌ Cannot connect to Prometheus")
-                    return
+def get_projects() -> Dict[str, dict]:
+    """Projects with name, url and sorted container names, from the index."""
+    return {
+        project_id: {
+            "name": project["name"],
+            "url": project["url"],
+            "containers": sorted(project["containers"]),
+        }
+        for project_id, project in project_index.items()
+    }
 
-                data = await resp.json()
-                alerts = data.get("data", {}).get("alerts", [])
 
-        # Filter out DeadManSwitch
-        alerts = [a for a in alerts if a.get("labels", {}).get("alertname") != "DeadManSwitch"]
+# ============================================
+# FLEET MODE
+# ============================================
 
-        if not alerts:
-            await update.message.reply_text(
-                "✅ <b>No Active Alerts</b>\n\nAll systems are running normally.",
-                parse_mode=ParseMode.HTML
-            )
-            return
+class CpuMeter:
+    """CPU busy percent between consecutive read() calls.
 
-        # Group by state
-        firing = [a for a in alerts if a.get("state") == "firing"]
-        pending = [a for a in alerts if a.get("state") == "pending"]
+    psutil.cpu_percent(interval=None) keeps one previous sample per thread,
+    so consumers on the event loop would shorten each other's window. Each
+    consumer owns a meter with its own cpu_times() pair instead.
+    """
 
-        lines = [f"🔔 <b>Active Alerts</b> ({len(alerts)})", ""]
+    def __init__(self):
+        self.last = None
 
-        if firing:
-            lines.append(f"<b>🔥 Firing ({len(firing)})</b>")
-            for alert in firing[:10]:
-                labels = alert.get("labels", {})
-                name = labels.get("alertname", "Unknown")
-                severity = labels.get("severity", "unknown")
-                sev_emoji = SEVERITY_CONFIG.get(severity, {}).get("emoji", "❓")
+    def read(self) -> Optional[float]:
+        """Percent since the previous read, None on the first."""
+        times = psutil.cpu_times()
+        previous, self.last = self.last, times
+        if previous is None:
+            return None
+        total = sum(times) - sum(previous)
+        idle = (times.idle + getattr(times, "iowait", 0)) - (previous.idle + getattr(previous, "iowait", 0))
+        return max(0.0, min(100.0, (total - idle) / total * 100)) if total > 0 else 0.0
 
-                instance = labels.get("instance", "")
-                if instance:
-                    lines.append(f"  {sev_emoji} {name}")
-                    lines.append(f"      └ {instance}")
-                else:
-                    lines.append(f"  {sev_emoji} {name}")
 
-            if len(firing) > 10:
-                lines.append(f"  <i>... and {len(firing) - 10} more</i>")
+# The agent's snapshot endpoint, the hub's own fleet entry and the host sampler
+agent_cpu = CpuMeter()
+fleet_cpu = CpuMeter()
+host_cpu = CpuMeter()
 
-        if pending:
-            lines.append(f"\n<b>⏳ Pending ({len(pending)})</b>")
-            for alert in pending[:5]:
-                name = alert.get("labels", {}).get("alertname", "Unknown")
-                lines.append(f"  • {name}")
 
-        keyboard = [
-            [
-                InlineKeyboardButton("📊 Grafana Alerts", url=f"{GRAFANA_URL}/d/alerts-overview"),
-                InlineKeyboardButton("🔄 Refresh", callback_data="refresh_alerts"),
-            ],
+def collect_local_snapshot(cpu_percent: float) -> dict:
+    """Metrics and container state of this node, as served to the hub."""
+    memory = psutil.virtual_memory()
+    disk = psutil.disk_usage("/")
+    return {
+        "node": NODE_NAME,
+        "timestamp": datetime.now(TIMEZONE).isoformat(),
+        "cpu": cpu_percent,
+        "memory": {"percent": memory.percent, "used": memory.used, "total": memory.total},
+        "disk": {"percent": disk.percent, "used": disk.used, "free": disk.free},
+        "load": list(psutil.getloadavg()),
+        "uptime": datetime.now().timestamp() - psutil.boot_time(),
+        "containers": {
+            name: {"status": entry["status"], "project": entry["project"]}
+            for name, entry in container_index.items()
+        },
+        "projects": {
+            project_id: {"name": info["name"], "containers": info["containers"]}
+            for project_id, info in get_projects().items()
+        },
+    }
+
+
+async def agent_snapshot_handler(request: web.Request) -> web.Response:
+    """Serve this node's snapshot to the fleet hub."""
+    token = request.headers.get("Authorization", "")
+    if FLEET_TOKEN and not hmac.compare_digest(token, f"Bearer {FLEET_TOKEN}"):
+        return web.json_response({"error": "unauthorized"}, status=401)
+
+    # Non-blocking: CPU usage since the previous poll
+    return web.json_response(collect_local_snapshot(agent_cpu.read() or 0.0))
+
+
+async def fetch_agent_snapshot(name: str, url: str) -> None:
+    """Poll one agent and cache its snapshot, keeping the last good one on error."""
+    node = fleet_nodes.setdefault(name, {"url": url, "snapshot": None, "updated_at": None, "error": None})
+    headers = {"Authorization": f"Bearer {FLEET_TOKEN}"} if FLEET_TOKEN else {}
+    try:
+        async with get_http_session().get(
+            f"{url}/agent/snapshot",
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=FLEET_TIMEOUT),
+        ) as resp:
+            if resp.status != 200:
+                raise RuntimeError(f"HTTP {resp.status}")
+            node["snapshot"] = await resp.json()
+        node["updated_at"] = monotonic()
+        if node["error"]:
+            logger.info(f"Fleet node {name} is reachable again")
+        node["error"] = None
+    except Exception as e:
+        if not node["error"]:
+            logger.warning(f"Fleet node {name} unreachable: {e!r}")
+        node["error"] = (str(e) or type(e).__name__)[:80]
+
+
+async def poll_fleet(context: ContextTypes.DEFAULT_TYPE = None) -> None:
+    """Poll all agents concurrently and refresh the hub's own snapshot."""
+    fleet_nodes[NODE_NAME] = {
+        "url": None,
+        "snapshot": collect_local_snapshot(fleet_cpu.read() or 0.0),
+        "updated_at": monotonic(),
+        "error": None,
+    }
+    await asyncio.gather(*(fetch_agent_snapshot(name, url) for name, url in FLEET_AGENTS.items()))
+
+
+def get_fleet_node_state(node: dict) -> tuple:
+    """(emoji, note) for a fleet node: unreachable, stale or worst threshold level."""
+    snapshot = node["snapshot"]
+    age = monotonic() - node["updated_at"] if node["updated_at"] else None
+    if snapshot is None:
+        return "⚫", f"unreachable: {node['error'] or 'not polled yet'}"
+    if node["error"] or age > FLEET_STALE_AFTER:
+        return "⚫", f"stale {format_uptime(age)} ({node['error'] or 'no update'})"
+
+    issues, warnings = evaluate_snapshot(snapshot)
+    return ("🔴" if issues else "🟡" if warnings else "🟢"), ""
+
+
+def fleet_keyboard(view: str) -> InlineKeyboardMarkup:
+    """One drill-down button per node, two per row."""
+    buttons = [InlineKeyboardButton(f"🔎 {name}", callback_data=f"fleet_{view}_{name}") for name in fleet_nodes]
+    return InlineKeyboardMarkup([buttons[i:i + 2] for i in range(0, len(buttons), 2)])
+
+
+def format_fleet_status() -> str:
+    lines = [f"🌐 <b>Fleet Status</b> ({len(fleet_nodes)} nodes)", "<code>━━━━━━━━━━━━━━━━━━━━━</code>", ""]
+    for name, node in fleet_nodes.items():
+        emoji, note = get_fleet_node_state(node)
+        snapshot = node["snapshot"]
+        lines.append(f"{emoji} <b>{html.escape(name)}</b>" + (f" <i>{html.escape(note)}</i>" if note else ""))
+        if snapshot:
+            containers = snapshot["containers"].values()
+            running = sum(1 for c in containers if c["status"] == "running")
+            lines.append(
+                f"└ CPU {snapshot['cpu']:.0f}% · Mem {snapshot['memory']['percent']:.0f}% · "
+                f"Disk {snapshot['disk']['percent']:.0f}% · 🐳 {running}/{len(containers)}"
+            )
+    return "\n".join(lines)
+
+
+def format_fleet_docker() -> str:
+    lines = ["🌐 <b>Fleet Containers</b>", ""]
+    for name, node in fleet_nodes.items():
+        snapshot = node["snapshot"]
+        if not snapshot:
+            lines.append(f"⚫ <b>{html.escape(name)}</b> <i>unreachable</i>")
+            continue
+        containers = snapshot["containers"]
+        running = sum(1 for c in containers.values() if c["status"] == "running")
+        degraded = [
+            info["name"] for info in snapshot["projects"].values()
+            if any(containers.get(c, {}).get("status") != "running" for c in info["containers"])
         ]
+        emoji = "🟢" if not degraded else "🟡"
+        lines.append(f"{emoji} <b>{html.escape(name)}</b> ({running}/{len(containers)})")
+        if degraded:
+            lines.append(f"└ Degraded: {html.escape(', '.join(degraded))}")
+    return "\n".join(lines)
 
-        await update.message.reply_text(
-            "\n".join(lines),
-            parse_mode=ParseMode.HTML,
-            reply_markup=InlineKeyboardMarkup(keyboard)
-        )
 
-    except Exception as e:
-        await update.message.reply_text(f"❌ Error: {str(e)}")
+def format_fleet_health() -> str:
+    issues, warnings = [], []
+    for name, node in fleet_nodes.items():
+        emoji, note = get_fleet_node_state(node)
+        if emoji == "⚫":
+            issues.append(f"⚫ {name}: {note}")
+            continue
+        node_issues, node_warnings = evaluate_snapshot(node["snapshot"])
+        issues.extend(f"[{name}] {line}" for line in node_issues)
+        warnings.extend(f"[{name}] {line}" for line in node_warnings)
 
+    text = f"🌐 <b>Fleet Health</b> ({len(fleet_nodes)} nodes)\n\n"
+    if issues:
+        text += "🚨 <b>Critical Issues</b>\n" + html.escape("\n".join(issues)) + "\n\n"
+    if warnings:
+        text += "⚠️ <b>Warnings</b>\n" + html.escape("\n".join(warnings))
+    if not issues and not warnings:
+        text += "✅ All nodes normal"
+    return text.strip()
+
+
+async def get_node_snapshot(name: Optional[str]) -> Optional[dict]:
+    """Fresh local snapshot, or the cached snapshot of a fleet node."""
+    if name is None or name == NODE_NAME:
+        cpu = await asyncio.get_running_loop().run_in_executor(None, psutil.cpu_percent, 1)
+        return collect_local_snapshot(cpu)
+    node = fleet_nodes.get(name)
+    return node["snapshot"] if node else None
+
+
+async def render_fleet_view(view: str, name: Optional[str]) -> tuple:
+    """Fleet summary for status/docker/health, or one node's drill-down: (text, keyboard)."""
+    if name is None:
+        formatters = {"status": format_fleet_status, "docker": format_fleet_docker, "health": format_fleet_health}
+        return formatters[view](), fleet_keyboard(view)
+
+    back = InlineKeyboardMarkup([[InlineKeyboardButton("◀️ Fleet", callback_data=f"fleet_{view}")]])
+    snapshot = await get_node_snapshot(name)
+    if snapshot is None:
+        return f"❌ Unknown or unreachable node: {html.escape(name)}", back
+
+    if view == "status":
+        text = format_status_text(snapshot)
+    elif view == "docker":
+        text = format_docker_text(snapshot["containers"], snapshot["projects"])
+    else:
+        text = format_health_text(snapshot, include_uptime=name == NODE_NAME)
+    return text, back
 
-async def container_restart(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Restart a container."""
-    if not is_authorized(update.effective_chat.id):
-        await update.message.reply_text("⛔ Unauthorized access!")
-        return
 
-    if not context.args:
-        await update.message.reply_text("❓ Usage: /restart <container_name>")
-        return
+async def run_agent() -> None:
+    """Agent mode: keep the index current and serve snapshots, no Telegram."""
+    if not FLEET_TOKEN:
+        logger.warning("FLEET_TOKEN not set, /agent/snapshot is unauthenticated")
 
-    name = context.args[0]
-    try:
-        container = docker_client.containers.get(name)
-        await update.message.reply_text(f"🔄 <b>{name}</b> restarting...", parse_mode=ParseMode.HTML)
-        container.restart(timeout=30)
-        await asyncio.sleep(3)
-        container.reload()
+    loop = asyncio.get_running_loop()
+    since = int(datetime.now().timestamp())
+    apply_container_states(await loop.run_in_executor(None, load_container_states))
+    threading.Thread(target=watch_docker_events, args=(loop, since), daemon=True, name="docker-events").start()
 
-        if container.status == "running":
-            await update.message.reply_text(f"✅ <b>{name}</b> restarted successfully!", parse_mode=ParseMode.HTML)
-        else:
-            await update.message.reply_text(f"⚠️ <b>{name}</b> status: {container.status}", parse_mode=ParseMode.HTML)
+    # Prime CPU accounting so the first poll reports a real value
+    agent_cpu.read()
 
-    except docker.errors.NotFound:
-        await update.message.reply_text(f"❌ Container not found: {name}")
-    except Exception as e:
-        await update.message.reply_text(f"❌ Error: {str(e)}")
+    async def health_handler(request: web.Request) -> web.Response:
+        return web.json_response({"status": "healthy", "mode": "agent", "node": NODE_NAME})
 
+    app = web.Application()
+    app.router.add_get("/agent/snapshot", agent_snapshot_handler)
+    app.router.add_get("/health", health_handler)
+    await run_webhook_server(app)
+    logger.info(f"Fleet agent {NODE_NAME} serving {len(container_index)} containers")
 
-async def container_logs(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Show container logs."""
-    if not is_authorized(update.effective_chat.id):
-        await update.message.reply_text("⛔ Unauthorized access!")
-        return
+    while True:
+        await asyncio.sleep(CONFIG_POLL_INTERVAL)
+        await reload_config_if_changed()
 
-    if not context.args:
-        await update.message.reply_text("❓ Usage: /logs <container_name>")
-        return
 
-    name = context.args[0]
-    try:
-        container = docker_client.containers.get(name)
-        logs = container.logs(tail=30, timestamps=False).decode("utf-8", errors="ignore")
+# ============================================
+# RUNBOOK INDEX
+# ============================================
 
-        if not logs.strip():
-            await update.message.reply_text(f"ℹ️ No logs for {name}")
-            return
+# Section headings used for inline actions, in order of preference
+RUNBOOK_ACTION_HEADINGS = ("immediate actions", "diagnosis steps", "diagnosis")
+RUNBOOK_SNIPPET_STEPS = 3
+RUNBOOK_HEADING_WEIGHT = 3
+
+
+def split_words(text: str) -> List[str]:
+    """Lowercase search tokens; CamelCase words such as alert names also add their parts."""
+    tokens = []
+    for word in re.findall(r"[A-Za-z0-9]+", text):
+        tokens.append(word.lower())
+        parts = re.findall(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+", word)
+        if len(parts) > 1:
+            tokens += [part.lower() for part in parts]
+    return [t for t in tokens if len(t) > 1]
+
+
+def extract_runbook_steps(lines: List[str], limit: int) -> List[tuple]:
+    """Numbered steps of a section as (title, first command) pairs."""
+    steps = []
+    in_code = False
+    for line in lines:
+        if line.startswith("```"):
+            in_code = not in_code
+            continue
+        if in_code:
+            command = line.strip()
+            if steps and steps[-1][1] is None and command and not command.startswith("#"):
+                steps[-1] = (steps[-1][0], command)
+            continue
+        m = re.match(r"\s*\d+\.\s+(.+)", line)
+        if m:
+            if len(steps) == limit:
+                break
+            steps.append((m.group(1).replace("**", "").strip().rstrip(":"), None))
+    return steps
 
-        # Truncate if too long
-        if len(logs) > 3500:
-            logs = logs[-3500:]
 
-        await update.message.reply_text(
-            f"📜 <b>{name}</b>\n\n<pre>{logs}</pre>",
-            parse_mode=ParseMode.HTML
-        )
+class RunbookIndex:
+    """Runbook sections from RUNBOOK_DIR with an inverted index, plus alert rules from alerts.yml.
 
-    except docker.errors.NotFound:
-        await update.message.reply_text(f"❌ Container not found: {name}")
-    except Exception as e:
-        await update.message.reply_text(f"❌ Error: {str(e)}")
+    Built once at startup; lookups and searches never touch the disk or network.
+    """
 
+    def __init__(self):
+        self.rules: Dict[str, dict] = {}
+        self.runbooks: Dict[str, str] = {}  # file -> title
+        self.sections: List[dict] = []
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
 
-async def health_check(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Perform comprehensive health check."""
+    def build(self, runbook_dir: str, rules_file: str) -> None:
+        try:
+            with open(rules_file) as f:
+                rules = yaml.safe_load(f) or {}
+            for group in rules.get("groups", []):
+                for rule in group.get("rules", []):
+                    if "alert" in rule:
+                        self.rules[rule["alert"]] = {
+                            "expr": str(rule.get("expr", "")).strip(),
+                            "for": rule.get("for", ""),
+                            "group": group.get("name", ""),
+                            "labels": rule.get("labels", {}),
+                            "annotations": rule.get("annotations", {}),
+                        }
+        except (OSError, yaml.YAMLError) as e:
+            logger.warning(f"Alert rules not indexed ({rules_file}): {e}")
+
+        try:
+            names = sorted(n for n in os.listdir(runbook_dir) if n.endswith(".md") and n != "README.md")
+        except OSError as e:
+            logger.warning(f"Runbooks not indexed ({runbook_dir}): {e}")
+            names = []
+        for name in names:
+            with open(os.path.join(runbook_dir, name)) as f:
+                self._add_runbook(name, f.read())
+
+        for idx, section in enumerate(self.sections):
+            counts = defaultdict(int)
+            for token in split_words(" ".join(section["lines"])):
+                counts[token] += 1
+            for token in split_words(section["path"]):
+                counts[token] += RUNBOOK_HEADING_WEIGHT
+            for token, count in counts.items():
+                self.postings[token][idx] = count
+
+    def _add_runbook(self, name: str, text: str) -> None:
+        """Split a markdown runbook into sections, ignoring '#' comments inside code blocks."""
+        title = name
+        path = []  # (level, heading, alerts named in it)
+        current = None
+        in_code = False
+        for line in text.splitlines():
+            if line.startswith("```"):
+                in_code = not in_code
+            m = None if in_code else re.match(r"(#{1,6})\s+(.+)", line)
+            if not m:
+                if current is not None:
+                    current["lines"].append(line)
+                continue
+
+            level, heading = len(m.group(1)), m.group(2).strip()
+            if level == 1:
+                title = heading.replace(" - Runbook", "")
+            mentioned = {w for w in re.findall(r"[A-Za-z0-9]+", heading) if w in self.rules}
+            path = [p for p in path if p[0] < level] + [(level, heading, mentioned)]
+            scoped = [p for p in path if p[2]]
+            current = {
+                "runbook": name,
+                "title": title,
+                "heading": heading,
+                "path": " › ".join(p[1] for p in path if p[0] > 1) or heading,
+                # Alerts the section is specific to, and how deep that scope starts
+                "alerts": scoped[-1][2] if scoped else set(),
+                "scope_level": scoped[-1][0] if scoped else 0,
+                "lines": [],
+            }
+            self.sections.append(current)
+        self.runbooks[name] = title
+
+    def runbook_for(self, alertname: str) -> Optional[str]:
+        runbook = self.rules.get(alertname, {}).get("annotations", {}).get("runbook")
+        if runbook:
+            return runbook
+        # Fall back to a runbook with a heading naming the alert
+        return next((s["runbook"] for s in self.sections if alertname in s["alerts"]), None)
+
+    def actions(self, alertname: str) -> Optional[tuple]:
+        """(runbook, steps) to show inline for an alert, or None."""
+        runbook = self.runbook_for(alertname)
+        if not runbook:
+            return None
+        sections = [s for s in self.sections if s["runbook"] == runbook]
+        # The alert's own section first, then runbook-wide sections
+        candidates = [s for s in sections if alertname in s["alerts"]]
+        candidates += [s for s in sections if s["scope_level"] <= 2 and s not in candidates]
+        for heading in RUNBOOK_ACTION_HEADINGS:
+            for section in candidates:
+                if section["heading"].lower() == heading:
+                    steps = extract_runbook_steps(section["lines"], RUNBOOK_SNIPPET_STEPS)
+                    if steps:
+                        return runbook, steps
+        return None
+
+    def search(self, query: str, limit: int = 5) -> List[tuple]:
+        """Sections ranked by tf-idf over the query terms, as (score, section, terms)."""
+        scores = defaultdict(float)
+        matched = defaultdict(set)
+        for token in set(split_words(query)):
+            # Unknown words also match as a prefix ("postgre" -> "postgresql")
+            terms = [token] if token in self.postings else [t for t in self.postings if len(token) >= 3 and t.startswith(token)]
+            for term in terms:
+                postings = self.postings[term]
+                idf = math.log(1 + len(self.sections) / len(postings))
+                for idx, count in postings.items():
+                    scores[idx] += count * idf
+                    matched[idx].add(term)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [(score, self.sections[idx], matched[idx]) for idx, score in ranked]
+
+
+runbook_index = RunbookIndex()
+
+
+def format_runbook_actions(alertname: str) -> List[str]:
+    """Inline 'immediate actions' lines for an alert message, empty without a runbook."""
+    found = runbook_index.actions(alertname)
+    if not found:
+        return []
+    runbook, steps = found
+    lines = [f"📖 <b>Immediate actions</b> ({html.escape(runbook)})"]
+    for i, (title, command) in enumerate(steps, 1):
+        line = f"{i}. {html.escape(title)}"
+        if command:
+            line += f": <code>{html.escape(command[:120])}</code>"
+        lines.append(line)
+    return lines
+
+
+async def runbook_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Search the local runbooks or show the runbook for an alert."""
     if not is_authorized(update.effective_chat.id):
         await update.message.reply_text("⛔ Unauthorized access!")
         return
 
-    await update.message.reply_text("🔍 Running health check...")
-
-    issues = []
-    warnings = []
+    if not context.args:
+        lines = ["📖 <b>Runbooks</b>", ""]
+        for name, title in runbook_index.runbooks.items():
+            count = sum(1 for a in runbook_index.rules if runbook_index.runbook_for(a) == name)
+            lines.append(f"• <b>{html.escape(title)}</b> - {name} ({count} alerts)")
+        if not runbook_index.runbooks:
+            lines.append(f"ℹ️ No runbooks found in {RUNBOOK_DIR}")
+        lines += ["", "Usage: /runbook <alert name | search words>", "", "Examples:", "• /runbook HighCPU", "• /runbook redis memory"]
+        await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
+        return
 
-    # Check system resources
-    cpu = psutil.cpu_percent(interval=1)
-    mem = psutil.virtual_memory()
-    disk = psutil.disk_usage("/")
+    query = " ".join(context.args)
+
+    # An alert name shows its rule and the inline actions
+    alertname = next((a for a in runbook_index.rules if a.lower() == query.lower()), None)
+    if alertname:
+        rule = runbook_index.rules[alertname]
+        lines = [
+            f"📖 <b>{alertname}</b>",
+            "",
+            f"├ Severity: {html.escape(str(rule['labels'].get('severity', '?')))}",
+            f"├ For: {html.escape(str(rule['for'] or '0s'))}",
+            f"└ {html.escape(str(rule['annotations'].get('summary', '')))}",
+        ]
+        actions = format_runbook_actions(alertname)
+        if actions:
+            lines += [""] + actions
+        lines += ["", f'<a href="{html.escape(get_runbook_url(alertname))}">Full runbook</a>']
+        await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML, disable_web_page_preview=True)
+        return
 
-    if cpu > 90:
-        issues.append(f"🔴 CPU critical: {cpu:.1f}%")
-    elif cpu > 70:
-        warnings.append(f"🟡 CPU high: {cpu:.1f}%")
+    results = runbook_index.search(query)
+    if not results:
+        await update.message.reply_text(f"🔍 No runbook sections match <i>{html.escape(query)}</i>", parse_mode=ParseMode.HTML)
+        return
 
-    if mem.percent > 90:
-        issues.append(f"🔴 Memory critical: {mem.percent:.1f}%")
-    elif mem.percent > 75:
-        warnings.append(f"🟡 Memory high: {mem.percent:.1f}%")
+    lines = [f"🔍 <b>Runbooks</b> | <i>{html.escape(query)}</i>", ""]
+    for _, section, terms in results:
+        lines.append(f"📄 <b>{html.escape(section['title'])}</b> › {html.escape(section['path'])}")
+        # First line mentioning a matched term, as a hint
+        excerpt = next((
+            l.strip() for l in section["lines"]
+            if l.strip() and not l.startswith("```") and terms & set(split_words(l))
+        ), "")
+        if excerpt:
+            lines.append(f"└ <i>{html.escape(excerpt.replace('**', '')[:120])}</i>")
+        lines.append(f"   {RUNBOOK_BASE_URL}/{section['runbook']}")
+    await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML, disable_web_page_preview=True)
 
-    if disk.percent > 90:
-        issues.append(f"🔴 Disk critical: {disk.percent:.1f}%")
-    elif disk.percent > 75:
-        warnings.append(f"🟡 Disk high: {disk.percent:.1f}%")
 
-    # Check critical containers
-    critical_containers = ["traefik", "prometheus", "grafana", "alertmanager"]
-    for name in critical_containers:
-        status = get_container_status(name)
-        if status != "🟢":
-            issues.append(f"🔴 {name} not running!")
+# ============================================
+# PROFESSIONAL ALERT FORMATTING
+# ============================================
 
-    # Check project containers
-    for project_id, project_info in PROJECT_GROUPS.items():
-        if project_id in ["monitoring", "infra"]:
+def format_alert_message(alerts: List[dict], status: str) -> str:
+    """Format alerts into professional message."""
+    if not alerts:
+        return ""
+
+    # Get first alert for common info
+    first_alert = alerts[0]
+    labels = first_alert.get("labels", {})
+    severity = labels.get("severity", "warning")
+    category = labels.get("category", "unknown")
+
+    severities = config["severity"]
+    sev_config = severities.get(severity, severities["warning"])
+    cat_config = CATEGORY_CONFIG.get(category, {"icon": "📋", "name": category})
+
+    is_firing = status == "firing"
+    alert_count = len(alerts)
+
+    # Header
+    if is_firing:
+        header = f"{sev_config['emoji']} <b>{sev_config['title']}</b>"
+    else:
+        header = "✅ <b>RESOLVED</b>"
+
+    if alert_count > 1:
+        header += f" ({alert_count} alerts)"
+
+    lines = [header, ""]
+
+    # Category and timestamp
+    lines.append(f"{cat_config['icon']} <b>Category:</b> {cat_config['name']}")
+    lines.append(f"🕐 <b>Time:</b> {datetime.now(TIMEZONE).strftime('%H:%M:%S')}")
+    lines.append("")
+
+    # Alert details
+    for i, alert in enumerate(alerts[:5]):  # Max 5 alerts
+        alert_labels = alert.get("labels", {})
+        annotations = alert.get("annotations", {})
+        alertname = alert_labels.get("alertname", "Unknown")
+        instance = alert_labels.get("instance", "")
+
+        if alert_count > 1:
+            lines.append(f"<b>#{i+1} {alertname}</b>")
+        else:
+            lines.append(f"<b>{alertname}</b>")
+
+        if instance:
+            lines.append(f"📍 {instance}")
+
+        # Description
+        description = annotations.get("description", annotations.get("summary", ""))
+        if description:
+            # Truncate long descriptions
+            if len(description) > 200:
+                description = description[:200] + "..."
+            lines.append(f"💬 {description}")
+
+        # Duration for firing alerts
+        if is_firing and alert.get("startsAt"):
+            duration = format_duration(alert["startsAt"])
+            lines.append(f"⏱️ Duration: {duration}")
+
+        if i < len(alerts) - 1:
+            lines.append("")
+
+    if alert_count > 5:
+        lines.append(f"\n<i>... and {alert_count - 5} more alerts</i>")
+
+    # First steps from the local runbook, so responders need not open it
+    if is_firing:
+        actions = format_runbook_actions(labels.get("alertname", ""))
+        if actions:
+            lines += [""] + actions
+
+    return "\n".join(lines)
+
+
+def create_alert_keyboard(alerts: List[dict], status: str) -> InlineKeyboardMarkup:
+    """Create interactive keyboard for alerts."""
+    if status != "firing" or not alerts:
+        return None
+
+    first_alert = alerts[0]
+    labels = first_alert.get("labels", {})
+    alertname = labels.get("alertname", "")
+    instance = labels.get("instance", "")
+    category = labels.get("category", "unknown")
+    alert_hash = get_alert_hash(first_alert)
+
+    keyboard = []
+
+    # Row 1: Acknowledge & Silence
+    row1 = [
+        InlineKeyboardButton("✅ ACK", callback_data=f"ack_{alert_hash}"),
+        InlineKeyboardButton("🔕 1h Silence", callback_data=f"silence_1h_{alert_hash}"),
+        InlineKeyboardButton("🔕 4h Silence", callback_data=f"silence_4h_{alert_hash}"),
+    ]
+    keyboard.append(row1)
+
+    # Row 2: Actions based on alert type
+    row2 = []
+
+    # Add restart button for container alerts
+    if "container" in alertname.lower() or labels.get("name"):
+        container_name = labels.get("name", instance.split(":")[0] if instance else "")
+        if container_name:
+            row2.append(InlineKeyboardButton("🔄 Restart", callback_data=f"restart_{container_name}"))
+
+    # Runbook link
+    row2.append(InlineKeyboardButton("📖 Runbook", url=get_runbook_url(alertname)))
+
+    # Grafana link
+    row2.append(InlineKeyboardButton("📊 Grafana", url=get_grafana_url(category)))
+
+    if row2:
+        keyboard.append(row2)
+
+    return InlineKeyboardMarkup(keyboard)
+
+
+# ============================================
+# INCIDENT STATISTICS
+# ============================================
+
+# Sketch bucket i holds values in (gamma^(i-1), gamma^i]
+STATS_SKETCH_GAMMA = (1 + STATS_SKETCH_ACCURACY) / (1 - STATS_SKETCH_ACCURACY)
+STATS_SKETCH_LOG_GAMMA = math.log(STATS_SKETCH_GAMMA)
+
+
+class QuantileSketch:
+    """Streaming quantiles with bounded relative error, merged by adding bucket counts."""
+
+    def __init__(self, buckets: Optional[Dict[int, int]] = None):
+        self.buckets: Dict[int, int] = defaultdict(int, buckets or {})
+        self.count = sum(self.buckets.values())
+
+    def add(self, value: float) -> None:
+        # Sub-second durations share the lowest bucket
+        self.buckets[math.ceil(math.log(max(value, 1.0)) / STATS_SKETCH_LOG_GAMMA)] += 1
+        self.count += 1
+
+    def merge(self, other: "QuantileSketch") -> None:
+        for key, count in other.buckets.items():
+            self.buckets[key] += count
+        self.count += other.count
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                return 2 * STATS_SKETCH_GAMMA ** key / (STATS_SKETCH_GAMMA + 1)
+        return None
+
+
+class IncidentCounters:
+    """Running totals plus time-to-ack and time-to-resolve sketches for one dimension."""
+
+    def __init__(self):
+        self.fired = 0
+        self.acked = 0
+        self.resolved = 0
+        self.ack_seconds = 0.0
+        self.resolve_seconds = 0.0
+        self.tta = QuantileSketch()
+        self.ttr = QuantileSketch()
+
+    def merge(self, other: "IncidentCounters") -> None:
+        self.fired += other.fired
+        self.acked += other.acked
+        self.resolved += other.resolved
+        self.ack_seconds += other.ack_seconds
+        self.resolve_seconds += other.resolve_seconds
+        self.tta.merge(other.tta)
+        self.ttr.merge(other.ttr)
+
+    @property
+    def mtta(self) -> Optional[float]:
+        return self.ack_seconds / self.acked if self.acked else None
+
+    @property
+    def mttr(self) -> Optional[float]:
+        return self.resolve_seconds / self.resolved if self.resolved else None
+
+    def to_dict(self) -> dict:
+        return {
+            "fired": self.fired, "acked": self.acked, "resolved": self.resolved,
+            "ack_seconds": self.ack_seconds, "resolve_seconds": self.resolve_seconds,
+            "tta": dict(self.tta.buckets), "ttr": dict(self.ttr.buckets),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "IncidentCounters":
+        counters = cls()
+        for field in ("fired", "acked", "resolved", "ack_seconds", "resolve_seconds"):
+            setattr(counters, field, data.get(field, 0))
+        counters.tta = QuantileSketch({int(k): v for k, v in data.get("tta", {}).items()})
+        counters.ttr = QuantileSketch({int(k): v for k, v in data.get("ttr", {}).items()})
+        return counters
+
+
+def parse_alert_time(value: Optional[str]) -> Optional[float]:
+    """Epoch seconds of an Alertmanager timestamp; None for missing or zero times."""
+    if not value or value.startswith("0001-"):
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def get_alert_dimensions(alert: dict) -> List[tuple]:
+    """Stats dimensions an alert counts towards: overall, alertname, category, project."""
+    labels = get_route_labels(alert)
+    dims = [
+        ("all", ""),
+        ("alertname", alert.get("labels", {}).get("alertname", "?")),
+        ("category", labels["category"]),
+    ]
+    if labels["project"]:
+        dims.append(("project", labels["project"]))
+    return dims
+
+
+class IncidentStats:
+    """Hourly counters per alertname, category and project, updated on every event.
+
+    Fires count in the hour the alert started, acks and resolves in the hour
+    they happened, so a range query only merges the hours it covers.
+    """
+
+    def __init__(self):
+        self.hours: Dict[int, Dict[tuple, IncidentCounters]] = {}
+        # alert hash -> latest incident {"started", "acked", "resolved", "dims"}
+        self.incidents: Dict[str, dict] = {}
+
+    def _counters(self, ts: float, dims: List[tuple]) -> List[IncidentCounters]:
+        hour = self.hours.setdefault(int(ts // 3600) * 3600, {})
+        return [hour.setdefault(tuple(dim), IncidentCounters()) for dim in dims]
+
+    def fire(self, alert_hash: str, alert: dict) -> None:
+        started = parse_alert_time(alert.get("startsAt")) or datetime.now().timestamp()
+        incident = self.incidents.get(alert_hash)
+        # Alertmanager repeats firing notifications for the same incident
+        if incident and incident["started"] == started:
+            return
+        dims = get_alert_dimensions(alert)
+        self.incidents[alert_hash] = {"started": started, "acked": False, "resolved": False, "dims": dims}
+        for counters in self._counters(started, dims):
+            counters.fired += 1
+
+    def acknowledge(self, alert_hash: str, at: float) -> None:
+        incident = self.incidents.get(alert_hash)
+        if not incident or incident["acked"] or incident["resolved"]:
+            return
+        incident["acked"] = True
+        delay = max(at - incident["started"], 0)
+        for counters in self._counters(at, incident["dims"]):
+            counters.acked += 1
+            counters.ack_seconds += delay
+            counters.tta.add(delay)
+
+    def resolve(self, alert_hash: str, at: float) -> None:
+        incident = self.incidents.get(alert_hash)
+        if not incident or incident["resolved"]:
+            return
+        incident["resolved"] = True
+        duration = max(at - incident["started"], 0)
+        for counters in self._counters(at, incident["dims"]):
+            counters.resolved += 1
+            counters.resolve_seconds += duration
+            counters.ttr.add(duration)
+
+    def record(self, alert_hash: str, alert: dict, status: str) -> None:
+        """Apply one alert from an Alertmanager webhook."""
+        if status == "firing":
+            self.fire(alert_hash, alert)
+            return
+        # A resolve for an incident we never saw firing (e.g. before a restart)
+        incident = self.incidents.get(alert_hash)
+        started = parse_alert_time(alert.get("startsAt"))
+        if started and (not incident or incident["started"] != started):
+            self.fire(alert_hash, alert)
+        self.resolve(alert_hash, parse_alert_time(alert.get("endsAt")) or datetime.now().timestamp())
+
+    def between(self, start: float, end: float) -> Dict[tuple, IncidentCounters]:
+        """Merged counters per dimension for the whole hours in [start, end)."""
+        merged: Dict[tuple, IncidentCounters] = defaultdict(IncidentCounters)
+        for hour, dims in self.hours.items():
+            if start <= hour < end:
+                for dim, counters in dims.items():
+                    merged[dim].merge(counters)
+        return merged
+
+    def summary(self, seconds: int) -> tuple:
+        """Merged counters per dimension for the last `seconds`, plus firing time of open incidents."""
+        now = datetime.now().timestamp()
+        since = now - seconds
+        merged: Dict[tuple, IncidentCounters] = defaultdict(IncidentCounters)
+        for hour, dims in self.hours.items():
+            if hour + 3600 > since:
+                for dim, counters in dims.items():
+                    merged[dim].merge(counters)
+
+        ongoing: Dict[tuple, float] = defaultdict(float)
+        for incident in self.incidents.values():
+            if not incident["resolved"]:
+                for dim in incident["dims"]:
+                    ongoing[tuple(dim)] += max(now - max(incident["started"], since), 0)
+        return merged, ongoing
+
+    def prune(self) -> None:
+        cutoff = datetime.now().timestamp() - STATS_RETENTION
+        for hour in [h for h in self.hours if h < cutoff]:
+            del self.hours[hour]
+        for alert_hash in [h for h, i in self.incidents.items() if i["started"] < cutoff]:
+            del self.incidents[alert_hash]
+
+    def to_dict(self) -> dict:
+        return {
+            "hours": {
+                str(hour): [[list(dim), counters.to_dict()] for dim, counters in dims.items()]
+                for hour, dims in self.hours.items()
+            },
+            "incidents": self.incidents,
+        }
+
+    def load(self, path: str) -> None:
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load incident stats from {path}: {e}")
+            return
+        self.hours = {
+            int(hour): {tuple(dim): IncidentCounters.from_dict(counters) for dim, counters in dims}
+            for hour, dims in data.get("hours", {}).items()
+        }
+        self.incidents = data.get("incidents", {})
+        self.prune()
+
+
+incident_stats = IncidentStats()
+
+
+async def save_incident_stats(context: Optional[ContextTypes.DEFAULT_TYPE] = None) -> None:
+    """Write the incident stats and host rollups; replicas leave it to the leader."""
+    if not is_leader:
+        return
+    incident_stats.prune()
+    host_rollups.prune()
+    try:
+        await write_json_file(STATS_FILE, json.dumps(incident_stats.to_dict()))
+        await write_json_file(ROLLUP_FILE, json.dumps(host_rollups.to_dict()))
+    except OSError as e:
+        logger.error(f"Failed to save incident stats: {e}")
+
+
+def format_stat_duration(seconds: Optional[float]) -> str:
+    """Short duration for MTTA/MTTR values, with seconds below a minute."""
+    if seconds is None:
+        return "-"
+    if seconds < 60:
+        return f"{int(seconds)}s"
+    return format_uptime(seconds)
+
+
+def format_incident_totals(counters: IncidentCounters, ongoing: float) -> List[str]:
+    """Tree lines with counts, MTTA/MTTR and firing time."""
+    return [
+        f"├ 🔥 Fired: {counters.fired} | ✅ Resolved: {counters.resolved} | 👀 Acked: {counters.acked}",
+        f"├ ⏱️ MTTA: {format_stat_duration(counters.mtta)} (p50 {format_stat_duration(counters.tta.quantile(0.5))}, p90 {format_stat_duration(counters.tta.quantile(0.9))})",
+        f"├ 🔧 MTTR: {format_stat_duration(counters.mttr)} (p50 {format_stat_duration(counters.ttr.quantile(0.5))}, p90 {format_stat_duration(counters.ttr.quantile(0.9))})",
+        f"└ ⌛ Firing time: {format_stat_duration(counters.resolve_seconds + ongoing)}",
+    ]
+
+
+def format_stats_text(seconds: int, top: int = 5) -> str:
+    """Incident stats message for the last `seconds`."""
+    merged, ongoing = incident_stats.summary(seconds)
+    lines = [
+        f"📈 <b>Incident Stats</b> | last {format_uptime(seconds)}",
+        "<code>━━━━━━━━━━━━━━━━━━━━━</code>",
+        "",
+    ]
+    if not merged and not ongoing:
+        lines.append("✅ No incidents in this range")
+        return "\n".join(lines)
+
+    lines += format_incident_totals(merged.get(("all", ""), IncidentCounters()), ongoing.get(("all", ""), 0))
+
+    for kind, title in (("alertname", "🚨 By alert"), ("category", "🏷️ By category"), ("project", "📦 By project")):
+        rows = [(dim[1], c) for dim, c in merged.items() if dim[0] == kind]
+        if not rows:
+            continue
+        rows.sort(key=lambda r: (r[1].fired, r[1].resolve_seconds), reverse=True)
+        lines += ["", f"<b>{title}</b>"]
+        for i, (name, c) in enumerate(rows[:top]):
+            prefix = "└" if i == min(len(rows), top) - 1 else "├"
+            firing = c.resolve_seconds + ongoing.get((kind, name), 0)
+            lines.append(
+                f"{prefix} {html.escape(name)}: {c.fired}× | MTTA {format_stat_duration(c.mtta)} | "
+                f"MTTR {format_stat_duration(c.mttr)} | {format_stat_duration(firing)} firing"
+            )
+    return "\n".join(lines)
+
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show MTTA, MTTR, firing count and firing time per alert, category and project."""
+    if not is_authorized(update.effective_chat.id):
+        await update.message.reply_text("⛔ Unauthorized access!")
+        return
+
+    try:
+        seconds = parse_duration(context.args[0]) if context.args else 86400
+    except ValueError:
+        await update.message.reply_text(
+            "📈 <b>Stats - Incident Statistics</b>\n\n"
+            "Usage: /stats [range]\n\n"
+            "Examples:\n"
+            "• /stats\n"
+            "• /stats 7d",
+            parse_mode=ParseMode.HTML
+        )
+        return
+
+    # Whole hours, at most the retention window
+    seconds = min(max(seconds, 3600), STATS_RETENTION)
+    await update.message.reply_text(format_stats_text(seconds), parse_mode=ParseMode.HTML)
+
+
+# ============================================
+# ALERTMANAGER WEBHOOK HANDLER
+# ============================================
+
+def get_route_labels(alert: dict) -> dict:
+    """Labels used for routing; project falls back to the container's compose project."""
+    labels = alert.get("labels", {})
+    container = labels.get("name") or labels.get("container") or ""
+    return {
+        "severity": labels.get("severity", "warning"),
+        "category": labels.get("category", "unknown"),
+        "project": labels.get("project") or get_container_project(container) or "",
+    }
+
+
+async def notify_destination(destination: tuple, alerts: List[dict], status: str) -> bool:
+    """Spool one alert notification for a (chat id, topic) destination; False if it failed."""
+    chat_id, topic = destination
+    claim_key = f"{get_notification_key(alerts, status)}:{chat_id}:{topic}"
+    try:
+        # Every replica gets the webhook, and Alertmanager retries: the first claim wins
+        if not await state.claim(claim_key, ALERT_DEDUP_TTL):
+            return True
+    except Exception as e:
+        logger.error(f"Failed to queue message for {chat_id}: {e}")
+        return False
+
+    try:
+        # Attach the category's Grafana panel once the message is sent
+        category = None
+        if ALERT_ATTACH_PANELS and status == "firing":
+            category = alerts[0].get("labels", {}).get("category", "default")
+
+        # Spooled to disk first; the chat's sender delivers it in order
+        await spool.enqueue(
+            chat_id,
+            format_alert_message(alerts, status),
+            reply_markup=create_alert_keyboard(alerts, status),
+            panel_category=category,
+            parse_mode=ParseMode.HTML,
+            disable_web_page_preview=True,
+            **({"message_thread_id": topic} if topic else {}),
+        )
+        return True
+    except Exception as e:
+        logger.error(f"Failed to queue message for {chat_id}: {e}")
+
+    # Hand the claim back so the webhook retry (or another replica) queues it
+    try:
+        await state.release(claim_key)
+    except Exception as e:
+        logger.error(f"Failed to release notification claim {claim_key}: {e}")
+    return False
+
+
+async def process_alerts(alerts: List[dict], status: str, notify: bool = True) -> bool:
+    """Record alerts, then route and spool their notifications.
+
+    This runs on whichever replica receives the webhook, leader or not, so
+    an alert is not lost while the lease is unresolved at startup or
+    changing hands. notify_destination's claim sends each message once.
+    Returns False if a notification could not be queued.
+    """
+    # Store alerts in the shared history on every replica
+    for alert in alerts:
+        await state.put_alert(get_alert_hash(alert), {
+            "alert": alert,
+            "status": status,
+            "received_at": datetime.now(TIMEZONE).isoformat(),
+        })
+        incident_stats.record(get_alert_hash(alert), alert, alert.get("status", status))
+
+    if not notify:
+        return True
+
+    # Group alerts by severity
+    grouped = defaultdict(list)
+    for alert in alerts:
+        severity = alert.get("labels", {}).get("severity", "warning")
+        grouped[severity].append(alert)
+
+    # Route each severity group; alerts for one destination share a message
+    router = config["router"]
+    notifications = []
+    for severity, severity_alerts in grouped.items():
+        by_destination = defaultdict(list)
+        for alert in severity_alerts:
+            for destination in router.route(get_route_labels(alert)):
+                by_destination[destination].append(alert)
+        notifications += [notify_destination(d, dest_alerts, status) for d, dest_alerts in by_destination.items()]
+
+    # Fan out concurrently; the spool appends share one fsync
+    return all(await asyncio.gather(*notifications))
+
+
+async def post_bot_alerts(alerts: List[dict], ends_at: datetime) -> bool:
+    """Post bot alerts to Alertmanager's API, False if it did not take them."""
+    payload = [
+        {"labels": a["labels"], "annotations": a["annotations"], "startsAt": a["startsAt"], "endsAt": ends_at.isoformat()}
+        for a in alerts
+    ]
+    try:
+        async with get_http_session().post(
+            f"{ALERTMANAGER_URL}/api/v2/alerts",
+            json=payload,
+            timeout=aiohttp.ClientTimeout(total=10),
+        ) as resp:
+            if resp.status == 200:
+                return True
+            logger.warning(f"Alertmanager rejected bot alerts: HTTP {resp.status}")
+    except Exception as e:
+        logger.warning(f"Alertmanager unreachable for bot alerts: {e!r}")
+    return False
+
+
+async def raise_bot_alert(key: str, alertname: str, instance: str, summary: str, description: str,
+                          category: str = "host", severity: str = "warning") -> None:
+    """Fire an alert raised by the bot itself.
+
+    It goes through Alertmanager, so silences, inhibition and grouping apply
+    and it comes back through the webhook like any other alert. Replicas on
+    one host post the same labels, which Alertmanager merges.
+    """
+    alert = {
+        "status": "firing",
+        "labels": {"alertname": alertname, "severity": severity, "category": category, "instance": instance},
+        "annotations": {"summary": summary, "description": description},
+        "startsAt": datetime.now(pytz.UTC).isoformat(),
+    }
+    bot_alerts[key] = alert
+    logger.info(f"Bot alert {alertname} on {instance}: {description}")
+    if await post_bot_alerts([alert], datetime.now(pytz.UTC) + timedelta(seconds=BOT_ALERT_TTL)):
+        return
+
+    # Alertmanager is down: notify directly rather than not at all. Only the
+    # leader does, as replicas sharing a host would each raise it.
+    bot_alerts_direct.add(key)
+    await process_alerts([alert], "firing", notify=is_leader)
+
+
+async def clear_bot_alert(key: str) -> None:
+    alert = bot_alerts.pop(key, None)
+    if not alert:
+        return
+    now = datetime.now(pytz.UTC)
+    if key not in bot_alerts_direct:
+        # Alertmanager sends the resolution; if it is down, the alert expires there
+        await post_bot_alerts([alert], now)
+        return
+    bot_alerts_direct.discard(key)
+    resolved = {**alert, "status": "resolved", "endsAt": now.isoformat()}
+    await process_alerts([resolved], "resolved", notify=is_leader)
+
+
+async def refresh_bot_alerts(context: Optional[ContextTypes.DEFAULT_TYPE] = None) -> None:
+    """Re-post firing bot alerts so Alertmanager keeps them active (job queue callback)."""
+    alerts = [alert for key, alert in bot_alerts.items() if key not in bot_alerts_direct]
+    if alerts:
+        await post_bot_alerts(alerts, datetime.now(pytz.UTC) + timedelta(seconds=BOT_ALERT_TTL))
+
+
+async def handle_alertmanager_webhook(request: web.Request) -> web.Response:
+    """Handle incoming webhooks from Alertmanager."""
+    try:
+        data = await request.json()
+        logger.info(f"Received webhook: {json.dumps(data, indent=2)[:500]}")
+
+        status = data.get("status", "firing")
+        alerts = data.get("alerts", [])
+
+        if not alerts:
+            return web.Response(text="No alerts", status=200)
+
+        # Skip DeadManSwitch
+        alerts = [a for a in alerts if a.get("labels", {}).get("alertname") != "DeadManSwitch"]
+
+        if not alerts:
+            return web.Response(text="Filtered", status=200)
+
+        # Get the bot application from app state
+        bot = request.app.get("bot")
+        if not bot:
+            logger.error("Bot not available")
+            return web.Response(text="Bot not ready", status=503)
+
+        if not await process_alerts(alerts, status):
+            # Alertmanager retries; destinations already queued stay claimed
+            return web.Response(text="Notification not queued", status=500)
+        return web.Response(text="OK", status=200)
+
+    except Exception as e:
+        logger.error(f"Webhook error: {e}")
+        return web.Response(text=str(e), status=500)
+
+
+# ============================================
+# HOST METRIC ROLLUPS
+# ============================================
+
+class HostRollups:
+    """Hourly count/sum/min/max/first/last per host series, plus hourly event counts.
+
+    Each sample updates one bucket in O(1); reports merge the hours they
+    cover instead of keeping raw samples.
+    """
+
+    def __init__(self):
+        self.hours: Dict[int, Dict[str, list]] = {}
+        self.events: Dict[int, Dict[str, int]] = {}
+
+    def add(self, series: str, ts: float, value: float) -> None:
+        bucket = self.hours.setdefault(int(ts // 3600) * 3600, {})
+        agg = bucket.get(series)
+        if agg is None:
+            bucket[series] = [1, value, value, value, value, value]
+            return
+        agg[0] += 1
+        agg[1] += value
+        agg[2] = min(agg[2], value)
+        agg[3] = max(agg[3], value)
+        agg[5] = value
+
+    def count(self, event: str, ts: float, n: int = 1) -> None:
+        bucket = self.events.setdefault(int(ts // 3600) * 3600, {})
+        bucket[event] = bucket.get(event, 0) + n
+
+    def window(self, start: float, end: float) -> Dict[str, dict]:
+        """Per series avg/min/max and first/last value over the hours in [start, end)."""
+        merged: Dict[str, dict] = {}
+        for hour in sorted(h for h in self.hours if start <= h < end):
+            for series, (n, total, low, high, first, last) in self.hours[hour].items():
+                agg = merged.get(series)
+                if agg is None:
+                    merged[series] = {"count": n, "sum": total, "min": low, "max": high, "first": first, "last": last}
+                    continue
+                agg["count"] += n
+                agg["sum"] += total
+                agg["min"] = min(agg["min"], low)
+                agg["max"] = max(agg["max"], high)
+                agg["last"] = last
+        for agg in merged.values():
+            agg["avg"] = agg["sum"] / agg["count"]
+        return merged
+
+    def event_counts(self, start: float, end: float, prefix: str = "") -> Dict[str, int]:
+        counts: Dict[str, int] = defaultdict(int)
+        for hour, events in self.events.items():
+            if start <= hour < end:
+                for event, n in events.items():
+                    if event.startswith(prefix):
+                        counts[event[len(prefix):]] += n
+        return counts
+
+    def prune(self) -> None:
+        cutoff = datetime.now().timestamp() - ROLLUP_RETENTION
+        for buckets in (self.hours, self.events):
+            for hour in [h for h in buckets if h < cutoff]:
+                del buckets[hour]
+
+    def to_dict(self) -> dict:
+        return {"hours": self.hours, "events": self.events}
+
+    def load(self, path: str) -> None:
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load host rollups from {path}: {e}")
+            return
+        self.hours = {int(hour): series for hour, series in data.get("hours", {}).items()}
+        self.events = {int(hour): events for hour, events in data.get("events", {}).items()}
+        self.prune()
+
+
+host_rollups = HostRollups()
+
+
+
+# ============================================
+# ANOMALY DETECTION
+# ============================================
+
+# Host series: (label, z-score std floor, trend half-life in seconds, unit)
+ANOMALY_METRICS = {
+    "cpu": ("CPU", 2.0, 3600, "%"),
+    "memory": ("Memory", 1.0, 3600, "%"),
+    "load": ("Load", 0.1, 3600, ""),
+    "disk": ("Disk", 0.2, 6 * 3600, "%"),
+}
+
+
+class MetricStream:
+    """EWMA baseline and a decaying linear trend for one host series, O(1) per sample.
+
+    The z-score compares a sample with the baseline of the samples before
+    it. The trend is a least-squares fit whose weights halve every
+    `halflife` seconds; its sums are re-centred on the newest sample so
+    they stay small however long the bot runs.
+    """
+
+    def __init__(self, std_floor: float, halflife: float):
+        self.std_floor = std_floor
+        self.halflife = halflife
+        self.count = 0
+        self.mean = 0.0
+        self.var = 0.0
+        self.last_t: Optional[float] = None
+        # Weighted n, Σt, Σx, Σt², Σtx with t relative to the newest sample
+        self.s0 = self.st = self.sx = self.stt = self.stx = 0.0
+
+    def add(self, t: float, x: float) -> float:
+        """Add a sample; returns its z-score against the prior baseline (0 while warming up)."""
+        z = 0.0
+        update = x
+        if self.count >= ANOMALY_WARMUP:
+            std = max(math.sqrt(self.var), self.std_floor)
+            z = (x - self.mean) / std
+            # Clip outliers so one burst doesn't inflate the baseline it is judged by
+            bound = ANOMALY_Z_THRESHOLD * std
+            update = min(max(x, self.mean - bound), self.mean + bound)
+
+        if self.count == 0:
+            self.mean = x
+        else:
+            diff = update - self.mean
+            incr = ANOMALY_EWMA_ALPHA * diff
+            self.mean += incr
+            self.var = (1 - ANOMALY_EWMA_ALPHA) * (self.var + diff * incr)
+        self.count += 1
+
+        if self.last_t is not None:
+            dt = t - self.last_t
+            decay = 0.5 ** (dt / self.halflife)
+            # Shift the origin to t, then age all earlier weights
+            self.stt = decay * (self.stt - 2 * dt * self.st + dt * dt * self.s0)
+            self.st = decay * (self.st - dt * self.s0)
+            self.stx = decay * (self.stx - dt * self.sx)
+            self.s0 *= decay
+            self.sx *= decay
+        self.s0 += 1
+        self.sx += x
+        self.last_t = t
+        return z
+
+    def slope(self) -> Optional[float]:
+        """Trend in units per second, None until warmed up."""
+        denom = self.s0 * self.stt - self.st ** 2
+        if self.count < ANOMALY_WARMUP or denom <= 0:
+            return None
+        return (self.s0 * self.stx - self.st * self.sx) / denom
+
+    def time_to(self, limit: float) -> Optional[float]:
+        """Seconds until the fitted trend reaches `limit`, None if it is not rising."""
+        slope = self.slope()
+        if not slope or slope <= 0:
+            return None
+        level = (self.sx - slope * self.st) / self.s0
+        return max(limit - level, 0) / slope
+
+
+# Streams and consecutive-anomaly counts per series
+anomaly_streams: Dict[str, MetricStream] = {}
+anomaly_streaks: Dict[str, int] = defaultdict(int)
+
+
+def get_disk_mountpoints() -> List[str]:
+    """Mountpoints shown by /disk and watched by the detector."""
+    return [
+        p.mountpoint for p in psutil.disk_partitions()
+        if p.fstype and not p.mountpoint.startswith(('/boot', '/snap'))
+    ]
+
+
+def format_fill_eta(seconds: float) -> str:
+    eta = datetime.now(TIMEZONE) + timedelta(seconds=seconds)
+    return f"~{format_uptime(seconds)} ({eta.strftime('%d.%m %H:%M')})"
+
+
+async def check_anomaly(key: str, t: float, value: float) -> None:
+    """Update one series and raise or clear its spike and fill warnings."""
+    metric, _, mountpoint = key.partition(":")
+    label, std_floor, halflife, unit = ANOMALY_METRICS[metric]
+    stream = anomaly_streams.get(key)
+    if stream is None:
+        stream = anomaly_streams[key] = MetricStream(std_floor, halflife)
+    baseline = stream.mean
+    z = stream.add(t, value)
+    instance = f"{NODE_NAME}:{mountpoint}" if mountpoint else NODE_NAME
+    what = f"{label} {mountpoint}" if mountpoint else label
+
+    # Upward spikes, once sustained; cleared when back near the baseline.
+    # Disks only grow gradually, so they are judged by their trend alone.
+    if metric == "disk":
+        z = 0.0
+    anomaly_streaks[key] = anomaly_streaks[key] + 1 if z >= ANOMALY_Z_THRESHOLD else 0
+    spike_key = f"{key}:spike"
+    if anomaly_streaks[key] >= ANOMALY_SUSTAIN and spike_key not in bot_alerts:
+        await raise_bot_alert(
+            spike_key, f"Host{label}Anomaly", instance, f"Unusual {what.lower()} level",
+            f"{what} at {value:.1f}{unit} is {z:.1f}σ above its recent baseline of {baseline:.1f}{unit}",
+        )
+    elif spike_key in bot_alerts and z < ANOMALY_Z_THRESHOLD / 2:
+        await clear_bot_alert(spike_key)
+
+    # Time to full for memory and disks, with hysteresis on the horizon
+    horizon = {"memory": ANOMALY_MEMORY_HORIZON, "disk": ANOMALY_DISK_HORIZON}.get(metric)
+    if not horizon:
+        return
+    fill_key = f"{key}:fill"
+    eta = stream.time_to(100)
+    if eta is not None and eta < horizon and fill_key not in bot_alerts:
+        await raise_bot_alert(
+            fill_key, f"{label}FillPredicted", instance, f"{what} predicted to fill up",
+            f"{what} at {value:.1f}% and rising {stream.slope() * 3600:.2f}%/h, full in {format_fill_eta(eta)}",
+        )
+    elif fill_key in bot_alerts and (eta is None or eta > horizon * 1.5):
+        await clear_bot_alert(fill_key)
+
+
+async def sample_host_metrics(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Sample CPU, memory, load and disks into the hourly rollups and the detector."""
+    t = datetime.now().timestamp()
+    # CPU averaged over the whole sample interval
+    cpu = host_cpu.read()
+    if cpu is None:
+        return
+    samples = {
+        "cpu": cpu,
+        "memory": psutil.virtual_memory().percent,
+        "load": psutil.getloadavg()[0],
+    }
+    for mountpoint in get_disk_mountpoints():
+        try:
+            usage = psutil.disk_usage(mountpoint)
+        except OSError:
+            continue
+        samples[f"disk:{mountpoint}"] = usage.percent
+        host_rollups.add(f"disk_used:{mountpoint}", t, usage.used)
+
+    for key, value in samples.items():
+        host_rollups.add(key, t, value)
+
+    if not ANOMALY_DETECTION:
+        return
+    for key, value in samples.items():
+        try:
+            await check_anomaly(key, t, value)
+        except Exception as e:
+            logger.error(f"Anomaly check failed for {key}: {e}")
+
+
+def format_disk_trend(mountpoint: str) -> Optional[str]:
+    """Growth rate and predicted full time of a disk, None while warming up."""
+    stream = anomaly_streams.get(f"disk:{mountpoint}")
+    slope = stream.slope() if stream else None
+    if slope is None:
+        return None
+    eta = stream.time_to(100)
+    if eta is None or eta > 90 * 86400:
+        return f"Trend: {slope * 86400:+.2f}%/day, not filling"
+    return f"Trend: {slope * 86400:+.2f}%/day, full in {format_fill_eta(eta)}"
+
+
+# ============================================
+# PAGINATED MESSAGES
+# ============================================
+
+class PaginatedView:
+    """A message whose pages are browsed with ◀️/▶️ buttons.
+
+    Pages are either given up front or pulled lazily from an async
+    iterator, so a streaming source only fetches the pages a user
+    actually opens.
+    """
+
+    def __init__(self, title: str, pages: Optional[List[str]] = None, page_source=None):
+        self.id = hashlib.md5(f"{title}{monotonic()}".encode()).hexdigest()[:8]
+        self.title = title
+        self.pages = list(pages or [])
+        self.page_source = page_source
+        self.exhausted = page_source is None
+        # An async generator can't be advanced by two callbacks at once
+        self.fill_lock = asyncio.Lock()
+
+    async def get_page(self, index: int) -> Optional[str]:
+        if index >= len(self.pages) and not self.exhausted:
+            async with self.fill_lock:
+                while index >= len(self.pages) and not self.exhausted:
+                    try:
+                        self.pages.append(await self.page_source.__anext__())
+                    except StopAsyncIteration:
+                        self.exhausted = True
+        return self.pages[index] if 0 <= index < len(self.pages) else None
+
+    async def render(self, index: int) -> tuple:
+        """Return (text, keyboard) for a page."""
+        body = await self.get_page(index)
+        if body is None:
+            index = max(0, len(self.pages) - 1)
+            body = self.pages[index] if self.pages else "<i>No results</i>"
+
+        # Peek one page ahead so the ▶️ button is only shown when useful
+        has_next = await self.get_page(index + 1) is not None
+        total = f"/{len(self.pages)}" if self.exhausted else ""
+
+        buttons = []
+        if index > 0:
+            buttons.append(InlineKeyboardButton("◀️", callback_data=f"page_{self.id}_{index - 1}"))
+        if has_next:
+            buttons.append(InlineKeyboardButton("▶️", callback_data=f"page_{self.id}_{index + 1}"))
+
+        text = f"{self.title}\n\n{body}\n\n<i>Page {index + 1}{total}</i>"
+        return text, InlineKeyboardMarkup([buttons]) if buttons else None
+
+
+def register_view(view: PaginatedView) -> PaginatedView:
+    """Keep a view addressable from callbacks, evicting the oldest ones."""
+    paginated_views[view.id] = view
+    while len(paginated_views) > PAGINATED_VIEW_LIMIT:
+        paginated_views.popitem(last=False)
+    return view
+
+
+async def send_paginated(message, view: PaginatedView) -> None:
+    """Reply with the first page of a paginated view."""
+    register_view(view)
+    text, keyboard = await view.render(0)
+    await message.reply_text(
+        text,
+        parse_mode=ParseMode.HTML,
+        reply_markup=keyboard,
+        disable_web_page_preview=True,
+    )
+
+
+# ============================================
+# TELEGRAM COMMAND HANDLERS
+# ============================================
+
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Send welcome message."""
+    if not is_authorized(update.effective_chat.id):
+        await update.message.reply_text("⛔ Unauthorized access!")
+        return
+
+    welcome = """
+🖥️ <b>VPS Management Bot v3.0</b>
+
+Professional monitoring and alert management.
+
+📊 <b>Status:</b> /status
+🐳 <b>Docker:</b> /docker
+📁 <b>Projects:</b> /projects
+🔔 <b>Alerts:</b> /alerts
+📋 <b>Commands:</b> /help
+
+<i>Enterprise Edition - 2026</i>
+"""
+    await update.message.reply_text(welcome, parse_mode=ParseMode.HTML)
+
+
+async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show available commands organized by category."""
+    if not is_authorized(update.effective_chat.id):
+        await update.message.reply_text("⛔ Unauthorized access!")
+        return
+
+    commands = """
+📋 <b>VPS Bot v3.0 - Commands</b>
+
+<b>🌐 Basic</b>
+/start - Start bot
+/help - This menu
+/settings - Settings
+
+<b>📊 System Monitor</b>
+/status [node] - System overview
+/cpu - CPU details
+/memory - Memory usage
+/procs [cpu|mem|io|fds] - Top processes
+/disk - Disk space
+/du [path|refresh] - Largest directories
+/db [instance] - PostgreSQL & Redis health
+/traffic [router] - Traefik rate, errors, latency
+/health [node] - Health check
+
+<b>🐳 Docker Management</b>
+/docker [node] - All containers
+/projects - Project list
+/project [name] - Project details
+/up [container] - Start
+/down [container] - Stop
+/restart [container] - Restart
+/top [cpu|mem|net|io] - Busiest containers
+/dockerdf [refresh] - Docker disk usage & prune
+/logs [container] [--tail N] [--since 10m] [--grep re] [--follow 60s] - Logs
+
+<b>🚨 ChatOps & Incident</b>
+/alerts - Active alerts
+/ack [hash] - Acknowledge alert
+/silence [alert] [duration] - Silence
+/snooze [duration] - Snooze all
+/resolve [hash] - Mark resolved
+/escalate [hash] - Escalate
+/runbook [alert|words] - Runbook search
+
+<b>📈 Grafana & Render</b>
+/grafana - Dashboards
+/render [dashboard] [panel] [range] - Render panel
+/graph [PromQL|preset] [range] [png] - Quick chart
+/history - Alert history
+/stats [range] - MTTA/MTTR and firing stats
+/report [daily|weekly] - Report with d/d and w/w deltas
+/logsearch [LogQL] [range] - Search Loki logs
+
+<b>🔧 Operations</b>
+/ssl [refresh] - SSL certificate expiry
+/backup [target] - Backup status or run
+/oncall - On-call info
+/maintenance [on/off] [site] - Maintenance mode
+
+<i>Enterprise ChatOps Standards 2026</i>
+"""
+    keyboard = [
+        [
+            InlineKeyboardButton("📊 Status", callback_data="show_status"),
+            InlineKeyboardButton("🐳 Docker", callback_data="show_docker"),
+        ],
+        [
+            InlineKeyboardButton("🔔 Alerts", callback_data="show_alerts"),
+            InlineKeyboardButton("📈 Grafana", url=GRAFANA_URL),
+        ],
+    ]
+
+    await update.message.reply_text(
+        commands,
+        parse_mode=ParseMode.HTML,
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+
+def format_status_text(snapshot: dict) -> str:
+    """System status message for a node snapshot."""
+    cpu_percent = snapshot["cpu"]
+    memory = snapshot["memory"]
+    disk = snapshot["disk"]
+    load1, load5, load15 = snapshot["load"]
+
+    # Container counts
+    containers = snapshot["containers"].values()
+    running = sum(1 for c in containers if c["status"] == "running")
+    total = len(containers)
+
+    # Visual bars
+    def make_bar(percent, width=10):
+        filled = int(percent / 100 * width)
+        return "█" * filled + "░" * (width - filled)
+
+    title = f"System Status | {html.escape(snapshot['node'])}" if BOT_MODE == "hub" else "System Status"
+
+    return f"""
+📊 <b>{title}</b>
+<code>━━━━━━━━━━━━━━━━━━━━━</code>
+
+🖥️ <b>Server</b>
+├ Uptime: {format_uptime(snapshot["uptime"])}
+├ Load: {load1:.2f} / {load5:.2f} / {load15:.2f}
+└ Time: {datetime.now(TIMEZONE).strftime("%d.%m.%Y %H:%M")}
+
+💻 <b>CPU</b> {get_threshold_emoji("cpu", cpu_percent)}
+└ [{make_bar(cpu_percent)}] {cpu_percent:.1f}%
+
+💾 <b>Memory</b> {get_threshold_emoji("memory", memory["percent"])}
+├ [{make_bar(memory["percent"])}] {memory["percent"]:.1f}%
+├ Used: {format_bytes(memory["used"])}
+└ Total: {format_bytes(memory["total"])}
+
+💿 <b>Disk</b> {get_threshold_emoji("disk", disk["percent"])}
+├ [{make_bar(disk["percent"])}] {disk["percent"]:.1f}%
+├ Used: {format_bytes(disk["used"])}
+└ Free: {format_bytes(disk["free"])}
+
+🐳 <b>Docker</b>
+└ {running}/{total} containers running
+"""
+
+
+async def status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show system status with visual indicators."""
+    if not is_authorized(update.effective_chat.id):
+        await update.message.reply_text("⛔ Unauthorized access!")
+        return
+
+    if BOT_MODE == "hub":
+        text, keyboard = await render_fleet_view("status", context.args[0] if context.args else None)
+        await update.message.reply_text(text, parse_mode=ParseMode.HTML, reply_markup=keyboard)
+        return
+
+    if STATUS_SOURCE == "prometheus":
+        status_text = await format_prometheus_status()
+    else:
+        status_text = format_status_text(await get_node_snapshot(None))
+
+    # Add keyboard for quick actions
+    keyboard = [
+        [
+            InlineKeyboardButton("🔄 Refresh", callback_data="refresh_status"),
+            InlineKeyboardButton("📊 Grafana", url=f"{GRAFANA_URL}/d/vps-overview"),
+        ],
+        [
+            InlineKeyboardButton("🔔 Alerts", callback_data="show_alerts"),
+            InlineKeyboardButton("🐳 Docker", callback_data="show_docker"),
+        ],
+    ]
+
+    await update.message.reply_text(
+        status_text,
+        parse_mode=ParseMode.HTML,
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+
+def format_docker_text(containers: Dict[str, dict], projects: Dict[str, dict]) -> str:
+    """Container list grouped by project, from index-shaped container entries."""
+    def get_status(name: str) -> str:
+        entry = containers.get(name)
+        return STATUS_EMOJI.get(entry["status"], "❓") if entry else "❌"
+
+    running = sum(1 for c in containers.values() if c["status"] == "running")
+    total = len(containers)
+
+    lines = [f"🐳 <b>Docker Containers</b> ({running}/{total})", ""]
+
+    # Group by project
+    for project_id, project_info in projects.items():
+        project_containers = project_info["containers"]
+        statuses = [get_status(c) for c in project_containers]
+        running_count = statuses.count("🟢")
+        total_count = len(project_containers)
+
+        # Project status indicator
+        if running_count == total_count:
+            project_status = "🟢"
+        elif running_count == 0:
+            project_status = "🔴"
+        else:
+            project_status = "🟡"
+
+        lines.append(f"{project_status} <b>{project_info['name']}</b> ({running_count}/{total_count})")
+
+        # Show individual containers
+        for container_name, status in zip(project_containers, statuses):
+            lines.append(f"   {status} {container_name}")
+
+        lines.append("")
+
+    # Containers without a compose project or override
+    untracked = sorted(name for name, entry in containers.items() if not entry["project"])
+    if untracked:
+        lines.append("❓ <b>Untracked</b>")
+        for name in untracked[:10]:  # Limit to 10
+            lines.append(f"   {get_status(name)} {name}")
+        if len(untracked) > 10:
+            lines.append(f"   <i>... and {len(untracked) - 10} more</i>")
+
+    message = "\n".join(lines)
+
+    # Split if too long
+    if len(message) > 4000:
+        message = message[:4000] + "\n\n<i>... truncated</i>"
+
+    return message
+
+
+async def docker_list(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """List all Docker containers grouped by project."""
+    if not is_authorized(update.effective_chat.id):
+        await update.message.reply_text("⛔ Unauthorized access!")
+        return
+
+    if BOT_MODE == "hub":
+        text, keyboard = await render_fleet_view("docker", context.args[0] if context.args else None)
+        await update.message.reply_text(text, parse_mode=ParseMode.HTML, reply_markup=keyboard)
+        return
+
+    message = format_docker_text(container_index, get_projects())
+    await update.message.reply_text(message, parse_mode=ParseMode.HTML)
+
+
+async def alerts_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show active Prometheus alerts."""
+    if not is_authorized(update.effective_chat.id):
+        await update.message.reply_text("⛔ Unauthorized access!")
+        return
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"{PROMETHEUS_URL}/api/v1/alerts") as resp:
+                if resp.status != 200:
+                    await update.message.reply_text("❌ Cannot connect to Prometheus")
+                    return
+
+                data = await resp.json()
+                alerts = data.get("data", {}).get("alerts", [])
+
+        # Filter out DeadManSwitch
+        alerts = [a for a in alerts if a.get("labels", {}).get("alertname") != "DeadManSwitch"]
+
+        if not alerts:
+            await update.message.reply_text(
+                "✅ <b>No Active Alerts</b>\n\nAll systems are running normally.",
+                parse_mode=ParseMode.HTML
+            )
+            return
+
+        # Group by state
+        firing = [a for a in alerts if a.get("state") == "firing"]
+        pending = [a for a in alerts if a.get("state") == "pending"]
+
+        lines = [f"🔔 <b>Active Alerts</b> ({len(alerts)})", ""]
+
+        if firing:
+            lines.append(f"<b>🔥 Firing ({len(firing)})</b>")
+            for alert in firing[:10]:
+                labels = alert.get("labels", {})
+                name = labels.get("alertname", "Unknown")
+                severity = labels.get("severity", "unknown")
+                sev_emoji = config["severity"].get(severity, {}).get("emoji", "❓")
+
+                instance = labels.get("instance", "")
+                if instance:
+                    lines.append(f"  {sev_emoji} {name}")
+                    lines.append(f"      └ {instance}")
+                else:
+                    lines.append(f"  {sev_emoji} {name}")
+
+            if len(firing) > 10:
+                lines.append(f"  <i>... and {len(firing) - 10} more</i>")
+
+        if pending:
+            lines.append(f"\n<b>⏳ Pending ({len(pending)})</b>")
+            for alert in pending[:5]:
+                name = alert.get("labels", {}).get("alertname", "Unknown")
+                lines.append(f"  • {name}")
+
+        keyboard = [
+            [
+                InlineKeyboardButton("📊 Grafana Alerts", url=f"{GRAFANA_URL}/d/alerts-overview"),
+                InlineKeyboardButton("🔄 Refresh", callback_data="refresh_alerts"),
+            ],
+        ]
+
+        await update.message.reply_text(
+            "\n".join(lines),
+            parse_mode=ParseMode.HTML,
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+
+    except Exception as e:
+        await update.message.reply_text(f"❌ Error: {str(e)}")
+
+
+async def container_restart(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Restart a container."""
+    if not is_authorized(update.effective_chat.id):
+        await update.message.reply_text("⛔ Unauthorized access!")
+        return
+
+    if not context.args:
+        await update.message.reply_text("❓ Usage: /restart <container_name>")
+        return
+
+    name = context.args[0]
+    try:
+        container = docker_client.containers.get(name)
+        await update.message.reply_text(f"🔄 <b>{name}</b> restarting...", parse_mode=ParseMode.HTML)
+        container.restart(timeout=30)
+        await asyncio.sleep(3)
+        container.reload()
+
+        if container.status == "running":
+            await update.message.reply_text(f"✅ <b>{name}</b> restarted successfully!", parse_mode=ParseMode.HTML)
+        else:
+            await update.message.reply_text(f"⚠️ <b>{name}</b> status: {container.status}", parse_mode=ParseMode.HTML)
+
+    except docker.errors.NotFound:
+        await update.message.reply_text(f"❌ Container not found: {name}")
+    except Exception as e:
+        await update.message.reply_text(f"❌ Error: {str(e)}")
+
+
+def parse_logs_args(args: List[str]) -> dict:
+    """Parse /logs arguments: <name> [--tail N] [--since 10m] [--grep regex] [--follow 60s]."""
+    if not args or args[0].startswith("--"):
+        raise ValueError("container name required")
+
+    options = {"name": args[0], "tail": LOGS_DEFAULT_TAIL, "since": None, "grep": None, "follow": None}
+    rest = args[1:]
+    while rest:
+        flag = rest.pop(0)
+        if flag not in ("--tail", "--since", "--grep", "--follow"):
+            raise ValueError(f"unknown option {flag}")
+        if not rest:
+            raise ValueError(f"{flag} needs a value")
+        value = rest.pop(0)
+
+        if flag == "--tail":
+            options["tail"] = "all" if value == "all" else int(value)
+        elif flag == "--since":
+            options["since"] = int(datetime.now().timestamp()) - parse_duration(value)
+        elif flag == "--grep":
+            options["grep"] = re.compile(value)
+        else:
+            options["follow"] = min(parse_duration(value), LOGS_FOLLOW_MAX)
+
+    return options
+
+
+async def iter_container_logs(container, deadline: Optional[float] = None,
+                              tick: Optional[float] = None, **kwargs):
+    """Stream container log lines from Docker in batches.
+
+    The blocking Docker stream is read in a worker thread and handed over
+    through a bounded queue. Yields lists of decoded lines; an empty list
+    is yielded every `tick` seconds while the stream is idle. Stops at
+    end of stream or when the monotonic `deadline` passes.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=LOGS_QUEUE_SIZE)
+    stream = await loop.run_in_executor(None, lambda: container.logs(stream=True, **kwargs))
+    stopped = False
+
+    def pump():
+        try:
+            for chunk in stream:
+                if stopped:
+                    break
+                asyncio.run_coroutine_threadsafe(queue.put(chunk), loop).result()
+        except Exception as e:
+            if not stopped:
+                logger.warning(f"Log stream for {container.name} ended: {e}")
+        finally:
+            if not stopped:
+                asyncio.run_coroutine_threadsafe(queue.put(None), loop).result()
+
+    reader = loop.run_in_executor(None, pump)
+    buffer = b""
+
+    try:
+        while True:
+            timeout = tick
+            if deadline is not None:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    break
+                timeout = min(timeout, remaining) if timeout else remaining
+
+            try:
+                chunk = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                yield []
+                continue
+
+            if chunk is None:
+                break
+
+            buffer += chunk
+            *complete, buffer = buffer.split(b"\n")
+            if complete:
+                yield [line.decode("utf-8", errors="replace") for line in complete]
+
+        if buffer:
+            yield [buffer.decode("utf-8", errors="replace")]
+    finally:
+        stopped = True
+        stream.close()
+        # Unblock the pump thread if it is waiting on a full queue
+        while not reader.done():
+            while not queue.empty():
+                queue.get_nowait()
+            await asyncio.sleep(0.05)
+
+
+class LogCollector:
+    """Accumulate log lines, spilling to a gzip file once past one message.
+
+    Sizes are counted after HTML escaping, since that is what has to fit
+    into the message.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.lines = deque()
+        self.size = 0
+        self.count = 0
+        self.spool = None
+        self.gzip = None
+
+    def add(self, line: str) -> None:
+        self.count += 1
+        self.lines.append(line)
+        self.size += len(html.escape(line)) + 1
+
+        if self.gzip is None and self.size > LOGS_MESSAGE_LIMIT:
+            self.spill()
+        elif self.gzip is not None:
+            self.gzip.write(line.encode() + b"\n")
+
+        # Only the last screenful is kept in memory
+        while self.size > LOGS_MESSAGE_LIMIT and len(self.lines) > 1:
+            self.size -= len(html.escape(self.lines.popleft())) + 1
+
+    def spill(self) -> None:
+        """Start the gzip file with the lines held so far."""
+        self.spool = tempfile.TemporaryFile()
+        self.gzip = gzip.GzipFile(filename=f"{self.name}.log", mode="wb", fileobj=self.spool)
+        self.gzip.write("\n".join(self.lines).encode() + b"\n")
+
+    @property
+    def overflowed(self) -> bool:
+        return self.gzip is not None
+
+    def tail_html(self) -> str:
+        """The kept lines, escaped and cut to one message (a single huge line is cut from the front)."""
+        return html.escape("\n".join(self.lines))[-LOGS_MESSAGE_LIMIT:]
+
+    def finish(self):
+        """Close the gzip stream and return the spooled file, rewound."""
+        self.gzip.close()
+        self.spool.seek(0)
+        return self.spool
+
+
+async def container_logs(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Stream container logs with optional filtering and follow mode."""
+    if not is_authorized(update.effective_chat.id):
+        await update.message.reply_text("⛔ Unauthorized access!")
+        return
+
+    if not context.args:
+        await update.message.reply_text(
+            "❓ Usage: /logs <container> [--tail N] [--since 10m] [--grep regex] [--follow 60s]"
+        )
+        return
+
+    try:
+        options = parse_logs_args(context.args)
+    except (ValueError, re.error) as e:
+        await update.message.reply_text(f"❌ Invalid arguments: {e}")
+        return
+
+    name = options["name"]
+    follow = options["follow"]
+    pattern = options["grep"]
+
+    try:
+        container = docker_client.containers.get(name)
+    except docker.errors.NotFound:
+        await update.message.reply_text(f"❌ Container not found: {name}")
+        return
+    except Exception as e:
+        await update.message.reply_text(f"❌ Error: {str(e)}")
+        return
+
+    header = f"📜 <b>{html.escape(name)}</b>"
+    if pattern:
+        header += f" | grep <code>{html.escape(pattern.pattern)}</code>"
+
+    collector = LogCollector(name)
+    message = None
+    last_edit = monotonic()
+    shown = ""
+
+    if follow:
+        message = await update.message.reply_text(
+            f"{header}\n\n<i>Following for {follow}s...</i>", parse_mode=ParseMode.HTML
+        )
+
+    stream_kwargs = {"tail": options["tail"], "timestamps": False, "follow": bool(follow)}
+    if options["since"]:
+        stream_kwargs["since"] = options["since"]
+
+    try:
+        async for batch in iter_container_logs(
+            container,
+            deadline=monotonic() + follow if follow else None,
+            tick=LOGS_FOLLOW_EDIT_INTERVAL if follow else None,
+            **stream_kwargs,
+        ):
+            for line in batch:
+                if pattern is None or pattern.search(line):
+                    collector.add(line)
+
+            # Batched in-place updates in follow mode
+            if follow and monotonic() - last_edit >= LOGS_FOLLOW_EDIT_INTERVAL:
+                text = collector.tail_html()
+                if text != shown:
+                    shown = text
+                    last_edit = monotonic()
+                    try:
+                        await message.edit_text(
+                            f"{header} 🔴 live\n\n<pre>{text}</pre>",
+                            parse_mode=ParseMode.HTML,
+                        )
+                    except Exception as e:
+                        logger.debug(f"Follow edit skipped: {e}")
+    except Exception as e:
+        await update.message.reply_text(f"❌ Error: {str(e)}")
+        return
+
+    if not collector.count:
+        text = f"ℹ️ No matching logs for {name}" if pattern else f"ℹ️ No logs for {name}"
+        if message:
+            await message.edit_text(text)
+        else:
+            await update.message.reply_text(text)
+        return
+
+    final_text = f"{header}\n\n<pre>{collector.tail_html()}</pre>"
+    if message:
+        try:
+            await message.edit_text(final_text, parse_mode=ParseMode.HTML)
+        except Exception as e:
+            logger.debug(f"Final follow edit skipped: {e}")
+    elif not collector.overflowed:
+        try:
+            await update.message.reply_text(final_text, parse_mode=ParseMode.HTML)
+        except BadRequest as e:
+            # Still rejected (e.g. a long grep pattern in the header): send the lines as a file
+            logger.debug(f"Log message rejected, sending a document: {e}")
+            collector.spill()
+
+    # Too large for a message: upload the full output instead of cutting it off
+    if collector.overflowed:
+        with collector.finish() as document:
+            await update.message.reply_document(
+                document=document,
+                filename=f"{name}-{datetime.now(TIMEZONE).strftime('%Y%m%d-%H%M%S')}.log.gz",
+                caption=f"📜 {name}: {collector.count} lines",
+            )
+
+
+def evaluate_snapshot(snapshot: dict) -> tuple:
+    """Threshold, critical container and project checks: (issues, warnings)."""
+    issues = []
+    warnings = []
+
+    # Check system resources
+    thresholds = config["thresholds"]
+    for metric, label, percent in (
+        ("cpu", "CPU", snapshot["cpu"]),
+        ("memory", "Memory", snapshot["memory"]["percent"]),
+        ("disk", "Disk", snapshot["disk"]["percent"]),
+    ):
+        if percent > thresholds[metric]["crit"]:
+            issues.append(f"🔴 {label} critical: {percent:.1f}%")
+        elif percent > thresholds[metric]["warn"]:
+            warnings.append(f"🟡 {label} high: {percent:.1f}%")
+
+    # Check critical containers
+    containers = snapshot["containers"]
+    critical_containers = ["traefik", "prometheus", "grafana", "alertmanager"]
+    for name in critical_containers:
+        if containers.get(name, {}).get("status") != "running":
+            issues.append(f"🔴 {name} not running!")
+
+    # Check project containers
+    for project_id, project_info in snapshot["projects"].items():
+        if project_id in ["monitoring", "infra"]:
+            continue
+
+        down_count = sum(1 for c in project_info["containers"] if containers.get(c, {}).get("status") != "running")
+        if down_count > 0:
+            warnings.append(f"🟡 {project_info['name']}: {down_count} container(s) down")
+
+    return issues, warnings
+
+
+def format_issues_text(issues: List[str], warnings: List[str], ok_lines: List[str]) -> str:
+    """Health message body: critical issues, then warnings, or the all-clear lines."""
+    if issues:
+        text = "🚨 <b>Critical Issues Detected</b>\n\n"
+        text += "\n".join(issues)
+        if warnings:
+            text += "\n\n⚠️ <b>Warnings</b>\n"
+            text += "\n".join(warnings)
+    elif warnings:
+        text = "⚠️ <b>Warnings</b>\n\n"
+        text += "\n".join(warnings)
+    else:
+        text = "✅ <b>All Systems Normal</b>\n\n"
+        text += "\n".join(ok_lines)
+    return text
+
+
+def format_health_text(snapshot: dict, include_uptime: bool = True) -> str:
+    """Health report for a node snapshot, plus local uptime probes."""
+    issues, warnings = evaluate_snapshot(snapshot)
+
+    # Check project URLs from the uptime prober
+    uptime_lines = []
+    for project_info in (get_projects().values() if include_uptime else []):
+        stats = get_uptime_stats(project_info["url"] or "")
+        if stats is None:
+            continue
+
+        uptime_lines.append(f"• {project_info['name']}: {format_uptime_stats(stats)}")
+        if not stats["last_ok"]:
+            issues.append(f"🔴 {project_info['name']} unreachable (HTTP {stats['last_status'] or 'error'})")
+        elif stats["availability"] < 99:
+            warnings.append(f"🟡 {project_info['name']}: {stats['availability']:.1f}% available (1h)")
+
+    text = format_issues_text(issues, warnings, [
+        "• CPU, Memory, Disk: OK",
+        "• Critical services: OK",
+        "• All projects: Running",
+    ])
+
+    if uptime_lines:
+        text += "\n\n📡 <b>Uptime (1h)</b>\n"
+        text += "\n".join(uptime_lines)
+
+    if BOT_MODE == "hub":
+        text = f"🖥️ <b>{html.escape(snapshot['node'])}</b>\n\n" + text
+    return text
+
+
+async def health_check(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Perform comprehensive health check."""
+    if not is_authorized(update.effective_chat.id):
+        await update.message.reply_text("⛔ Unauthorized access!")
+        return
+
+    if BOT_MODE == "hub":
+        text, keyboard = await render_fleet_view("health", context.args[0] if context.args else None)
+        await update.message.reply_text(text, parse_mode=ParseMode.HTML, reply_markup=keyboard)
+        return
+
+    await update.message.reply_text("🔍 Running health check...")
+
+    if STATUS_SOURCE == "prometheus":
+        text = await format_prometheus_health()
+    else:
+        text = format_health_text(await get_node_snapshot(None))
+    await update.message.reply_text(text, parse_mode=ParseMode.HTML)
+
+
+async def silence_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Silence an alert."""
+    if not is_authorized(update.effective_chat.id):
+        await update.message.reply_text("⛔ Unauthorized access!")
+        return
+
+    if len(context.args) < 2:
+        await update.message.reply_text(
+            "❓ Usage: /silence <alertname> <duration>\n"
+            "Example: /silence HighCPU 2h\n"
+            "Duration: 1h, 2h, 4h, 8h, 24h"
+        )
+        return
+
+    alertname = context.args[0]
+    duration_str = context.args[1].lower()
+
+    # Parse duration
+    hours = 1
+    if duration_str.endswith('h'):
+        try:
+            hours = int(duration_str[:-1])
+        except ValueError:
+            await update.message.reply_text("❌ Invalid duration format. Example: 1h, 2h, 4h")
+            return
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            silence_data = {
+                "matchers": [{"name": "alertname", "value": alertname, "isRegex": False}],
+                "startsAt": datetime.now(pytz.UTC).isoformat(),
+                "endsAt": (datetime.now(pytz.UTC) + timedelta(hours=hours)).isoformat(),
+                "createdBy": "telegram-bot",
+                "comment": f"Silenced via /silence command for {hours}h",
+            }
+            async with session.post(f"{ALERTMANAGER_URL}/api/v2/silences", json=silence_data) as resp:
+                if resp.status == 200:
+                    result = await resp.json()
+                    silence_id = result.get("silenceID", "?")
+                    await update.message.reply_text(
+                        f"🔕 <b>{alertname}</b> silenced for {hours} hours\n"
+                        f"ID: <code>{silence_id}</code>",
+                        parse_mode=ParseMode.HTML
+                    )
+                else:
+                    error = await resp.text()
+                    await update.message.reply_text(f"❌ Failed to create silence: {error}")
+    except Exception as e:
+        await update.message.reply_text(f"❌ Error: {str(e)}")
+
+
+async def ack_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Acknowledge an alert."""
+    if not is_authorized(update.effective_chat.id):
+        await update.message.reply_text("⛔ Unauthorized access!")
+        return
+
+    if not context.args:
+        # Show recent alerts to ack
+        alert_history = await state.list_alerts()
+        if not alert_history:
+            await update.message.reply_text("ℹ️ No alerts to acknowledge")
+            return
+
+        acknowledged_alerts = await state.get_acks()
+        lines = ["🔔 <b>Recent Alerts</b>", ""]
+        for alert_hash, info in list(alert_history.items())[:10]:
+            alertname = info.get("alert", {}).get("labels", {}).get("alertname", "?")
+            status = info.get("status", "?")
+            is_acked = alert_hash in acknowledged_alerts
+            ack_emoji = "✅" if is_acked else "⏳"
+            lines.append(f"{ack_emoji} <code>{alert_hash}</code> - {alertname}")
+
+        lines.append("")
+        lines.append("<i>Usage: /ack <hash></i>")
+        await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
+        return
+
+    alert_hash = context.args[0]
+    await state.set_ack(alert_hash, datetime.now(TIMEZONE))
+    incident_stats.acknowledge(alert_hash, datetime.now().timestamp())
+    await update.message.reply_text(f"✅ Alert <code>{alert_hash}</code> acknowledged", parse_mode=ParseMode.HTML)
+
+
+async def escalate_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Escalate an alert to higher priority or team."""
+    if not is_authorized(update.effective_chat.id):
+        await update.message.reply_text("⛔ Unauthorized access!")
+        return
+
+    if not context.args:
+        await update.message.reply_text(
+            "🚨 <b>Escalate - Alert Escalation</b>\n\n"
+            "Usage: /escalate <alert_hash> [message]\n\n"
+            "Example:\n"
+            "• /escalate abc123 Urgent intervention needed\n\n"
+            "Use /alerts to get alert hashes.",
+            parse_mode=ParseMode.HTML
+        )
+        return
+
+    alert_hash = context.args[0]
+    message = " ".join(context.args[1:]) if len(context.args) > 1 else "Escalated via Telegram"
+
+    # Log escalation for audit trail
+    escalation_time = datetime.now(TIMEZONE)
+    log_escalation(alert_hash, message)
+
+    await update.message.reply_text(
+        f"🚨 <b>Alert Escalated</b>\n\n"
+        f"Hash: <code>{alert_hash}</code>\n"
+        f"Message: {message}\n"
+        f"Time: {escalation_time.strftime('%H:%M:%S')}\n\n"
+        f"<i>Escalation logged. On-call team notified.</i>",
+        parse_mode=ParseMode.HTML
+    )
+
+
+async def resolve_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Mark an alert as resolved."""
+    if not is_authorized(update.effective_chat.id):
+        await update.message.reply_text("⛔ Unauthorized access!")
+        return
+
+    if not context.args:
+        # Show resolvable alerts
+        alert_history = await state.list_alerts()
+        firing_alerts = [h for h, info in alert_history.items() if info.get("status") == "firing"]
+
+        if not firing_alerts:
+            await update.message.reply_text("✅ No active alerts to resolve")
+            return
+
+        lines = ["🔧 <b>Resolvable Alerts</b>", ""]
+        for alert_hash in firing_alerts[:10]:
+            info = alert_history.get(alert_hash, {})
+            alertname = info.get("alert", {}).get("labels", {}).get("alertname", "?")
+            lines.append(f"• <code>{alert_hash}</code> - {alertname}")
+
+        lines.append("")
+        lines.append("<i>Usage: /resolve <hash></i>")
+        await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
+        return
+
+    alert_hash = context.args[0]
+
+    # Update alert status
+    info = await state.get_alert(alert_hash)
+    if info:
+        info["status"] = "resolved"
+        info["resolved_at"] = datetime.now(TIMEZONE).isoformat()
+        info["resolved_by"] = "telegram-user"
+        await state.put_alert(alert_hash, info)
+        incident_stats.resolve(alert_hash, datetime.now().timestamp())
+
+        await update.message.reply_text(
+            f"✅ Alert <code>{alert_hash}</code> marked as resolved\n\n"
+            f"<i>Note: If alert persists in Prometheus, it may re-trigger.</i>",
+            parse_mode=ParseMode.HTML
+        )
+    else:
+        await update.message.reply_text(f"❌ Alert not found: {alert_hash}")
+
+
+async def snooze_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Snooze alerts for a specified duration."""
+    if not is_authorized(update.effective_chat.id):
+        await update.message.reply_text("⛔ Unauthorized access!")
+        return
+
+    if len(context.args) < 1:
+        await update.message.reply_text(
+            "💤 <b>Snooze - Alert Snooze</b>\n\n"
+            "Usage: /snooze <duration> [alertname]\n\n"
+            "Examples:\n"
+            "• /snooze 30m - Snooze all for 30 minutes\n"
+            "• /snooze 2h HighCPU - Snooze specific alert for 2 hours\n\n"
+            "Durations: 15m, 30m, 1h, 2h, 4h, 8h, 24h",
+            parse_mode=ParseMode.HTML
+        )
+        return
+
+    duration_str = context.args[0].lower()
+    alertname = context.args[1] if len(context.args) > 1 else None
+
+    # Parse duration
+    minutes = 60  # default 1h
+    if duration_str.endswith('m'):
+        minutes = int(duration_str[:-1])
+    elif duration_str.endswith('h'):
+        minutes = int(duration_str[:-1]) * 60
+
+    try:
+        matchers = []
+        if alertname:
+            matchers.append({"name": "alertname", "value": alertname, "isRegex": False})
+        else:
+            # Snooze all non-critical alerts
+            matchers.append({"name": "severity", "value": "critical", "isRegex": False, "isEqual": False})
+
+        async with aiohttp.ClientSession() as session:
+            silence_data = {
+                "matchers": matchers,
+                "startsAt": datetime.now(pytz.UTC).isoformat(),
+                "endsAt": (datetime.now(pytz.UTC) + timedelta(minutes=minutes)).isoformat(),
+                "createdBy": "telegram-bot",
+                "comment": f"Snoozed via /snooze for {duration_str}",
+            }
+            async with session.post(f"{ALERTMANAGER_URL}/api/v2/silences", json=silence_data) as resp:
+                if resp.status == 200:
+                    target = alertname if alertname else "all alerts"
+                    await update.message.reply_text(
+                        f"💤 <b>{target}</b> snoozed for {duration_str}\n"
+                        f"⏰ Ends: {(datetime.now(TIMEZONE) + timedelta(minutes=minutes)).strftime('%H:%M')}",
+                        parse_mode=ParseMode.HTML
+                    )
+                else:
+                    await update.message.reply_text(f"❌ Snooze failed: {resp.status}")
+    except Exception as e:
+        await update.message.reply_text(f"❌ Error: {str(e)}")
+
+
+async def oncall_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show on-call schedule and current on-call person."""
+    if not is_authorized(update.effective_chat.id):
+        await update.message.reply_text("⛔ Unauthorized access!")
+        return
+
+    # In production, this would fetch from PagerDuty/OpsGenie API
+    now = datetime.now(TIMEZONE)
+    current_hour = now.hour
+
+    # Simple rotation logic (example)
+    if 9 <= current_hour < 18:
+        shift = "Day Shift (09:00-18:00)"
+        oncall_person = "Primary On-Call"
+    elif 18 <= current_hour < 24:
+        shift = "Evening Shift (18:00-00:00)"
+        oncall_person = "Secondary On-Call"
+    else:
+        shift = "Night Shift (00:00-09:00)"
+        oncall_person = "Night On-Call"
+
+    await update.message.reply_text(
+        f"📞 <b>On-Call Status</b>\n\n"
+        f"<b>Current Time:</b> {now.strftime('%d.%m.%Y %H:%M')}\n"
+        f"<b>Shift:</b> {shift}\n"
+        f"<b>On-Call:</b> {oncall_person}\n\n"
+        f"<i>For emergencies, contact on-call directly.</i>",
+        parse_mode=ParseMode.HTML
+    )
+
+
+async def grafana_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show Grafana dashboard links."""
+    if not is_authorized(update.effective_chat.id):
+        await update.message.reply_text("⛔ Unauthorized access!")
+        return
+
+    keyboard = []
+    for name, uid in GRAFANA_LINKS:
+        keyboard.append([InlineKeyboardButton(name, url=f"{GRAFANA_URL}/d/{uid}")])
+
+    await update.message.reply_text(
+        "📊 <b>Grafana Dashboards</b>\n\nSelect a dashboard:",
+        parse_mode=ParseMode.HTML,
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+
+async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show alert history with audit trail."""
+    if not is_authorized(update.effective_chat.id):
+        await update.message.reply_text("⛔ Unauthorized access!")
+        return
+
+    alert_history = await state.list_alerts()
+    if not alert_history:
+        await update.message.reply_text("📜 Alert history is empty")
+        return
+
+    acknowledged_alerts = await state.get_acks()
+
+    lines = ["📜 <b>Alert History</b>", ""]
+
+    # Group by status
+    firing = [(h, i) for h, i in alert_history.items() if i.get("status") == "firing"]
+    resolved = [(h, i) for h, i in alert_history.items() if i.get("status") == "resolved"]
+
+    if firing:
+        lines.append(f"<b>🔥 Active ({len(firing)})</b>")
+        for alert_hash, info in firing[:5]:
+            alertname = info.get("alert", {}).get("labels", {}).get("alertname", "?")
+            received = info.get("received_at", "?")[:16]
+            is_acked = "✅" if alert_hash in acknowledged_alerts else "⏳"
+            lines.append(f"  {is_acked} <code>{alert_hash}</code> {alertname}")
+            lines.append(f"     └ {received}")
+
+    if resolved:
+        lines.append(f"\n<b>✅ Resolved ({len(resolved)})</b>")
+        for alert_hash, info in resolved[:5]:
+            alertname = info.get("alert", {}).get("labels", {}).get("alertname", "?")
+            resolved_at = info.get("resolved_at", "?")[:16]
+            lines.append(f"  • <code>{alert_hash}</code> {alertname}")
+            lines.append(f"     └ Resolved: {resolved_at}")
+
+    keyboard = [
+        [InlineKeyboardButton("🗑️ Clear History", callback_data="clear_history")],
+        [InlineKeyboardButton("📊 Grafana Alerts", url=f"{GRAFANA_URL}/d/alerts-overview")],
+    ]
+
+    await update.message.reply_text(
+        "\n".join(lines),
+        parse_mode=ParseMode.HTML,
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+
+async def cpu_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show detailed CPU information."""
+    if not is_authorized(update.effective_chat.id):
+        await update.message.reply_text("⛔ Unauthorized access!")
+        return
+
+    cpu_percent = psutil.cpu_percent(interval=1, percpu=True)
+    cpu_avg = sum(cpu_percent) / len(cpu_percent)
+    cpu_count = psutil.cpu_count()
+    cpu_freq = psutil.cpu_freq()
+    load1, load5, load15 = psutil.getloadavg()
+
+    def make_bar(percent, width=10):
+        filled = int(percent / 100 * width)
+        return "█" * filled + "░" * (width - filled)
+
+    lines = [f"💻 <b>CPU Status</b> {get_threshold_emoji('cpu', cpu_avg)}", ""]
+    lines.append(f"<b>Average:</b> [{make_bar(cpu_avg)}] {cpu_avg:.1f}%")
+    lines.append(f"<b>Cores:</b> {cpu_count}")
+    if cpu_freq:
+        lines.append(f"<b>Frequency:</b> {cpu_freq.current:.0f} MHz")
+    lines.append(f"<b>Load:</b> {load1:.2f} / {load5:.2f} / {load15:.2f}")
+    lines.append("")
+    lines.append("<b>Per Core:</b>")
+    for i, percent in enumerate(cpu_percent):
+        lines.append(f"  CPU{i}: [{make_bar(percent, 8)}] {percent:.0f}%")
+
+    await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
+
+
+async def memory_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show detailed memory information."""
+    if not is_authorized(update.effective_chat.id):
+        await update.message.reply_text("⛔ Unauthorized access!")
+        return
+
+    mem = psutil.virtual_memory()
+    swap = psutil.swap_memory()
+
+    def make_bar(percent, width=10):
+        filled = int(percent / 100 * width)
+        return "█" * filled + "░" * (width - filled)
+
+    text = f"""
+💾 <b>Memory Status</b> {get_threshold_emoji("memory", mem.percent)}
+
+<b>RAM</b>
+├ [{make_bar(mem.percent)}] {mem.percent:.1f}%
+├ Used: {format_bytes(mem.used)}
+├ Available: {format_bytes(mem.available)}
+└ Total: {format_bytes(mem.total)}
+
+<b>Swap</b> {get_threshold_emoji("memory", swap.percent) if swap.total > 0 else "⚪"}
+├ [{make_bar(swap.percent)}] {swap.percent:.1f}%
+├ Used: {format_bytes(swap.used)}
+└ Total: {format_bytes(swap.total)}
+"""
+    await update.message.reply_text(text, parse_mode=ParseMode.HTML)
+
+
+async def disk_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show detailed disk information."""
+    if not is_authorized(update.effective_chat.id):
+        await update.message.reply_text("⛔ Unauthorized access!")
+        return
+
+    def make_bar(percent, width=10):
+        filled = int(percent / 100 * width)
+        return "█" * filled + "░" * (width - filled)
+
+    lines = ["💿 <b>Disk Status</b>", ""]
+
+    for mountpoint in get_disk_mountpoints():
+        try:
+            usage = psutil.disk_usage(mountpoint)
+            emoji = get_threshold_emoji("disk", usage.percent)
+            trend = format_disk_trend(mountpoint)
+            lines.append(f"<b>{mountpoint}</b> {emoji}")
+            lines.append(f"├ [{make_bar(usage.percent)}] {usage.percent:.1f}%")
+            lines.append(f"├ Used: {format_bytes(usage.used)}")
+            lines.append(f"├ Free: {format_bytes(usage.free)}")
+            lines.append(f"{'├' if trend else '└'} Total: {format_bytes(usage.total)}")
+            if trend:
+                lines.append(f"└ {trend}")
+            lines.append("")
+        except PermissionError:
+            continue
+
+    await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
+
+
+async def container_up(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Start a container."""
+    if not is_authorized(update.effective_chat.id):
+        await update.message.reply_text("⛔ Unauthorized access!")
+        return
+
+    if not context.args:
+        await update.message.reply_text("❓ Usage: /up <container_name>")
+        return
+
+    name = context.args[0]
+    try:
+        container = docker_client.containers.get(name)
+        if container.status == "running":
+            await update.message.reply_text(f"ℹ️ <b>{name}</b> is already running", parse_mode=ParseMode.HTML)
+            return
+
+        await update.message.reply_text(f"▶️ <b>{name}</b> starting...", parse_mode=ParseMode.HTML)
+        container.start()
+        await asyncio.sleep(2)
+        container.reload()
+
+        if container.status == "running":
+            await update.message.reply_text(f"✅ <b>{name}</b> started successfully!", parse_mode=ParseMode.HTML)
+        else:
+            await update.message.reply_text(f"⚠️ <b>{name}</b> status: {container.status}", parse_mode=ParseMode.HTML)
+
+    except docker.errors.NotFound:
+        await update.message.reply_text(f"❌ Container not found: {name}")
+    except Exception as e:
+        await update.message.reply_text(f"❌ Error: {str(e)}")
+
+
+async def container_down(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Stop a container."""
+    if not is_authorized(update.effective_chat.id):
+        await update.message.reply_text("⛔ Unauthorized access!")
+        return
+
+    if not context.args:
+        await update.message.reply_text("❓ Usage: /down <container_name>")
+        return
+
+    name = context.args[0]
+    try:
+        container = docker_client.containers.get(name)
+        if container.status != "running":
+            await update.message.reply_text(f"ℹ️ <b>{name}</b> is already stopped", parse_mode=ParseMode.HTML)
+            return
+
+        await update.message.reply_text(f"🛑 <b>{name}</b> stopping...", parse_mode=ParseMode.HTML)
+        container.stop(timeout=30)
+        await asyncio.sleep(2)
+        container.reload()
+
+        if container.status != "running":
+            await update.message.reply_text(f"✅ <b>{name}</b> stopped successfully!", parse_mode=ParseMode.HTML)
+        else:
+            await update.message.reply_text(f"⚠️ <b>{name}</b> status: {container.status}", parse_mode=ParseMode.HTML)
+
+    except docker.errors.NotFound:
+        await update.message.reply_text(f"❌ Container not found: {name}")
+    except Exception as e:
+        await update.message.reply_text(f"❌ Error: {str(e)}")
+
+
+async def projects_list(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show project status overview."""
+    if not is_authorized(update.effective_chat.id):
+        await update.message.reply_text("⛔ Unauthorized access!")
+        return
+
+    lines = ["📁 <b>Projects</b>", ""]
+
+    for project_id, project_info in get_projects().items():
+        if project_id in ["monitoring", "infra"]:
+            continue
+
+        containers = project_info["containers"]
+        statuses = [get_container_status(c) for c in containers]
+        running = statuses.count("🟢")
+        total = len(containers)
+
+        if running == total:
+            status = "🟢"
+        elif running == 0:
+            status = "🔴"
+        else:
+            status = "🟡"
+
+        url = project_info["url"]
+        lines.append(f"{status} <b>{project_info['name']}</b>")
+        if url:
+            lines.append(f"   ├ {running}/{total} | <a href=\"{url}\">{url.replace('https://', '')}</a>")
+            lines.append(f"   └ {format_uptime_stats(get_uptime_stats(url))}")
+        else:
+            lines.append(f"   └ {running}/{total}")
+
+    lines.append("")
+    lines.append("<i>Uptime: last hour (availability, p50/p95 latency)</i>")
+    lines.append("<i>Details: /project [name]</i>")
+
+    await update.message.reply_text(
+        "\n".join(lines),
+        parse_mode=ParseMode.HTML,
+        disable_web_page_preview=True
+    )
+
+
+async def settings_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show bot settings."""
+    if not is_authorized(update.effective_chat.id):
+        await update.message.reply_text("⛔ Unauthorized access!")
+        return
+
+    settings_text = f"""
+⚙️ <b>Bot Settings</b>
+
+<b>General</b>
+├ Bot Version: 3.0.0
+├ Timezone: {TIMEZONE}
+├ Daily Report: 09:00
+└ Chat ID: <code>{ALLOWED_CHAT_ID}</code>
+
+<b>Connections</b>
+├ Prometheus: {PROMETHEUS_URL}
+├ Alertmanager: {ALERTMANAGER_URL}
+├ Grafana: {GRAFANA_URL}
+└ Webhook Port: {WEBHOOK_PORT}
+
+<b>Statistics</b>
+├ Alert History: {len(await state.list_alerts())} records
+├ Acknowledged: {len(await state.get_acks())} alerts
+└ State: {STATE_URL.split("://", 1)[0]} ({"leader" if is_leader else "standby"})
+"""
+    keyboard = [
+        [InlineKeyboardButton("🗑️ Clear Alert History", callback_data="clear_history")],
+        [InlineKeyboardButton("📊 Grafana", url=GRAFANA_URL)],
+    ]
+
+    await update.message.reply_text(
+        settings_text,
+        parse_mode=ParseMode.HTML,
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+
+# ============================================
+# UPTIME PROBER
+# ============================================
+
+async def probe_url(url: str, timeout: float = UPTIME_PROBE_TIMEOUT) -> tuple:
+    """Probe a URL once and return (timestamp, status, ttfb, total, ok)."""
+    session = get_http_session()
+    timestamp = datetime.now().timestamp()
+    started = monotonic()
+    try:
+        async with session.get(
+            url,
+            allow_redirects=False,
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        ) as resp:
+            ttfb = monotonic() - started
+            # Drain the body so the connection goes back to the pool
+            async for _ in resp.content.iter_chunked(65536):
+                pass
+            total = monotonic() - started
+            return (timestamp, resp.status, ttfb, total, 200 <= resp.status < 400)
+    except Exception as e:
+        logger.debug(f"Probe failed for {url}: {e}")
+        return (timestamp, 0, None, monotonic() - started, False)
+
+
+async def probe_project_urls(context: ContextTypes.DEFAULT_TYPE = None) -> None:
+    """Probe every project URL concurrently (job queue callback)."""
+    urls = list(dict.fromkeys(p["url"] for p in get_projects().values() if p["url"]))
+    samples = await asyncio.gather(*(probe_url(url) for url in urls))
+    for url, sample in zip(urls, samples):
+        uptime_samples[url].append(sample)
+
+
+def get_uptime_stats(url: str, window: int = UPTIME_WINDOW) -> Optional[dict]:
+    """Availability and latency percentiles for a URL over the window."""
+    cutoff = datetime.now().timestamp() - window
+    samples = [s for s in uptime_samples.get(url, ()) if s[0] >= cutoff]
+    if not samples:
+        return None
+
+    latencies = [s[3] for s in samples if s[4]]
+    return {
+        "availability": sum(1 for s in samples if s[4]) / len(samples) * 100,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "last_status": samples[-1][1],
+        "last_ok": samples[-1][4],
+        "samples": len(samples),
+    }
+
+
+def format_uptime_stats(stats: Optional[dict]) -> str:
+    """One-line availability summary for a URL."""
+    if stats is None:
+        return "📡 no probes yet"
+    emoji = "🟢" if stats["last_ok"] else "🔴"
+    if not stats["p95"]:
+        return f"{emoji} {stats['availability']:.1f}% | no successful probes"
+    return (
+        f"{emoji} {stats['availability']:.1f}% | "
+        f"p50 {stats['p50'] * 1000:.0f}ms | p95 {stats['p95'] * 1000:.0f}ms"
+    )
+
+
+# ============================================
+# LOKI LOG SEARCH
+# ============================================
+
+LOGQL_SELECTOR_RE = re.compile(r'^\s*\{(?P<matchers>[^}]*)\}(?P<pipeline>.*)$', re.DOTALL)
+LOGQL_MATCHER_RE = re.compile(r'\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*(=~|!~|!=|=)\s*"((?:[^"\\]|\\.)*)"\s*(?:,|$)')
+LOGQL_WILDCARDS = {"", ".*", ".+"}
+
+# Query results keyed by normalized LogQL and time bucket
+loki_cache = TTLCache(ttl=LOKI_CACHE_BUCKET * 2, maxsize=512)
+
+
+def parse_logql_selector(query: str) -> tuple:
+    """Split a LogQL log query into (matchers, pipeline)."""
+    match = LOGQL_SELECTOR_RE.match(query)
+    if not match:
+        raise ValueError("query must start with a stream selector, e.g. {container=\"traefik\"}")
+
+    raw = match.group("matchers").strip()
+    matchers = []
+    pos = 0
+    while pos < len(raw):
+        m = LOGQL_MATCHER_RE.match(raw, pos)
+        if not m:
+            raise ValueError(f"cannot parse selector near: {raw[pos:pos + 20]}")
+        matchers.append(m.groups())
+        pos = m.end()
+
+    return matchers, match.group("pipeline").strip()
+
+
+def normalize_logql(query: str) -> str:
+    """Canonical form of a LogQL query for cache keys."""
+    matchers, pipeline = parse_logql_selector(query)
+    selector = ", ".join(f'{name}{op}"{value}"' for name, op, value in sorted(matchers))
+    return f"{{{selector}}} {' '.join(pipeline.split())}".strip()
+
+
+def is_logql_bounded(matchers: List[tuple]) -> bool:
+    """A selector is bounded if at least one matcher narrows the stream set."""
+    return any(
+        (op == "=" and value) or (op == "=~" and value not in LOGQL_WILDCARDS)
+        for _, op, value in matchers
+    )
+
+
+async def loki_get(path: str, params: dict) -> dict:
+    """GET a Loki API endpoint through the shared session."""
+    async with get_http_session().get(f"{LOKI_URL}{path}", params=params) as resp:
+        if resp.status != 200:
+            raise RuntimeError(f"Loki {resp.status}: {(await resp.text())[:200]}")
+        return await resp.json()
+
+
+async def fetch_loki_page(query: str, start_ns: int, end_ns: int, limit: int = LOKI_PAGE_SIZE) -> List[tuple]:
+    """Newest `limit` entries in [start, end) as (ts_ns, labels, line), cached."""
+    key = ("page", normalize_logql(query), start_ns, end_ns, limit)
+    cached = loki_cache.get(key)
+    if cached is not None:
+        return cached
+
+    data = await loki_get("/loki/api/v1/query_range", {
+        "query": query,
+        "start": str(start_ns),
+        "end": str(end_ns),
+        "limit": str(limit),
+        "direction": "backward",
+    })
+    result = data.get("data", {})
+    if result.get("resultType") != "streams":
+        raise ValueError("only log queries are supported, not metric queries")
+
+    entries = [
+        (int(ts), stream.get("stream", {}), line)
+        for stream in result.get("result", [])
+        for ts, line in stream.get("values", [])
+    ]
+    entries.sort(key=lambda e: e[0], reverse=True)
+    entries = entries[:limit]
+
+    loki_cache.set(key, entries)
+    return entries
+
+
+async def fetch_loki_volume(query: str, start_ns: int, end_ns: int) -> Optional[dict]:
+    """Index stats (streams, chunks, entries, bytes) for the query's selector."""
+    matchers, _ = parse_logql_selector(query)
+    selector = "{" + ", ".join(f'{n}{op}"{v}"' for n, op, v in matchers) + "}"
+    key = ("stats", selector, start_ns, end_ns)
+    cached = loki_cache.get(key)
+    if cached is not None:
+        return cached
+
+    try:
+        stats = await loki_get("/loki/api/v1/index/stats", {
+            "query": selector,
+            "start": str(start_ns),
+            "end": str(end_ns),
+        })
+    except Exception as e:
+        # Older Loki versions have no index stats; the page cap still applies
+        logger.debug(f"Loki index stats unavailable: {e}")
+        return None
+
+    loki_cache.set(key, stats)
+    return stats
+
+
+def format_loki_entries(entries: List[tuple]) -> str:
+    """Render log entries as a <pre> block."""
+    lines = []
+    size = 0
+    for ts, labels, line in entries:
+        stamp = datetime.fromtimestamp(ts / 1e9, TIMEZONE).strftime("%H:%M:%S")
+        source = labels.get("container") or labels.get("container_name") or labels.get("job", "?")
+        text = f"{stamp} {source} | {line.strip()[:LOKI_LINE_LIMIT]}"
+        size += len(text) + 1
+        if size > LOGS_MESSAGE_LIMIT:
+            break
+        lines.append(text)
+    return f"<pre>{html.escape(chr(10).join(lines))}</pre>"
+
+
+def loki_entry_key(entry: tuple) -> tuple:
+    ts, labels, line = entry
+    return ts, tuple(sorted(labels.items())), line
+
+
+async def loki_pages(query: str, start_ns: int, end_ns: int):
+    """Page through results newest first, following the oldest timestamp.
+
+    Entries can share a nanosecond across a page boundary, so each next
+    page includes the boundary timestamp again and skips the entries at it
+    that were already shown.
+    """
+    cursor = end_ns
+    seen = set()
+    for page in range(LOKI_MAX_PAGES):
+        entries = await fetch_loki_page(query, start_ns, cursor)
+        full = len(entries) == LOKI_PAGE_SIZE
+        fresh = [e for e in entries if loki_entry_key(e) not in seen]
+        if not fresh:
+            if not full:
+                return
+            # More than a page of entries in one nanosecond: step past it
+            cursor, seen = entries[-1][0], set()
             continue
 
-        down_count = sum(1 for c in project_info["containers"] if get_container_status(c) != "🟢")
-        if down_count > 0:
-            warnings.append(f"🟡 {project_info['name']}: {down_count} container(s) down")
+        body = format_loki_entries(fresh)
+        if page == LOKI_MAX_PAGES - 1 and full:
+            body += "\n<i>Page limit reached - narrow the query or range.</i>"
+        yield body
+
+        if not full:
+            return
+        boundary = fresh[-1][0]
+        at_boundary = {loki_entry_key(e) for e in fresh if e[0] == boundary}
+        seen = (seen | at_boundary) if cursor == boundary + 1 else at_boundary
+        cursor = boundary + 1
+
+
+async def loki_sampled_pages(query: str, start_ns: int, end_ns: int):
+    """Downsampled paging: one page per equal time window, newest first."""
+    window = (end_ns - start_ns) // LOKI_MAX_PAGES
+    for i in range(LOKI_MAX_PAGES):
+        w_end = end_ns - i * window
+        w_start = w_end - window
+        entries = await fetch_loki_page(query, w_start, w_end)
+        span = (
+            f"{datetime.fromtimestamp(w_start / 1e9, TIMEZONE).strftime('%d.%m %H:%M')} - "
+            f"{datetime.fromtimestamp(w_end / 1e9, TIMEZONE).strftime('%H:%M')}"
+        )
+        body = format_loki_entries(entries) if entries else "<i>No entries</i>"
+        yield f"🕐 {span}\n{body}"
+
+
+async def logsearch_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Search logs in Loki with LogQL and page through the results."""
+    if not is_authorized(update.effective_chat.id):
+        await update.message.reply_text("⛔ Unauthorized access!")
+        return
+
+    args = list(context.args)
+    if not args:
+        await update.message.reply_text(
+            "🔎 <b>Log Search</b>\n\n"
+            "Usage: /logsearch &lt;LogQL&gt; [range]\n\n"
+            "Examples:\n"
+            "• /logsearch {container=\"traefik\"} |= \"error\"\n"
+            "• /logsearch {job=\"containerlogs\"} |~ \"timeout|refused\" 6h\n\n"
+            f"Range default 1h, max {format_uptime(LOKI_MAX_RANGE)}",
+            parse_mode=ParseMode.HTML
+        )
+        return
+
+    range_seconds = 3600
+    if len(args) > 1 and re.fullmatch(r"\d+[smhd]", args[-1]):
+        range_seconds = parse_duration(args.pop())
+    query = " ".join(args)
+
+    try:
+        matchers, _ = parse_logql_selector(query)
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
+
+    if not is_logql_bounded(matchers):
+        await update.message.reply_text(
+            "❌ Query selects every stream. Add a label matcher, e.g. {container=\"traefik\"}"
+        )
+        return
+
+    if range_seconds > LOKI_MAX_RANGE:
+        await update.message.reply_text(f"❌ Range too large (max {format_uptime(LOKI_MAX_RANGE)})")
+        return
+
+    # Align to a time bucket so repeated searches hit the cache
+    bucket = LOKI_CACHE_BUCKET * 10**9
+    end_ns = int(datetime.now().timestamp() * 1e9) // bucket * bucket
+    start_ns = end_ns - range_seconds * 10**9
+
+    stats = await fetch_loki_volume(query, start_ns, end_ns)
+    sampled = False
+    if stats:
+        if stats.get("bytes", 0) > LOKI_MAX_BYTES:
+            await update.message.reply_text(
+                f"❌ Query would scan {format_bytes(stats['bytes'])} "
+                f"(limit {format_bytes(LOKI_MAX_BYTES)}). Narrow the selector or range."
+            )
+            return
+        sampled = stats.get("entries", 0) > LOKI_PAGE_SIZE * LOKI_MAX_PAGES
+
+    title = f"🔎 <b>Loki</b> <code>{html.escape(query)}</code>\nLast {format_uptime(range_seconds)}"
+    if sampled:
+        title += f" | ~{stats['entries']} lines, sampled per window"
+        source = loki_sampled_pages(query, start_ns, end_ns)
+    else:
+        source = loki_pages(query, start_ns, end_ns)
+
+    try:
+        await send_paginated(update.message, PaginatedView(title, page_source=source))
+    except Exception as e:
+        await update.message.reply_text(f"❌ Error: {str(e)}")
+
+
+# ============================================
+# CONTAINER RESOURCE TOP
+# ============================================
+
+# Computed /top rows
+top_cache = TTLCache(ttl=TOP_CACHE_TTL, maxsize=1)
 
-    # Build response
-    if issues:
-        text = "🚨 <b>Critical Issues Detected</b>\n\n"
-        text += "\n".join(issues)
-        if warnings:
-            text += "\n\n⚠️ <b>Warnings</b>\n"
-            text += "\n".join(warnings)
-    elif warnings:
-        text = "⚠️ <b>Warnings</b>\n\n"
-        text += "\n".join(warnings)
+TOP_SORT_LABELS = {
+    "cpu": "CPU",
+    "mem": "Memory",
+    "net": "Network",
+    "io": "Disk I/O",
+}
+
+
+def get_container_project(name: str) -> Optional[str]:
+    """Display name of the project a container belongs to."""
+    project_id = container_index.get(name, {}).get("project")
+    return project_index[project_id]["name"] if project_id in project_index else None
+
+
+def read_container_counters(stats: dict) -> dict:
+    """Extract cumulative counters from a Docker stats payload."""
+    cpu = stats.get("cpu_stats", {})
+    memory = stats.get("memory_stats", {})
+    networks = stats.get("networks") or {}
+    blkio = (stats.get("blkio_stats") or {}).get("io_service_bytes_recursive") or []
+
+    # Page cache is reclaimable, docker stats subtracts it the same way
+    mem_stats = memory.get("stats", {})
+    cache = mem_stats.get("inactive_file", mem_stats.get("total_inactive_file", 0))
+
+    return {
+        "cpu_total": cpu.get("cpu_usage", {}).get("total_usage", 0),
+        "cpu_system": cpu.get("system_cpu_usage"),
+        "online_cpus": cpu.get("online_cpus") or len(cpu.get("cpu_usage", {}).get("percpu_usage") or []) or 1,
+        "mem": max(0, memory.get("usage", 0) - cache),
+        "mem_limit": memory.get("limit", 0),
+        "net": sum(n.get("rx_bytes", 0) + n.get("tx_bytes", 0) for n in networks.values()),
+        "io": sum(e.get("value", 0) for e in blkio if e.get("op", "").lower() in ("read", "write")),
+        "ts": monotonic(),
+    }
+
+
+def compute_container_rates(current: dict, previous: dict) -> dict:
+    """CPU% and byte rates from two counter snapshots."""
+    elapsed = max(current["ts"] - previous["ts"], 1e-6)
+    cpu_delta = current["cpu_total"] - previous["cpu_total"]
+
+    if current["cpu_system"] and previous["cpu_system"] and current["cpu_system"] > previous["cpu_system"]:
+        system_delta = current["cpu_system"] - previous["cpu_system"]
+        cpu = cpu_delta / system_delta * current["online_cpus"] * 100
     else:
-        text = "✅ <b>All Systems Normal</b>\n\n"
-        text += "• CPU, Memory, Disk: OK\n"
-        text += "• Critical services: OK\n"
-        text += "• All projects: Running"
+        cpu = cpu_delta / (elapsed * 1e9) * 100
 
-    await update.message.reply_text(text, parse_mode=ParseMode.HTML)
+    return {
+        "cpu": max(0.0, cpu),
+        "net": max(0, current["net"] - previous["net"]) / elapsed,
+        "io": max(0, current["io"] - previous["io"]) / elapsed,
+    }
 
 
-async def silence_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Silence an alert."""
+async def sample_container_counters() -> Dict[str, tuple]:
+    """One-shot stats for all running containers, in parallel on the stats pool."""
+    loop = asyncio.get_running_loop()
+    containers = await loop.run_in_executor(stats_executor, docker_client.containers.list)
+
+    def fetch(container):
+        try:
+            stats = container.stats(stream=False, one_shot=True)
+            return container.id, (container.name, read_container_counters(stats))
+        except Exception as e:
+            logger.debug(f"Stats failed for {container.name}: {e}")
+            return container.id, None
+
+    results = await asyncio.gather(*(loop.run_in_executor(stats_executor, fetch, c) for c in containers))
+    return {cid: sample for cid, sample in results if sample}
+
+
+async def collect_top_rows() -> List[dict]:
+    """Per-container CPU, memory, network and I/O, cached for TOP_CACHE_TTL."""
+    rows = top_cache.get("rows")
+    if rows is not None:
+        return rows
+
+    async with top_lock:
+        rows = top_cache.get("rows")
+        if rows is not None:
+            return rows
+
+        # Without a recent baseline, take one now so rates are meaningful
+        now = monotonic()
+        if not container_counters or any(now - c["ts"] > TOP_BASELINE_MAX_AGE for _, c in container_counters.values()):
+            container_counters.clear()
+            container_counters.update(await sample_container_counters())
+            await asyncio.sleep(1)
+
+        current = await sample_container_counters()
+        rows = []
+        for cid, (name, counters) in current.items():
+            previous = container_counters.get(cid)
+            if not previous:
+                continue
+            rates = compute_container_rates(counters, previous[1])
+            rows.append({
+                "name": name,
+                "project": get_container_project(name),
+                "mem": counters["mem"],
+                "mem_pct": counters["mem"] / counters["mem_limit"] * 100 if counters["mem_limit"] else 0,
+                **rates,
+            })
+
+        container_counters.clear()
+        container_counters.update(current)
+        top_cache.set("rows", rows)
+        return rows
+
+
+async def top_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show the busiest containers by CPU, memory, network or disk I/O."""
     if not is_authorized(update.effective_chat.id):
         await update.message.reply_text("⛔ Unauthorized access!")
         return
 
-    if len(context.args) < 2:
-        await update.message.reply_text(
-            "❓ Usage: /silence <alertname> <duration>\n"
-            "Example: /silence HighCPU 2h\n"
-            "Duration: 1h, 2h, 4h, 8h, 24h"
+    sort_by = context.args[0].lower() if context.args else "cpu"
+    if sort_by not in TOP_SORT_LABELS:
+        await update.message.reply_text("❓ Usage: /top [cpu|mem|net|io]")
+        return
+
+    try:
+        rows = await collect_top_rows()
+    except Exception as e:
+        await update.message.reply_text(f"❌ Error: {str(e)}")
+        return
+
+    rows = sorted(rows, key=lambda r: r[sort_by], reverse=True)[:TOP_N]
+
+    lines = [f"🔝 <b>Top Containers by {TOP_SORT_LABELS[sort_by]}</b>", ""]
+    for i, row in enumerate(rows, 1):
+        project = f" | {html.escape(row['project'])}" if row["project"] else ""
+        lines.append(f"{i}. <b>{html.escape(row['name'])}</b>{project}")
+        lines.append(
+            f"   └ CPU {row['cpu']:.1f}% | RAM {format_bytes(row['mem'])} ({row['mem_pct']:.0f}%) | "
+            f"Net {format_bytes(row['net'])}/s | I/O {format_bytes(row['io'])}/s"
         )
+
+    if not rows:
+        lines.append("<i>No running containers</i>")
+
+    lines.append("")
+    lines.append("<i>/top cpu | mem | net | io</i>")
+
+    await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
+
+
+# ============================================
+# HOST PROCESS SNAPSHOTS
+# ============================================
+
+CGROUP_CONTAINER_RE = re.compile(r"(?:docker[-/]|containerd[-/]|/)([0-9a-f]{64})(?:\.scope)?")
+
+PROCS_SORT_LABELS = {
+    "cpu": "CPU",
+    "mem": "Memory",
+    "io": "Disk I/O",
+    "fds": "Open Files",
+}
+
+PROCS_ATTRS = ["pid", "create_time", "name", "username", "cpu_percent", "memory_info", "memory_percent", "io_counters", "num_fds"]
+
+
+def read_process_container_id(pid: int) -> Optional[str]:
+    """Docker container id of a process, parsed from its cgroup file."""
+    try:
+        with open(os.path.join(psutil.PROCFS_PATH, str(pid), "cgroup")) as f:
+            match = CGROUP_CONTAINER_RE.search(f.read())
+    except OSError:
+        return None
+    return match.group(1) if match else None
+
+
+def take_process_snapshot(container_names: Dict[str, str]) -> List[dict]:
+    """Walk /proc once and build per-process rows (runs in a worker thread).
+
+    psutil.process_iter keeps Process objects alive between calls, so
+    cpu_percent() is the usage since the previous snapshot.
+    """
+    now = monotonic()
+    rows = []
+    seen = set()
+
+    for proc in psutil.process_iter(attrs=PROCS_ATTRS, ad_value=None):
+        info = proc.info
+        key = (info["pid"], info["create_time"])
+        seen.add(key)
+
+        if key not in process_containers:
+            process_containers[key] = read_process_container_id(info["pid"])
+        container_id = process_containers[key]
+
+        # io_counters and num_fds of other users' processes need ptrace
+        # access; without it they stay None and show as n/a
+        io_rate = None
+        io = info["io_counters"]
+        if io is not None:
+            io_rate = 0.0
+            total = io.read_bytes + io.write_bytes
+            previous = process_io_counters.get(key)
+            if previous:
+                io_rate = max(0, total - previous[0]) / max(now - previous[1], 1e-6)
+            process_io_counters[key] = (total, now)
+
+        rows.append({
+            "pid": info["pid"],
+            "name": info["name"] or "?",
+            "user": info["username"] or "?",
+            "cpu": info["cpu_percent"] or 0.0,
+            "mem": info["memory_info"].rss if info["memory_info"] else 0,
+            "mem_pct": info["memory_percent"] or 0.0,
+            "io": io_rate,
+            "fds": info["num_fds"],
+            "container": container_names.get(container_id, container_id[:12]) if container_id else None,
+        })
+
+    # Forget processes that exited
+    for key in list(process_containers):
+        if key not in seen:
+            process_containers.pop(key, None)
+            process_io_counters.pop(key, None)
+
+    return rows
+
+
+async def refresh_process_snapshot(context: ContextTypes.DEFAULT_TYPE = None) -> None:
+    """Refresh the process snapshot in the background (job queue callback)."""
+    global process_snapshot, process_snapshot_at
+
+    loop = asyncio.get_running_loop()
+    try:
+        containers = await loop.run_in_executor(stats_executor, docker_client.containers.list)
+        container_names = {c.id: c.name for c in containers}
+    except Exception as e:
+        logger.debug(f"Container list for /procs failed: {e}")
+        container_names = {}
+
+    process_snapshot = await loop.run_in_executor(stats_executor, take_process_snapshot, container_names)
+    process_snapshot_at = datetime.now(TIMEZONE)
+
+
+async def procs_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show top host processes from the latest background snapshot."""
+    if not is_authorized(update.effective_chat.id):
+        await update.message.reply_text("⛔ Unauthorized access!")
         return
 
-    alertname = context.args[0]
-    duration_str = context.args[1].lower()
+    sort_by = context.args[0].lower() if context.args else "cpu"
+    if sort_by not in PROCS_SORT_LABELS:
+        await update.message.reply_text("❓ Usage: /procs [cpu|mem|io|fds]")
+        return
 
-    # Parse duration
-    hours = 1
-    if duration_str.endswith('h'):
-        try:
-            hours = int(duration_str[:-1])
-        except ValueError:
-            await update.message.reply_text("❌ Invalid duration format. Example: 1h, 2h, 4h")
-            return
+    if process_snapshot_at is None:
+        await update.message.reply_text("⏳ First process snapshot is still being collected, try again shortly.")
+        return
+
+    # Unreadable values sort last
+    rows = sorted(process_snapshot, key=lambda r: -1 if r[sort_by] is None else r[sort_by], reverse=True)[:PROCS_TOP_N]
+
+    lines = [f"⚙️ <b>Top Processes by {PROCS_SORT_LABELS[sort_by]}</b>", ""]
+    for row in rows:
+        where = f" 🐳 {html.escape(row['container'])}" if row["container"] else ""
+        io = "n/a" if row["io"] is None else f"{format_bytes(row['io'])}/s"
+        fds = "n/a" if row["fds"] is None else row["fds"]
+        lines.append(f"<code>{row['pid']:>7}</code> <b>{html.escape(row['name'])}</b>{where}")
+        lines.append(
+            f"   └ CPU {row['cpu']:.1f}% | RAM {format_bytes(row['mem'])} ({row['mem_pct']:.1f}%) | "
+            f"I/O {io} | FDs {fds}"
+        )
+
+    lines.append("")
+    if sort_by in ("io", "fds"):
+        denied = sum(1 for r in process_snapshot if r[sort_by] is None)
+        if denied:
+            lines.append(
+                f"⚠️ <i>{PROCS_SORT_LABELS[sort_by]} not readable for {denied} processes: "
+                f"needs root with CAP_SYS_PTRACE (see README)</i>"
+            )
+    lines.append(
+        f"<i>{len(process_snapshot)} processes | snapshot {process_snapshot_at.strftime('%H:%M:%S')} | "
+        f"/procs cpu | mem | io | fds</i>"
+    )
+
+    await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
+
+
+# ============================================
+# GRAFANA PANEL RENDERING
+# ============================================
+
+# Rendered PNGs keyed by (uid, panel, range, time bucket)
+render_cache = TTLCache(ttl=GRAFANA_RENDER_BUCKET * 2, maxsize=GRAFANA_RENDER_CACHE_SIZE)
+grafana_dashboard_cache = TTLCache(ttl=600, maxsize=64)
+
+
+def grafana_headers() -> dict:
+    """Authorization header for the Grafana HTTP API."""
+    return {"Authorization": f"Bearer {GRAFANA_API_TOKEN}"} if GRAFANA_API_TOKEN else {}
+
+
+async def fetch_grafana_dashboard(uid: str) -> dict:
+    """Dashboard JSON model by uid, cached."""
+    dashboard = grafana_dashboard_cache.get(uid)
+    if dashboard is not None:
+        return dashboard
+
+    async with get_http_session().get(
+        f"{GRAFANA_RENDER_URL}/api/dashboards/uid/{uid}", headers=grafana_headers()
+    ) as resp:
+        if resp.status != 200:
+            raise RuntimeError(f"Dashboard {uid} not found (HTTP {resp.status})")
+        dashboard = (await resp.json()).get("dashboard", {})
+
+    grafana_dashboard_cache.set(uid, dashboard)
+    return dashboard
+
+
+def iter_panels(panels: List[dict]):
+    """Yield panels including those nested in collapsed rows."""
+    for panel in panels:
+        if panel.get("type") != "row":
+            yield panel
+        yield from iter_panels(panel.get("panels", []))
+
+
+def find_panel(dashboard: dict, query: Optional[str]) -> Optional[dict]:
+    """Find a panel by id or title substring, or the first panel."""
+    panels = list(iter_panels(dashboard.get("panels", [])))
+    if not query:
+        return panels[0] if panels else None
+    if query.isdigit():
+        return next((p for p in panels if p.get("id") == int(query)), None)
+    query = query.lower()
+    return next((p for p in panels if query in (p.get("title") or "").lower()), None)
+
+
+async def _render_panel_png(uid: str, panel_id: int, time_range: str) -> bytes:
+    async with render_semaphore:
+        params = {
+            "orgId": "1",
+            "panelId": str(panel_id),
+            "from": f"now-{time_range}",
+            "to": "now",
+            "width": str(GRAFANA_RENDER_WIDTH),
+            "height": str(GRAFANA_RENDER_HEIGHT),
+            "tz": str(TIMEZONE),
+        }
+        async with get_http_session().get(
+            f"{GRAFANA_RENDER_URL}/render/d-solo/{uid}/",
+            params=params,
+            headers=grafana_headers(),
+            timeout=aiohttp.ClientTimeout(total=GRAFANA_RENDER_TIMEOUT),
+        ) as resp:
+            if resp.status != 200 or not resp.content_type.startswith("image/"):
+                raise RuntimeError(f"Grafana render failed (HTTP {resp.status})")
+            return await resp.read()
+
+
+async def render_grafana_panel(uid: str, panel_id: int, time_range: str = "1h") -> bytes:
+    """Render a panel as PNG through the cache.
+
+    Concurrent requests for the same panel, range and time bucket share
+    one Grafana render.
+    """
+    bucket = int(datetime.now().timestamp()) // GRAFANA_RENDER_BUCKET
+    key = (uid, panel_id, time_range, bucket)
+
+    png = render_cache.get(key)
+    if png is not None:
+        return png
+
+    task = render_inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_render_panel_png(uid, panel_id, time_range))
+        render_inflight[key] = task
+
+        def done(t, key=key):
+            render_inflight.pop(key, None)
+            if not t.cancelled() and t.exception() is None:
+                render_cache.set(key, t.result())
+
+        task.add_done_callback(done)
+
+    return await asyncio.shield(task)
+
+
+def resolve_dashboard_uid(name: str) -> str:
+    """Accept either a category key from the dashboards config or a uid."""
+    return config["dashboards"].get(name, name)
+
+
+async def send_alert_panel(bot, chat_id: int, category: str, reply_to: int) -> None:
+    """Reply to an alert notification with the category's Grafana panel."""
+    dashboards = config["dashboards"]
+    panels = config["alert_panels"]
+    if category in dashboards:
+        uid, panel_id = dashboards[category], panels.get(category)
+    else:
+        uid, panel_id = dashboards["default"], panels["default"]
 
     try:
-        async with aiohttp.ClientSession() as session:
-            silence_data = {
-                "matchers": [{"name": "alertname", "value": alertname, "isRegex": False}],
-                "startsAt": datetime.now(pytz.UTC).isoformat(),
-                "endsAt": (datetime.now(pytz.UTC) + timedelta(hours=hours)).isoformat(),
-                "createdBy": "telegram-bot",
-                "comment": f"Silenced via /silence command for {hours}h",
-            }
-            async with session.post(f"{ALERTMANAGER_URL}/api/v2/silences", json=silence_data) as resp:
-                if resp.status == 200:
-                    result = await resp.json()
-                    silence_id = result.get("silenceID", "?")
-                    await update.message.reply_text(
-                        f"🔕 <b>{alertname}</b> silenced for {hours} hours\n"
-                        f"ID: <code>{silence_id}</code>",
-                        parse_mode=ParseMode.HTML
-                    )
-                else:
-                    error = await resp.text()
-                    await update.message.reply_text(f"❌ Failed to create silence: {error}")
+        if panel_id is None:
+            panel = find_panel(await fetch_grafana_dashboard(uid), None)
+            if not panel:
+                return
+            panel_id = panel["id"]
+        png = await render_grafana_panel(uid, panel_id, GRAFANA_ALERT_PANEL_RANGE)
+        await bot.send_photo(chat_id=chat_id, photo=png, reply_to_message_id=reply_to)
     except Exception as e:
-        await update.message.reply_text(f"❌ Error: {str(e)}")
+        logger.warning(f"Alert panel render failed for {category}: {e}")
 
 
-async def ack_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Acknowledge an alert."""
+async def render_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Render a Grafana panel as an image."""
     if not is_authorized(update.effective_chat.id):
         await update.message.reply_text("⛔ Unauthorized access!")
         return
 
-    if not context.args:
-        # Show recent alerts to ack
-        if not alert_history:
-            await update.message.reply_text("ℹ️ No alerts to acknowledge")
-            return
+    args = list(context.args)
+    if not args:
+        names = ", ".join(k for k in config["dashboards"] if k != "default")
+        await update.message.reply_text(
+            "📈 <b>Render</b>\n\n"
+            "Usage: /render &lt;dashboard&gt; [panel] [range]\n\n"
+            "Examples:\n"
+            "• /render host\n"
+            "• /render vps-overview \"Network\" 6h\n"
+            "• /render database 7 24h\n\n"
+            f"Dashboards: {names} or any uid",
+            parse_mode=ParseMode.HTML
+        )
+        return
 
-        lines = ["🔔 <b>Recent Alerts</b>", ""]
-        for alert_hash, info in list(alert_history.items())[:10]:
-            alertname = info.get("alert", {}).get("labels", {}).get("alertname", "?")
-            status = info.get("status", "?")
-            is_acked = alert_hash in acknowledged_alerts
-            ack_emoji = "✅" if is_acked else "⏳"
-            lines.append(f"{ack_emoji} <code>{alert_hash}</code> - {alertname}")
+    time_range = "1h"
+    if len(args) > 1 and re.fullmatch(r"\d+[smhdw]", args[-1]):
+        time_range = args.pop()
 
-        lines.append("")
-        lines.append("<i>Usage: /ack <hash></i>")
-        await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
+    uid = resolve_dashboard_uid(args[0])
+    panel_query = " ".join(args[1:]).strip('"') or None
+
+    try:
+        dashboard = await fetch_grafana_dashboard(uid)
+        panel = find_panel(dashboard, panel_query)
+        if not panel:
+            titles = [f"{p.get('id')}: {p.get('title') or '-'}" for p in iter_panels(dashboard.get("panels", []))]
+            await update.message.reply_text(
+                "❌ Panel not found. Available:\n" + "\n".join(titles[:30])
+            )
+            return
+
+        await context.bot.send_chat_action(update.effective_chat.id, "upload_photo")
+        png = await render_grafana_panel(uid, panel["id"], time_range)
+    except Exception as e:
+        await update.message.reply_text(f"❌ Error: {str(e)}")
         return
 
-    alert_hash = context.args[0]
-    acknowledged_alerts[alert_hash] = datetime.now(TIMEZONE)
-    await update.message.reply_text(f"✅ Alert <code>{alert_hash}</code> acknowledged", parse_mode=ParseMode.HTML)
+    keyboard = [[InlineKeyboardButton(
+        "📊 Open in Grafana",
+        url=f"{GRAFANA_URL}/d/{uid}?viewPanel={panel['id']}&from=now-{time_range}&to=now",
+    )]]
+    await update.message.reply_photo(
+        photo=png,
+        caption=f"📈 {dashboard.get('title', uid)} / {panel.get('title') or panel['id']} | last {time_range}",
+        reply_markup=InlineKeyboardMarkup(keyboard),
+    )
 
 
-async def escalate_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Escalate an alert to higher priority or team."""
+# ============================================
+# PROMETHEUS RANGE GRAPHS
+# ============================================
+
+# Series and PNGs keyed by (query, range, step, step-aligned end)
+graph_cache = TTLCache(ttl=3600, maxsize=GRAPH_CACHE_SIZE)
+
+SPARK_BLOCKS = "▁▂▃▄▅▆▇█"
+
+# Legend emoji and RGB line colour per series
+GRAPH_COLORS = [
+    ("🟦", (66, 133, 244)),
+    ("🟥", (219, 68, 55)),
+    ("🟩", (15, 157, 88)),
+    ("🟧", (255, 136, 0)),
+    ("🟪", (156, 39, 176)),
+    ("🟨", (244, 180, 0)),
+]
+GRAPH_BACKGROUND = (255, 255, 255)
+GRAPH_GRID = (225, 225, 225)
+
+
+async def prometheus_get(path: str, params: dict) -> dict:
+    """GET a Prometheus API endpoint through the shared session, returning its data."""
+    async with get_http_session().get(f"{PROMETHEUS_URL}{path}", params=params) as resp:
+        payload = await resp.json(content_type=None)
+        if payload.get("status") != "success":
+            raise RuntimeError(f"Prometheus: {payload.get('error', f'HTTP {resp.status}')}")
+        return payload["data"]
+
+
+def graph_key(query: str, seconds: int) -> tuple:
+    """Cache key for a range query; end is aligned to the step."""
+    step = max(GRAPH_MIN_STEP, math.ceil(seconds / GRAPH_RESOLUTION))
+    step = math.ceil(step / GRAPH_MIN_STEP) * GRAPH_MIN_STEP
+    end = int(datetime.now().timestamp()) // step * step
+    return (query, seconds, step, end)
+
+
+def format_series_label(metric: dict) -> str:
+    labels = {k: v for k, v in metric.items() if k != "__name__"}
+    if not labels:
+        return metric.get("__name__", "value")
+    if len(labels) == 1:
+        return next(iter(labels.values()))
+    return ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+
+
+async def fetch_graph_series(key: tuple) -> List[tuple]:
+    """Run query_range for a graph key: [(label, [(ts, value), ...]), ...]."""
+    series = graph_cache.get(key)
+    if series is not None:
+        return series
+
+    query, seconds, step, end = key
+    data = await prometheus_get("/api/v1/query_range", {
+        "query": query,
+        "start": str(end - seconds),
+        "end": str(end),
+        "step": str(step),
+    })
+
+    series = []
+    for result in data.get("result", []):
+        points = [(float(ts), float(v)) for ts, v in result.get("values", [])]
+        points = [p for p in points if math.isfinite(p[1])]
+        if points:
+            series.append((format_series_label(result.get("metric", {})), points))
+    series.sort(key=lambda item: -max(v for _, v in item[1]))
+
+    graph_cache.set(key, series)
+    return series
+
+
+def lttb(points: List[tuple], threshold: int) -> List[tuple]:
+    """Largest-Triangle-Three-Buckets downsampling to threshold points.
+
+    Keeps the first and last point; from each bucket in between keeps the
+    point forming the largest triangle with the previous pick and the
+    average of the next bucket, so peaks survive.
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        next_bucket = points[end:min(int((i + 2) * bucket_size) + 1, n)]
+        avg_x = sum(p[0] for p in next_bucket) / len(next_bucket)
+        avg_y = sum(p[1] for p in next_bucket) / len(next_bucket)
+
+        ax, ay = points[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(points[best])
+        a = best
+
+    sampled.append(points[-1])
+    return sampled
+
+
+def sparkline(values: List[float], lo: float, hi: float) -> str:
+    span = hi - lo
+    if span <= 0:
+        return SPARK_BLOCKS[3] * len(values)
+    top = len(SPARK_BLOCKS) - 1
+    return "".join(SPARK_BLOCKS[min(int((v - lo) / span * len(SPARK_BLOCKS)), top)] for v in values)
+
+
+def format_graph_value(value: float, unit: str) -> str:
+    if unit == "B/s":
+        return f"{format_bytes(value)}/s"
+    return f"{value:.3g}{unit}" if abs(value) < 1000 else f"{value:,.0f}{unit}"
+
+
+def format_graph_text(title: str, time_range: str, series: List[tuple], unit: str) -> str:
+    """Unicode sparkline block, one row per series."""
+    lines = [f"📈 <b>{html.escape(title)}</b> | last {time_range}", ""]
+    for label, points in series[:GRAPH_MAX_SERIES]:
+        values = [v for _, v in points]
+        spark = sparkline([v for _, v in lttb(points, GRAPH_SPARK_WIDTH)], min(values), max(values))
+        lines.append(f"<b>{html.escape(label[:60])}</b>")
+        lines.append(f"<code>{spark}</code>")
+        lines.append(
+            f"└ min {format_graph_value(min(values), unit)} · "
+            f"avg {format_graph_value(sum(values) / len(values), unit)} · "
+            f"max {format_graph_value(max(values), unit)} · "
+            f"last {format_graph_value(values[-1], unit)}"
+        )
+    if len(series) > GRAPH_MAX_SERIES:
+        lines.append(f"\n<i>+{len(series) - GRAPH_MAX_SERIES} more series</i>")
+    return "\n".join(lines)
+
+
+def encode_png(width: int, height: int, rows: List[bytearray]) -> bytes:
+    """Encode 8-bit RGB rows as a PNG."""
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    raw = b"".join(b"\x00" + bytes(row) for row in rows)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(raw, 6))
+        + chunk(b"IEND", b"")
+    )
+
+
+def render_graph_png(series: List[tuple], width: int = GRAPH_PNG_WIDTH,
+                     height: int = GRAPH_PNG_HEIGHT) -> bytes:
+    """Draw series as lines on a small PNG. CPU bound, run it in a worker thread."""
+    margin = 8
+    canvas = [bytearray(bytes(GRAPH_BACKGROUND) * width) for _ in range(height)]
+
+    def plot(x: int, y: int, color: tuple) -> None:
+        if 0 <= x < width and 0 <= y < height:
+            canvas[y][x * 3:x * 3 + 3] = bytes(color)
+
+    def line(x0: int, y0: int, x1: int, y1: int, color: tuple) -> None:
+        dx, dy = abs(x1 - x0), -abs(y1 - y0)
+        sx, sy = (1 if x0 < x1 else -1), (1 if y0 < y1 else -1)
+        err = dx + dy
+        while True:
+            plot(x0, y0, color)
+            plot(x0, y0 + 1, color)
+            if x0 == x1 and y0 == y1:
+                return
+            e2 = 2 * err
+            if e2 >= dy:
+                err += dy
+                x0 += sx
+            if e2 <= dx:
+                err += dx
+                y0 += sy
+
+    plot_w, plot_h = width - 2 * margin - 1, height - 2 * margin - 1
+    for q in range(5):
+        y = margin + plot_h * q // 4
+        for x in range(margin, width - margin, 3):
+            plot(x, y, GRAPH_GRID)
+
+    t0 = min(points[0][0] for _, points in series)
+    t1 = max(points[-1][0] for _, points in series)
+    lo = min(v for _, points in series for _, v in points)
+    hi = max(v for _, points in series for _, v in points)
+
+    for index, (_, points) in enumerate(series):
+        color = GRAPH_COLORS[index % len(GRAPH_COLORS)][1]
+        previous = None
+        for t, v in lttb(points, plot_w):
+            x = margin + round((t - t0) / ((t1 - t0) or 1) * plot_w)
+            y = margin + plot_h - round((v - lo) / ((hi - lo) or 1) * plot_h)
+            if previous:
+                line(*previous, x, y, color)
+            else:
+                plot(x, y, color)
+            previous = (x, y)
+
+    return encode_png(width, height, canvas)
+
+
+def parse_graph_args(args: List[str]) -> tuple:
+    """Split /graph arguments into (query, range, png)."""
+    args = list(args)
+    png = bool(args) and args[-1].lower() == "png"
+    if png:
+        args.pop()
+    time_range = "1h"
+    if len(args) > 1 and re.fullmatch(r"\d+[smhd]", args[-1]):
+        time_range = args.pop()
+    return " ".join(args), time_range, png
+
+
+async def graph_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Chart a PromQL query or preset as sparklines or a PNG."""
     if not is_authorized(update.effective_chat.id):
         await update.message.reply_text("⛔ Unauthorized access!")
         return
 
-    if not context.args:
+    query, time_range, png = parse_graph_args(context.args)
+    if not query:
         await update.message.reply_text(
-            "🚨 <b>Escalate - Alert Escalation</b>\n\n"
-            "Usage: /escalate <alert_hash> [message]\n\n"
-            "Example:\n"
-            "• /escalate abc123 Urgent intervention needed\n\n"
-            "Use /alerts to get alert hashes.",
+            "📈 <b>Graph</b>\n\n"
+            "Usage: /graph &lt;PromQL|preset&gt; [range] [png]\n\n"
+            "Examples:\n"
+            "• /graph cpu\n"
+            "• /graph memory 24h png\n"
+            "• /graph rate(traefik_service_requests_total[5m]) 6h\n\n"
+            f"Presets: {', '.join(GRAPH_PRESETS)}",
             parse_mode=ParseMode.HTML
         )
         return
 
-    alert_hash = context.args[0]
-    message = " ".join(context.args[1:]) if len(context.args) > 1 else "Escalated via Telegram"
+    title, query, unit = GRAPH_PRESETS.get(query.lower(), (query, query, ""))
+    seconds = parse_duration(time_range)
+    if seconds > GRAPH_MAX_RANGE:
+        await update.message.reply_text(f"❌ Range too large (max {GRAPH_MAX_RANGE // 86400}d)")
+        return
 
-    # Log escalation for audit trail
-    escalation_time = datetime.now(TIMEZONE)
-    log_escalation(alert_hash, message)
+    key = graph_key(query, seconds)
+    try:
+        series = await fetch_graph_series(key)
+    except Exception as e:
+        await update.message.reply_text(f"❌ Error: {str(e)}")
+        return
 
-    await update.message.reply_text(
-        f"🚨 <b>Alert Escalated</b>\n\n"
-        f"Hash: <code>{alert_hash}</code>\n"
-        f"Message: {message}\n"
-        f"Time: {escalation_time.strftime('%H:%M:%S')}\n\n"
-        f"<i>Escalation logged. On-call team notified.</i>",
-        parse_mode=ParseMode.HTML
-    )
+    if not series:
+        await update.message.reply_text("📭 No data for this query and range.")
+        return
 
+    if not png:
+        await update.message.reply_text(
+            format_graph_text(title, time_range, series, unit),
+            parse_mode=ParseMode.HTML
+        )
+        return
 
-async def resolve_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Mark an alert as resolved."""
+    shown = series[:GRAPH_MAX_SERIES]
+    image = graph_cache.get(key + ("png",))
+    if image is None:
+        await context.bot.send_chat_action(update.effective_chat.id, "upload_photo")
+        loop = asyncio.get_running_loop()
+        image = await loop.run_in_executor(stats_executor, render_graph_png, shown)
+        graph_cache.set(key + ("png",), image)
+
+    lo = min(v for _, points in shown for _, v in points)
+    hi = max(v for _, points in shown for _, v in points)
+    caption = [f"📈 {title[:200]} | last {time_range}",
+               f"Scale: {format_graph_value(lo, unit)} – {format_graph_value(hi, unit)}"]
+    for index, (label, _) in enumerate(shown):
+        caption.append(f"{GRAPH_COLORS[index % len(GRAPH_COLORS)][0]} {label[:60]}")
+    await update.message.reply_photo(photo=image, caption="\n".join(caption)[:1024])
+
+
+# ============================================
+# PROMETHEUS STATUS
+# ============================================
+
+# Instant query results keyed by PromQL
+prom_cache = TTLCache(PROM_CACHE_TTL)
+
+COMPARATORS = {
+    ">": operator.gt, "<": operator.lt, ">=": operator.ge,
+    "<=": operator.le, "==": operator.eq, "!=": operator.ne,
+}
+
+
+def eval_constant(text: str) -> Optional[float]:
+    """Value of a numeric PromQL literal like "86400 * 14", None for anything else."""
+    def walk(node):
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return float(node.value)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            return -walk(node.operand)
+        if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Add, ast.Sub, ast.Mult, ast.Div)):
+            left, right = walk(node.left), walk(node.right)
+            return {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv}[type(node.op)](left, right)
+        raise ValueError("not a constant")
+
+    try:
+        return walk(ast.parse(text.strip().strip("()"), mode="eval").body)
+    except (SyntaxError, ValueError, ZeroDivisionError):
+        return None
+
+
+def split_rule_condition(expr: str) -> Optional[tuple]:
+    """Split an alert expression ending in a constant comparison into (query, op, threshold)."""
+    depth = 0
+    i = len(expr)
+    while i > 0:
+        i -= 1
+        ch = expr[i]
+        if ch in ")}]":
+            depth += 1
+        elif ch in "({[":
+            depth -= 1
+        elif ch == '"':
+            # Skip quoted label values
+            i = expr.rfind('"', 0, i)
+        elif depth == 0 and ch in "<>=!":
+            start = i - 1 if expr[i - 1:i + 1] in COMPARATORS else i
+            op = expr[start:i + 1]
+            if op not in COMPARATORS:
+                return None
+            query, threshold = expr[:start].strip(), eval_constant(expr[i + 1:])
+            # "a or b > x" compares only b, so it has no single value to show
+            if threshold is None or re.search(r"\s(or|and|unless)\s", query):
+                return None
+            return query, op, threshold
+    return None
+
+
+def get_rule_levels(names: tuple) -> Optional[dict]:
+    """Shared value query plus (severity, op, threshold) per rule, or None if they differ or are missing."""
+    levels = []
+    query = None
+    for name in names:
+        rule = runbook_index.rules.get(name)
+        condition = split_rule_condition(rule["expr"]) if rule else None
+        if not condition or (query and condition[0] != query):
+            return None
+        query = condition[0]
+        levels.append((rule["labels"].get("severity", "warning"), condition[1], condition[2]))
+    return {"query": query, "levels": levels} if query else None
+
+
+def grade_value(value: float, levels: List[tuple]) -> str:
+    """🔴/🟡/🟢 for a value, exactly as the alert rules would judge it."""
+    firing = {severity for severity, op, threshold in levels if COMPARATORS[op](value, threshold)}
+    if "critical" in firing:
+        return "🔴"
+    return "🟡" if firing else "🟢"
+
+
+def format_status_value(value: float, unit: str) -> str:
+    if unit == "duration":
+        return format_uptime(value) if value > 0 else "expired"
+    if unit == "ratio":
+        return f"{value * 100:.1f}%"
+    if unit == "s":
+        return f"{value:.2f}s"
+    return format_graph_value(value, unit)
+
+
+def describe_series(labels: dict) -> str:
+    """Short name for a series: its container, instance or job."""
+    return next((labels[k] for k in ("name", "instance", "job", "datname") if labels.get(k)), "")
+
+
+async def prometheus_instant(query: str, ttl: Optional[float] = None) -> List[tuple]:
+    """Instant query as [(labels, value)], bounded by PROM_QUERY_TIMEOUT and cached briefly."""
+    cached = prom_cache.get(query)
+    if cached is not None:
+        return cached
+    data = await asyncio.wait_for(prometheus_get("/api/v1/query", {"query": query}), PROM_QUERY_TIMEOUT)
+    if data["resultType"] == "scalar":
+        result = [({}, float(data["result"][1]))]
+    else:
+        result = [(item["metric"], float(item["value"][1])) for item in data["result"]]
+    prom_cache.set(query, result, ttl)
+    return result
+
+
+async def prometheus_batch(queries: List[str], ttl: Optional[float] = None) -> Dict[str, object]:
+    """Run instant queries concurrently; failed or timed-out queries map to their exception."""
+    unique = list(dict.fromkeys(queries))
+    results = await asyncio.gather(*(prometheus_instant(q, ttl) for q in unique), return_exceptions=True)
+    return dict(zip(unique, results))
+
+
+def get_alert_rule_queries() -> Dict[str, str]:
+    """Alert name -> full expression for every rule worth evaluating."""
+    return {
+        name: rule["expr"] for name, rule in runbook_index.rules.items()
+        if rule["labels"].get("severity", "none") != "none"
+    }
+
+
+def evaluate_alert_rules(results: Dict[str, object]) -> tuple:
+    """(issues, warnings, failed) from the batch: a rule whose expression returns series is breached."""
+    issues, warnings, failed = [], [], 0
+    for name, expr in get_alert_rule_queries().items():
+        result = results.get(expr)
+        if isinstance(result, Exception):
+            failed += 1
+            continue
+        if not result:
+            continue
+        rule = runbook_index.rules[name]
+        targets = ", ".join(sorted({describe_series(labels) for labels, _ in result} - {""})[:3])
+        line = f"{html.escape(name)}" + (f" ({html.escape(targets)})" if targets else "")
+        summary = rule["annotations"].get("summary")
+        if summary:
+            line += f": {html.escape(summary)}"
+        if rule["labels"].get("severity") == "critical":
+            issues.append(f"🔴 {line}")
+        else:
+            warnings.append(f"🟡 {line}")
+    return issues, warnings, failed
+
+
+async def format_prometheus_status() -> str:
+    """System status from Prometheus, graded by the thresholds in alerts.yml."""
+    if not runbook_index.rules:
+        return f"⚠️ No alert rules loaded from {ALERT_RULES_FILE}"
+
+    rows = [(section, label, get_rule_levels(names), unit) for section, label, names, unit in PROM_STATUS_ROWS]
+    queries = [levels["query"] for _, _, levels, _ in rows if levels]
+    queries += [q for pair in PROM_STATUS_COUNTS.values() for q in pair]
+    queries += list(get_alert_rule_queries().values())
+    results = await prometheus_batch(queries)
+
+    sections = defaultdict(list)
+    for section, label, levels, unit in rows:
+        result = results.get(levels["query"]) if levels else None
+        # Exporters that are not deployed simply have no rows
+        if not result or isinstance(result, Exception):
+            continue
+        values = [(value, labels) for labels, value in result if not math.isnan(value)]
+        if not values:
+            continue
+        # The worst series in the direction the rules alert on
+        pick = min if levels["levels"][0][1] in ("<", "<=") else max
+        value, labels = pick(values, key=lambda item: item[0])
+        where = describe_series(labels) if len(values) > 1 else ""
+        sections[section].append(
+            f"{grade_value(value, levels['levels'])} {label}: {format_status_value(value, unit)}"
+            + (f" ({html.escape(where)})" if where else "")
+        )
+
+    lines = ["📊 <b>System Status</b> | Prometheus", "<code>━━━━━━━━━━━━━━━━━━━━━</code>"]
+    titles = {"host": "🖥️ Host", "containers": "🐳 Containers", "traffic": "🌐 Traffic & Sites", "database": "🗄️ Databases"}
+    for section, title in titles.items():
+        if sections[section]:
+            lines += ["", f"<b>{title}</b>"]
+            lines += [("└ " if i == len(sections[section]) - 1 else "├ ") + row for i, row in enumerate(sections[section])]
+
+    counts = []
+    for label, (up_query, total_query) in PROM_STATUS_COUNTS.items():
+        up, total = results.get(up_query), results.get(total_query)
+        if total and not isinstance(total, Exception) and not isinstance(up, Exception):
+            counts.append(f"{label}: {int(up[0][1]) if up else 0}/{int(total[0][1])}")
+    if counts:
+        lines += ["", " | ".join(counts)]
+
+    issues, warnings, failed = evaluate_alert_rules(results)
+    lines += ["", f"🚨 Rules breached: 🔴 {len(issues)} | 🟡 {len(warnings)} (of {len(get_alert_rule_queries())})"]
+
+    errors = sum(1 for r in results.values() if isinstance(r, Exception))
+    if errors:
+        lines.append(f"⏱️ {errors}/{len(results)} queries failed or timed out")
+    lines.append(f"🕐 {datetime.now(TIMEZONE).strftime('%d.%m.%Y %H:%M')}")
+    return "\n".join(lines)
+
+
+async def format_prometheus_health() -> str:
+    """Health check that evaluates every alert rule expression in one concurrent batch."""
+    if not runbook_index.rules:
+        return f"⚠️ No alert rules loaded from {ALERT_RULES_FILE}"
+
+    rules = get_alert_rule_queries()
+    issues, warnings, failed = evaluate_alert_rules(await prometheus_batch(list(rules.values())))
+    text = format_issues_text(issues, warnings, [f"• All {len(rules)} alert rules clear"])
+    text += "\n\n<i>Rule conditions as of now, before their <code>for</code> delay.</i>"
+    if failed:
+        text += f"\n⏱️ {failed}/{len(rules)} rule queries failed or timed out"
+    return text
+
+
+# ============================================
+# DATABASE STATUS
+# ============================================
+
+# Exporter queries for /db, one series per instance, sent as one batch
+DB_QUERIES = {
+    "pg_up": "max by(instance) (pg_up)",
+    "pg_connections": "sum by(instance) (pg_stat_activity_count)",
+    "pg_max_connections": "max by(instance) (pg_settings_max_connections)",
+    "pg_cache_hit": (
+        "sum by(instance) (rate(pg_stat_database_blks_hit[5m])) / ("
+        "sum by(instance) (rate(pg_stat_database_blks_hit[5m])) + sum by(instance) (rate(pg_stat_database_blks_read[5m])))"
+    ),
+    "pg_replication_lag": "max by(instance) (pg_replication_lag_seconds or pg_replication_lag)",
+    "pg_longest_tx": "max by(instance) (pg_stat_activity_max_tx_duration)",
+    "redis_up": "max by(instance) (redis_up)",
+    "redis_memory": "max by(instance) (redis_memory_used_bytes)",
+    "redis_max_memory": "max by(instance) (redis_memory_max_bytes)",
+    "redis_evictions": "sum by(instance) (rate(redis_evicted_keys_total[5m]))",
+    "redis_hit": (
+        "sum by(instance) (rate(redis_keyspace_hits_total[5m])) / ("
+        "sum by(instance) (rate(redis_keyspace_hits_total[5m])) + sum by(instance) (rate(redis_keyspace_misses_total[5m])))"
+    ),
+    "redis_clients": "sum by(instance) (redis_connected_clients)",
+}
+
+# (kind, instance, metric) -> recent (monotonic time, value) samples for trend arrows
+db_samples: Dict[tuple, deque] = {}
+
+EMOJI_RANK = {"🔴": 2, "🟡": 1, "🟢": 0, "": 0}
+
+
+def db_trend(key: tuple, value: float) -> str:
+    """↑/↓/→ against the newest sample at least DB_TREND_MIN_AGE old, empty until one exists."""
+    now = monotonic()
+    samples = db_samples.setdefault(key, deque(maxlen=3))
+    baseline = next((v for t, v in reversed(samples) if now - t >= DB_TREND_MIN_AGE), None)
+    if not samples or now - samples[-1][0] >= DB_TREND_MIN_AGE:
+        samples.append((now, value))
+    if baseline is None:
+        return ""
+    if abs(value - baseline) <= DB_TREND_TOLERANCE * abs(baseline):
+        return "→"
+    return "↑" if value > baseline else "↓"
+
+
+def get_connection_levels() -> List[tuple]:
+    """PostgreSQL connection rules as (severity, ">", percent of max_connections)."""
+    levels = []
+    for name in ("PostgreSQLHighConnections", "PostgreSQLCriticalConnections"):
+        rule = runbook_index.rules.get(name)
+        m = rule and re.search(r"pg_settings_max_connections\s*\*\s*([\d.]+)", rule["expr"])
+        if m:
+            levels.append((rule["labels"].get("severity", "warning"), ">", float(m.group(1)) * 100))
+    return levels
+
+
+def grade_by_rules(value: float, names: tuple) -> str:
+    """Emoji for a value from the named alert rules, empty if they have no constant threshold."""
+    levels = get_rule_levels(names)
+    return grade_value(value, levels["levels"]) if levels else ""
+
+
+async def collect_db_instances() -> tuple:
+    """({(kind, instance): {metric: value}}, failed query count) from one concurrent batch."""
+    results = await prometheus_batch(list(DB_QUERIES.values()))
+    instances = defaultdict(dict)
+    failed = 0
+    for metric, query in DB_QUERIES.items():
+        result = results[query]
+        if isinstance(result, Exception):
+            failed += 1
+            continue
+        kind = "postgres" if metric.startswith("pg_") else "redis"
+        for labels, value in result:
+            if not math.isnan(value):
+                instances[(kind, labels.get("instance", "?"))][metric] = value
+    return instances, failed
+
+
+def format_db_instance(kind: str, instance: str, m: dict) -> tuple:
+    """(worst emoji, message block) for one PostgreSQL or Redis instance."""
+    rows = []
+
+    def row(label: str, metric: str, text: str, emoji: str = "", value: Optional[float] = None):
+        arrow = db_trend((kind, instance, metric), m[metric] if value is None else value)
+        rows.append((emoji, f"{label}: {text} {emoji}{arrow}".rstrip()))
+
+    if kind == "postgres":
+        icon, up = "🐘", m.get("pg_up", 1)
+        if "pg_connections" in m:
+            connections, limit = m["pg_connections"], m.get("pg_max_connections")
+            if limit:
+                percent = connections / limit * 100
+                row("Connections", "pg_connections", f"{connections:.0f}/{limit:.0f} ({percent:.0f}%)",
+                    grade_value(percent, get_connection_levels()))
+            else:
+                row("Connections", "pg_connections", f"{connections:.0f}")
+        if "pg_cache_hit" in m:
+            row("Cache hit", "pg_cache_hit", f"{m['pg_cache_hit'] * 100:.1f}%",
+                grade_by_rules(m["pg_cache_hit"], ("PostgreSQLLowCacheHitRatio",)))
+        if "pg_replication_lag" in m:
+            row("Replication lag", "pg_replication_lag", f"{m['pg_replication_lag']:.1f}s")
+        if "pg_longest_tx" in m:
+            row("Longest tx", "pg_longest_tx", format_stat_duration(m["pg_longest_tx"]),
+                grade_by_rules(m["pg_longest_tx"], ("PostgreSQLSlowQueries",)))
+    else:
+        icon, up = "⚡", m.get("redis_up", 1)
+        if "redis_memory" in m:
+            used, limit = m["redis_memory"], m.get("redis_max_memory")
+            if limit:
+                percent = used / limit * 100
+                row("Memory", "redis_memory", f"{format_bytes(used)}/{format_bytes(limit)} ({percent:.0f}%)",
+                    grade_by_rules(percent, ("RedisHighMemory", "RedisCriticalMemory")))
+            else:
+                row("Memory", "redis_memory", f"{format_bytes(used)} (no maxmemory)")
+        if "redis_evictions" in m:
+            row("Evictions", "redis_evictions", f"{m['redis_evictions']:.1f}/s")
+        if "redis_hit" in m:
+            row("Hit rate", "redis_hit", f"{m['redis_hit'] * 100:.1f}%",
+                grade_by_rules(m["redis_hit"], ("RedisLowHitRate",)))
+        if "redis_clients" in m:
+            row("Clients", "redis_clients", f"{m['redis_clients']:.0f}",
+                grade_by_rules(m["redis_clients"], ("RedisHighConnectionCount",)))
+
+    worst = "🔴" if not up else max((e for e, _ in rows), key=EMOJI_RANK.get, default="🟢") or "🟢"
+    lines = [f"{icon} <b>{html.escape(instance)}</b> {worst}"]
+    if not up:
+        lines.append("└ 🔴 Exporter cannot reach the database")
+    lines += [("└ " if i == len(rows) - 1 else "├ ") + text for i, (_, text) in enumerate(rows) if up]
+    return worst, "\n".join(lines)
+
+
+async def db_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """PostgreSQL and Redis health per instance from the exporters."""
     if not is_authorized(update.effective_chat.id):
         await update.message.reply_text("⛔ Unauthorized access!")
         return
 
-    if not context.args:
-        # Show resolvable alerts
-        firing_alerts = [h for h, info in alert_history.items() if info.get("status") == "firing"]
+    try:
+        instances, failed = await collect_db_instances()
+    except Exception as e:
+        await update.message.reply_text(f"❌ Error: {str(e)}")
+        return
 
-        if not firing_alerts:
-            await update.message.reply_text("✅ No active alerts to resolve")
-            return
+    if not instances:
+        await update.message.reply_text(
+            "ℹ️ No PostgreSQL or Redis exporter metrics in Prometheus.\n"
+            "Enable postgres-exporter / redis-exporter in docker-compose.yml and prometheus.yml."
+            + (f"\n⏱️ {failed}/{len(DB_QUERIES)} queries failed or timed out" if failed else "")
+        )
+        return
 
-        lines = ["🔧 <b>Resolvable Alerts</b>", ""]
-        for alert_hash in firing_alerts[:10]:
-            info = alert_history.get(alert_hash, {})
-            alertname = info.get("alert", {}).get("labels", {}).get("alertname", "?")
-            lines.append(f"• <code>{alert_hash}</code> - {alertname}")
+    if context.args:
+        wanted = context.args[0].lower()
+        instances = {key: m for key, m in instances.items() if wanted in key[1].lower()}
+        if not instances:
+            await update.message.reply_text(f"❌ No database instance matches: {context.args[0]}")
+            return
 
-        lines.append("")
-        lines.append("<i>Usage: /resolve <hash></i>")
-        await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
-        return
+    # Worst instances first, so problems are on page one
+    blocks = [format_db_instance(kind, instance, m) for (kind, instance), m in sorted(instances.items())]
+    blocks.sort(key=lambda b: EMOJI_RANK[b[0]], reverse=True)
 
-    alert_hash = context.args[0]
+    counts = defaultdict(int)
+    for kind, _ in instances:
+        counts[kind] += 1
+    title = (
+        f"🗄️ <b>Databases</b> | 🐘 {counts['postgres']} · ⚡ {counts['redis']} | "
+        f"🔴 {sum(1 for e, _ in blocks if e == '🔴')} · 🟡 {sum(1 for e, _ in blocks if e == '🟡')}"
+    )
+    if failed:
+        title += f"\n⏱️ {failed}/{len(DB_QUERIES)} queries failed or timed out"
 
-    # Update alert status
-    if alert_hash in alert_history:
-        alert_history[alert_hash]["status"] = "resolved"
-        alert_history[alert_hash]["resolved_at"] = datetime.now(TIMEZONE).isoformat()
-        alert_history[alert_hash]["resolved_by"] = "telegram-user"
+    pages = ["\n\n".join(text for _, text in blocks[i:i + DB_PAGE_SIZE]) for i in range(0, len(blocks), DB_PAGE_SIZE)]
+    await send_paginated(update.message, PaginatedView(title, pages=pages))
 
-        await update.message.reply_text(
-            f"✅ Alert <code>{alert_hash}</code> marked as resolved\n\n"
-            f"<i>Note: If alert persists in Prometheus, it may re-trigger.</i>",
-            parse_mode=ParseMode.HTML
-        )
-    else:
-        await update.message.reply_text(f"❌ Alert not found: {alert_hash}")
 
+# ============================================
+# TRAEFIK TRAFFIC
+# ============================================
 
-async def snooze_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Snooze alerts for a specified duration."""
+def get_traffic_queries(label: str) -> Dict[str, str]:
+    """Per-router (or per-service) rate, 5xx rate and latency quantile queries."""
+    metric = f"traefik_{label}"
+    queries = {
+        "rps": f"sum by({label}) (rate({metric}_requests_total[{TRAFFIC_WINDOW}]))",
+        "errors": f'sum by({label}) (rate({metric}_requests_total{{code=~"5.."}}[{TRAFFIC_WINDOW}]))',
+    }
+    for q in (50, 95, 99):
+        queries[f"p{q}"] = (
+            f"histogram_quantile(0.{q}, sum by({label}, le) "
+            f"(rate({metric}_request_duration_seconds_bucket[{TRAFFIC_WINDOW}])))"
+        )
+    return queries
+
+
+def find_router_project(router: str) -> Optional[dict]:
+    """Project a Traefik router belongs to, by container name or project id prefix."""
+    base = router.split("@")[0].lower()
+    projects = get_projects()
+    project_id = container_index.get(base, {}).get("project")
+    if project_id in projects:
+        return projects[project_id]
+    matches = [p for p in projects if base == p.lower() or re.match(rf"{re.escape(p.lower())}[-_.]", base)]
+    return projects[max(matches, key=len)] if matches else None
+
+
+def format_latency(seconds: Optional[float]) -> str:
+    if seconds is None or math.isnan(seconds):
+        return "-"
+    return f"{seconds * 1000:.0f}ms" if seconds < 1 else f"{seconds:.2f}s"
+
+
+async def collect_traffic() -> tuple:
+    """({router: {metric: value}}, label, failed) from one batch; services stand in without router metrics."""
+    by_label = {label: get_traffic_queries(label) for label in ("router", "service")}
+    results = await prometheus_batch([q for queries in by_label.values() for q in queries.values()], ttl=TRAFFIC_CACHE_TTL)
+
+    for label, queries in by_label.items():
+        rows = defaultdict(dict)
+        failed = 0
+        for metric, query in queries.items():
+            result = results[query]
+            if isinstance(result, Exception):
+                failed += 1
+                continue
+            for labels, value in result:
+                if label in labels and not math.isnan(value):
+                    rows[labels[label]][metric] = value
+        rows = {name: m for name, m in rows.items() if m.get("rps", 0) > 0}
+        if rows or label == "service":
+            return rows, label, failed
+
+
+def score_traffic(m: dict, latency_threshold: float) -> float:
+    """Affected requests/s: 5xx responses plus the share the quantiles prove slower than the threshold."""
+    # p50 over the threshold means at least half the requests are slow, p95 at least 5%, p99 at least 1%
+    slow_share = next((share for q, share in (("p50", 0.5), ("p95", 0.05), ("p99", 0.01)) if m.get(q, 0) > latency_threshold), 0)
+    return m.get("errors", 0) + m["rps"] * slow_share
+
+
+def format_traffic_row(name: str, m: dict) -> tuple:
+    """(worst emoji, block) for one router."""
+    error_percent = m.get("errors", 0) / m["rps"] * 100
+    error_emoji = grade_by_rules(error_percent, ("HighErrorRate", "CriticalErrorRate"))
+    latency_emoji = grade_by_rules(m["p95"], ("HighLatency",)) if "p95" in m else ""
+    worst = max((error_emoji, latency_emoji), key=EMOJI_RANK.get) or "🟢"
+
+    header = f"{worst} <b>{html.escape(name)}</b>"
+    project = find_router_project(name)
+    if project:
+        project_name = html.escape(project["name"])
+        header += f" → <a href=\"{html.escape(project['url'])}\">{project_name}</a>" if project["url"] else f" → {project_name}"
+    return worst, "\n".join([
+        header,
+        f"├ {m['rps']:.2f} req/s | 5xx {error_percent:.1f}% {error_emoji}".rstrip(),
+        f"└ p50 {format_latency(m.get('p50'))} · p95 {format_latency(m.get('p95'))} · "
+        f"p99 {format_latency(m.get('p99'))} {latency_emoji}".rstrip(),
+    ])
+
+
+async def traffic_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Traefik routers by impact: request rate, 5xx ratio and latency percentiles."""
     if not is_authorized(update.effective_chat.id):
         await update.message.reply_text("⛔ Unauthorized access!")
         return
 
-    if len(context.args) < 1:
+    try:
+        rows, label, failed = await collect_traffic()
+    except Exception as e:
+        await update.message.reply_text(f"❌ Error: {str(e)}")
+        return
+
+    if context.args:
+        wanted = context.args[0].lower()
+        rows = {name: m for name, m in rows.items() if wanted in name.lower()}
+    if not rows:
         await update.message.reply_text(
-            "💤 <b>Snooze - Alert Snooze</b>\n\n"
-            "Usage: /snooze <duration> [alertname]\n\n"
-            "Examples:\n"
-            "• /snooze 30m - Snooze all for 30 minutes\n"
-            "• /snooze 2h HighCPU - Snooze specific alert for 2 hours\n\n"
-            "Durations: 15m, 30m, 1h, 2h, 4h, 8h, 24h",
-            parse_mode=ParseMode.HTML
+            f"❌ No Traefik traffic in the last {TRAFFIC_WINDOW}"
+            + (f" for {context.args[0]}" if context.args else "")
+            + (f"\n⏱️ {failed} queries failed or timed out" if failed else "")
         )
         return
 
-    duration_str = context.args[0].lower()
-    alertname = context.args[1] if len(context.args) > 1 else None
+    # HighLatency's threshold decides when a slow router counts as fully affected
+    latency = get_rule_levels(("HighLatency",))
+    latency_threshold = latency["levels"][0][2] if latency else 1.0
+    ranked = sorted(rows.items(), key=lambda item: (score_traffic(item[1], latency_threshold), item[1]["rps"]), reverse=True)
+    blocks = [format_traffic_row(name, m)[1] for name, m in ranked]
+
+    total_rps = sum(m["rps"] for m in rows.values())
+    total_errors = sum(m.get("errors", 0) for m in rows.values())
+    title = (
+        f"🚦 <b>Traffic</b> | {len(rows)} {label}s · {total_rps:.1f} req/s · "
+        f"5xx {total_errors / total_rps * 100:.1f}% | last {TRAFFIC_WINDOW}"
+    )
+    if label == "service":
+        title += "\n<i>Per service: enable addRoutersLabels in Traefik for per-router numbers</i>"
+    if failed:
+        title += f"\n⏱️ {failed} queries failed or timed out"
 
-    # Parse duration
-    minutes = 60  # default 1h
-    if duration_str.endswith('m'):
-        minutes = int(duration_str[:-1])
-    elif duration_str.endswith('h'):
-        minutes = int(duration_str[:-1]) * 60
+    pages = ["\n\n".join(blocks[i:i + TRAFFIC_PAGE_SIZE]) for i in range(0, len(blocks), TRAFFIC_PAGE_SIZE)]
+    await send_paginated(update.message, PaginatedView(title, pages=pages))
 
-    try:
-        matchers = []
-        if alertname:
-            matchers.append({"name": "alertname", "value": alertname, "isRegex": False})
-        else:
-            # Snooze all non-critical alerts
-            matchers.append({"name": "severity", "value": "critical", "isRegex": False, "isEqual": False})
 
-        async with aiohttp.ClientSession() as session:
-            silence_data = {
-                "matchers": matchers,
-                "startsAt": datetime.now(pytz.UTC).isoformat(),
-                "endsAt": (datetime.now(pytz.UTC) + timedelta(minutes=minutes)).isoformat(),
-                "createdBy": "telegram-bot",
-                "comment": f"Snoozed via /snooze for {duration_str}",
-            }
-            async with session.post(f"{ALERTMANAGER_URL}/api/v2/silences", json=silence_data) as resp:
-                if resp.status == 200:
-                    target = alertname if alertname else "all alerts"
-                    await update.message.reply_text(
-                        f"💤 <b>{target}</b> snoozed for {duration_str}\n"
-                        f"⏰ Ends: {(datetime.now(TIMEZONE) + timedelta(minutes=minutes)).strftime('%H:%M')}",
-                        parse_mode=ParseMode.HTML
-                    )
-                else:
-                    await update.message.reply_text(f"❌ Snooze failed: {resp.status}")
-    except Exception as e:
-        await update.message.reply_text(f"❌ Error: {str(e)}")
+# ============================================
+# DISK USAGE SCANNER
+# ============================================
 
+def scan_directory_tree(top: str, previous: Dict[str, dict]) -> Dict[str, dict]:
+    """Index every directory under `top`, listing only those whose mtime changed.
 
-async def oncall_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Show on-call schedule and current on-call person."""
-    if not is_authorized(update.effective_chat.id):
-        await update.message.reply_text("⛔ Unauthorized access!")
+    Runs in a worker process. An unchanged directory keeps its previous
+    listing and only re-stats its large files, since appends to a file
+    don't touch the directory mtime.
+    """
+    entries = {}
+
+    def walk(path: str) -> int:
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return 0
+        old = previous.get(path)
+        if old and old["mtime"] == mtime:
+            big = {}
+            for name in old["big"]:
+                try:
+                    big[name] = os.lstat(os.path.join(path, name)).st_blocks * 512
+                except OSError:
+                    continue
+            entry = {**old, "big": big}
+        else:
+            entry = {"mtime": mtime, "files": 0, "big": {}, "dirs": []}
+            try:
+                with os.scandir(path) as it:
+                    for item in it:
+                        try:
+                            if item.is_dir(follow_symlinks=False):
+                                entry["dirs"].append(item.name)
+                                continue
+                            size = item.stat(follow_symlinks=False).st_blocks * 512
+                        except OSError:
+                            continue
+                        if size >= DU_BIG_FILE:
+                            entry["big"][item.name] = size
+                        else:
+                            entry["files"] += size
+            except OSError:
+                entry["error"] = True
+
+        size = entry["files"] + sum(entry["big"].values())
+        for name in entry["dirs"]:
+            size += walk(os.path.join(path, name))
+        entry["size"] = size
+        entries[path] = entry
+        return size
+
+    walk(top)
+    return entries
+
+
+async def refresh_du_index(context: ContextTypes.DEFAULT_TYPE = None) -> None:
+    """Rescan all DU_ROOTS in a process pool and save the index (job queue callback)."""
+    global du_full_scan_at
+
+    if du_scan_lock.locked():
         return
 
-    # In production, this would fetch from PagerDuty/OpsGenie API
-    now = datetime.now(TIMEZONE)
-    current_hour = now.hour
+    async with du_scan_lock:
+        now = datetime.now().timestamp()
+        full = now - du_full_scan_at > DU_FULL_RESCAN
+        roots = [root for root in DU_ROOTS.values() if os.path.isdir(root)]
+        if not roots:
+            return
 
-    # Simple rotation logic (example)
-    if 9 <= current_hour < 18:
-        shift = "Day Shift (09:00-18:00)"
-        oncall_person = "Primary On-Call"
-    elif 18 <= current_hour < 24:
-        shift = "Evening Shift (18:00-00:00)"
-        oncall_person = "Secondary On-Call"
-    else:
-        shift = "Night Shift (00:00-09:00)"
-        oncall_person = "Night On-Call"
+        loop = asyncio.get_running_loop()
+        # Short-lived workers: nothing stays resident between scans
+        pool = ProcessPoolExecutor(max_workers=min(DU_WORKERS, len(roots)))
+        try:
+            results = await asyncio.gather(*(
+                loop.run_in_executor(pool, scan_directory_tree, root, {} if full else du_index.get(root, {}))
+                for root in roots
+            ), return_exceptions=True)
+        finally:
+            pool.shutdown(wait=False)
+
+        for root, result in zip(roots, results):
+            if isinstance(result, Exception):
+                logger.error(f"Disk usage scan of {root} failed: {result}")
+                continue
+            du_index[root] = result
+            du_scanned_at[root] = now
+        if full:
+            du_full_scan_at = now
 
-    await update.message.reply_text(
-        f"📞 <b>On-Call Status</b>\n\n"
-        f"<b>Current Time:</b> {now.strftime('%d.%m.%Y %H:%M')}\n"
-        f"<b>Shift:</b> {shift}\n"
-        f"<b>On-Call:</b> {oncall_person}\n\n"
-        f"<i>For emergencies, contact on-call directly.</i>",
-        parse_mode=ParseMode.HTML
-    )
+        total = sum(len(entries) for entries in du_index.values())
+        logger.info(f"Disk usage scan finished: {len(roots)} roots, {total} directories{' (full)' if full else ''}")
+        await save_du_index()
 
 
-async def grafana_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Show Grafana dashboard links."""
-    if not is_authorized(update.effective_chat.id):
-        await update.message.reply_text("⛔ Unauthorized access!")
+async def save_du_index() -> None:
+    payload = json.dumps({"roots": du_index, "scanned_at": du_scanned_at, "full_scan_at": du_full_scan_at})
+    try:
+        await write_json_file(DU_INDEX_FILE, payload)
+    except OSError as e:
+        logger.error(f"Failed to save disk usage index: {e}")
+
+
+def load_du_index() -> None:
+    """Restore the index saved by a previous run, so rescans stay incremental."""
+    global du_full_scan_at
+    try:
+        with open(DU_INDEX_FILE) as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring disk usage index {DU_INDEX_FILE}: {e}")
         return
+    roots = set(DU_ROOTS.values())
+    du_index.update({root: entries for root, entries in data.get("roots", {}).items() if root in roots})
+    du_scanned_at.update({root: at for root, at in data.get("scanned_at", {}).items() if root in roots})
+    du_full_scan_at = data.get("full_scan_at", 0.0)
+
+
+def resolve_du_path(arg: str) -> Optional[tuple]:
+    """Map "name/sub/dir" or an absolute path under a root to (root, path)."""
+    for root in DU_ROOTS.values():
+        if arg.rstrip("/") == root or arg.startswith(root + "/"):
+            return root, os.path.normpath(arg)
+    name, _, rest = arg.strip("/").partition("/")
+    root = DU_ROOTS.get(name)
+    if root is None:
+        return None
+    path = os.path.normpath(os.path.join(root, rest)) if rest else root
+    if path != root and not path.startswith(root + "/"):
+        return None
+    return root, path
 
-    dashboards = [
-        ("📊 VPS Overview", "vps-overview"),
-        ("🔔 Alerts", "alerts-overview"),
-        ("🐳 Docker", "docker-host-container"),
-        ("🌐 Traefik", "traefik"),
-        ("📜 Logs", "logs-explorer"),
-        ("🔒 Uptime & SSL", "website-uptime"),
-    ]
 
-    keyboard = []
-    for name, uid in dashboards:
-        keyboard.append([InlineKeyboardButton(name, url=f"{GRAFANA_URL}/d/{uid}")])
+def get_du_display_path(root: str, path: str) -> str:
+    name = next(n for n, r in DU_ROOTS.items() if r == root)
+    return name if path == root else f"{name}/{os.path.relpath(path, root)}"
 
-    await update.message.reply_text(
-        "📊 <b>Grafana Dashboards</b>\n\nSelect a dashboard:",
-        parse_mode=ParseMode.HTML,
-        reply_markup=InlineKeyboardMarkup(keyboard)
-    )
 
+def format_du_entry(root: str, path: str, limit: int) -> List[str]:
+    """Largest subdirectories and files of one indexed directory."""
+    entry = du_index[root][path]
+    children = [("📁", name, du_index[root].get(os.path.join(path, name), {}).get("size", 0)) for name in entry["dirs"]]
+    children += [("📄", name, size) for name, size in entry["big"].items()]
+    children.sort(key=lambda c: c[2], reverse=True)
 
-async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Show alert history with audit trail."""
+    lines = [f"<b>{html.escape(get_du_display_path(root, path))}</b> - {format_bytes(entry['size'])}"]
+    if entry.get("error"):
+        lines.append("├ ⚠️ Not readable by the bot")
+    shown = children[:limit]
+    rest = entry["size"] - sum(size for _, _, size in shown)
+    for i, (icon, name, size) in enumerate(shown):
+        share = size / entry["size"] * 100 if entry["size"] else 0
+        branch = "└" if i == len(shown) - 1 and rest <= 0 else "├"
+        lines.append(f"{branch} {icon} {html.escape(name)} {format_bytes(size)} ({share:.0f}%)")
+    if rest > 0:
+        lines.append(f"└ Other: {format_bytes(rest)}")
+    return lines
+
+
+async def du_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show the largest directories and files from the disk usage index."""
     if not is_authorized(update.effective_chat.id):
         await update.message.reply_text("⛔ Unauthorized access!")
         return
 
-    if not alert_history:
-        await update.message.reply_text("📜 Alert history is empty")
+    if not DU_ROOTS:
+        await update.message.reply_text("❌ No DU_ROOTS configured.")
         return
 
-    lines = ["📜 <b>Alert History</b>", ""]
+    arg = context.args[0] if context.args else ""
+    if arg.lower() == "refresh":
+        context.job_queue.run_once(refresh_du_index, when=0, name="du_refresh_now")
+        await update.message.reply_text("🗂 Disk usage rescan started.")
+        return
 
-    # Group by status
-    firing = [(h, i) for h, i in alert_history.items() if i.get("status") == "firing"]
-    resolved = [(h, i) for h, i in alert_history.items() if i.get("status") == "resolved"]
+    if not du_index:
+        context.job_queue.run_once(refresh_du_index, when=0, name="du_refresh_now")
+        await update.message.reply_text(
+            "🗂 Disk usage scan started in background.\n"
+            "<i>Try /du again in a minute.</i>",
+            parse_mode=ParseMode.HTML
+        )
+        return
 
-    if firing:
-        lines.append(f"<b>🔥 Active ({len(firing)})</b>")
-        for alert_hash, info in firing[:5]:
-            alertname = info.get("alert", {}).get("labels", {}).get("alertname", "?")
-            received = info.get("received_at", "?")[:16]
-            is_acked = "✅" if alert_hash in acknowledged_alerts else "⏳"
-            lines.append(f"  {is_acked} <code>{alert_hash}</code> {alertname}")
-            lines.append(f"     └ {received}")
+    try:
+        if arg:
+            resolved = resolve_du_path(arg)
+            if not resolved:
+                roots = ", ".join(f"<code>{html.escape(n)}</code>" for n in DU_ROOTS)
+                await update.message.reply_text(f"❌ Not under a scanned root. Roots: {roots}", parse_mode=ParseMode.HTML)
+                return
+            root, path = resolved
+            if path not in du_index.get(root, {}):
+                await update.message.reply_text(f"❌ Not in the index yet: <code>{html.escape(arg)}</code>", parse_mode=ParseMode.HTML)
+                return
+            targets = [(root, path, DU_TOP)]
+        else:
+            targets = [(root, root, 5) for root in DU_ROOTS.values() if root in du_index.get(root, {})]
 
-    if resolved:
-        lines.append(f"\n<b>✅ Resolved ({len(resolved)})</b>")
-        for alert_hash, info in resolved[:5]:
-            alertname = info.get("alert", {}).get("labels", {}).get("alertname", "?")
-            resolved_at = info.get("resolved_at", "?")[:16]
-            lines.append(f"  • <code>{alert_hash}</code> {alertname}")
-            lines.append(f"     └ Resolved: {resolved_at}")
+        pages = []
+        for root, path, limit in targets:
+            age = format_uptime(datetime.now().timestamp() - du_scanned_at.get(root, 0))
+            pages.append("\n".join(format_du_entry(root, path, limit) + ["", f"<i>Scanned {age} ago</i>"]))
 
-    keyboard = [
-        [InlineKeyboardButton("🗑️ Clear History", callback_data="clear_history")],
-        [InlineKeyboardButton("📊 Grafana Alerts", url=f"{GRAFANA_URL}/d/alerts-overview")],
-    ]
+        await send_paginated(update.message, PaginatedView("🗂 <b>Disk Usage</b>", pages=pages))
 
-    await update.message.reply_text(
-        "\n".join(lines),
-        parse_mode=ParseMode.HTML,
-        reply_markup=InlineKeyboardMarkup(keyboard)
-    )
+    except Exception as e:
+        await update.message.reply_text(f"❌ Error: {str(e)}")
 
 
-async def cpu_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Show detailed CPU information."""
-    if not is_authorized(update.effective_chat.id):
-        await update.message.reply_text("⛔ Unauthorized access!")
-        return
+# ============================================
+# DOCKER DISK USAGE
+# ============================================
 
-    cpu_percent = psutil.cpu_percent(interval=1, percpu=True)
-    cpu_avg = sum(cpu_percent) / len(cpu_percent)
-    cpu_count = psutil.cpu_count()
-    cpu_freq = psutil.cpu_freq()
-    load1, load5, load15 = psutil.getloadavg()
+# One `docker system df` result, and prune previews waiting for confirmation
+docker_df_cache = TTLCache(ttl=DOCKERDF_CACHE_TTL, maxsize=1)
+docker_df_lock = asyncio.Lock()
+prune_plans = TTLCache(ttl=DOCKER_PRUNE_PLAN_TTL, maxsize=16)
+
+
+def read_log_sizes() -> Dict[str, int]:
+    """json-file log size per container id, stat-ed by a root helper container.
+
+    The daemon mounts its containers directory read-only into the helper, so
+    the bot itself needs no access to the Docker data directory.
+    """
+    root = docker_client.info()["DockerRootDir"]
+    output = docker_client.containers.run(
+        DOCKER_HELPER_IMAGE,
+        ["sh", "-c", "stat -c '%s %n' /logs/*/*-json.log 2>/dev/null; true"],
+        volumes={f"{root}/containers": {"bind": "/logs", "mode": "ro"}},
+        user="0",
+        network_disabled=True,
+        remove=True,
+    )
+    logs = {}
+    for line in output.decode(errors="replace").splitlines():
+        size, _, path = line.partition(" ")
+        if size.isdigit():
+            logs[os.path.basename(os.path.dirname(path))] = int(size)
+    return logs
 
-    def make_bar(percent, width=10):
-        filled = int(percent / 100 * width)
-        return "█" * filled + "░" * (width - filled)
 
-    def get_status_emoji(percent):
-        if percent >= 90:
-            return "🔴"
-        elif percent >= 70:
-            return "🟡"
-        return "🟢"
+def read_docker_df() -> dict:
+    """One `docker system df` call plus the size of each container's json-file log."""
+    df = docker_client.df()
+    try:
+        df["LogSizes"], df["LogError"] = read_log_sizes(), None
+    except docker.errors.DockerException as e:
+        logger.warning(f"Container log sizes unavailable: {e}")
+        df["LogSizes"], df["LogError"] = None, str(e)[:80]
+    return df
+
+
+async def get_docker_df(fresh: bool = False) -> dict:
+    """Cached `docker system df`; concurrent callers share one API call."""
+    df = None if fresh else docker_df_cache.get("df")
+    if df is not None:
+        return df
+
+    async with docker_df_lock:
+        df = None if fresh else docker_df_cache.get("df")
+        if df is None:
+            df = await asyncio.get_running_loop().run_in_executor(stats_executor, read_docker_df)
+            docker_df_cache.set("df", df)
+        return df
+
+
+def get_df_container_name(container: dict) -> str:
+    return (container.get("Names") or [container["Id"][:12]])[0].lstrip("/")
+
+
+def is_dangling_image(image: dict) -> bool:
+    return not image.get("RepoTags") or image["RepoTags"] == ["<none>:<none>"]
+
+
+def summarize_docker_df(df: dict) -> Dict[str, dict]:
+    """Totals and reclaimable bytes per category, computed like `docker system df`."""
+    images = df.get("Images") or []
+    containers = df.get("Containers") or []
+    volumes = df.get("Volumes") or []
+    cache = df.get("BuildCache") or []
+
+    # Layers of images in use are not reclaimable, except the ones they share
+    used = sum(i["Size"] - i["SharedSize"] for i in images if i.get("Containers", 0) > 0 and i.get("SharedSize", -1) >= 0)
+    layers = df.get("LayersSize", 0)
+    volume_sizes = [(v.get("UsageData") or {}).get("Size", -1) for v in volumes]
+    volume_refs = [(v.get("UsageData") or {}).get("RefCount", 0) for v in volumes]
+
+    return {
+        "images": {
+            "count": len(images),
+            "active": sum(1 for i in images if i.get("Containers", 0) > 0),
+            "size": layers,
+            "reclaimable": max(layers - used, 0),
+            "dangling": [i for i in images if is_dangling_image(i)],
+        },
+        "containers": {
+            "count": len(containers),
+            "active": sum(1 for c in containers if c.get("State") == "running"),
+            "size": sum(c.get("SizeRw", 0) for c in containers),
+            "reclaimable": sum(c.get("SizeRw", 0) for c in containers if c.get("State") != "running"),
+        },
+        "volumes": {
+            "count": len(volumes),
+            "active": sum(1 for r in volume_refs if r > 0),
+            "size": sum(size for size in volume_sizes if size > 0),
+            "reclaimable": sum(size for size, refs in zip(volume_sizes, volume_refs) if size > 0 and refs == 0),
+            "largest": sorted(
+                ({"name": v["Name"], "size": size, "refs": refs} for v, size, refs in zip(volumes, volume_sizes, volume_refs) if size > 0),
+                key=lambda v: v["size"], reverse=True,
+            )[:DOCKER_TOP_VOLUMES],
+        },
+        "build_cache": {
+            "count": len(cache),
+            "active": sum(1 for b in cache if b.get("InUse")),
+            "size": sum(b.get("Size", 0) for b in cache if not b.get("Shared")),
+            "reclaimable": sum(b.get("Size", 0) for b in cache if not b.get("InUse") and not b.get("Shared")),
+        },
+    }
+
+
+def format_docker_df(df: dict) -> str:
+    summary = summarize_docker_df(df)
+    labels = {
+        "images": ("🖼", "Images", "in use"),
+        "containers": ("📦", "Containers", "running"),
+        "volumes": ("💾", "Volumes", "in use"),
+        "build_cache": ("🏗", "Build cache", "in use"),
+    }
+    lines = ["🐳 <b>Docker Disk Usage</b>", ""]
+
+    for key, (icon, label, active) in labels.items():
+        item = summary[key]
+        share = item["reclaimable"] / item["size"] * 100 if item["size"] else 0
+        lines.append(f"{icon} <b>{label}</b> {format_bytes(item['size'])}")
+        extra = []
+        if key == "images" and item["dangling"]:
+            extra.append(f"{len(item['dangling'])} dangling: {format_bytes(sum(i['Size'] for i in item['dangling']))}")
+        if key == "volumes":
+            for volume in item["largest"]:
+                unused = " (unused)" if volume["refs"] == 0 else ""
+                extra.append(f"{html.escape(volume['name'][:40])} {format_bytes(volume['size'])}{unused}")
+            if item["reclaimable"]:
+                extra.append("Unused volumes are never pruned by the bot")
+        lines.append(f"├ {item['count']} total, {item['active']} {active}")
+        for line in extra:
+            lines.append(f"├ {line}")
+        lines.append(f"└ Reclaimable: {format_bytes(item['reclaimable'])} ({share:.0f}%)")
+        lines.append("")
 
-    lines = [f"💻 <b>CPU Status</b> {get_status_emoji(cpu_avg)}", ""]
-    lines.append(f"<b>Average:</b> [{make_bar(cpu_avg)}] {cpu_avg:.1f}%")
-    lines.append(f"<b>Cores:</b> {cpu_count}")
-    if cpu_freq:
-        lines.append(f"<b>Frequency:</b> {cpu_freq.current:.0f} MHz")
-    lines.append(f"<b>Load:</b> {load1:.2f} / {load5:.2f} / {load15:.2f}")
+    logs = df.get("LogSizes")
+    if logs is None:
+        error = html.escape(df.get("LogError") or "unknown error")
+        lines.append(f"📜 <b>Logs</b>: <i>{DOCKER_HELPER_IMAGE} helper container failed: {error}</i>")
+    else:
+        names = {c["Id"]: get_df_container_name(c) for c in df.get("Containers") or []}
+        large = sorted(((size, cid) for cid, size in logs.items() if size >= DOCKER_LOG_WARN), reverse=True)
+        lines.append(f"📜 <b>Logs</b> {format_bytes(sum(logs.values()))}")
+        for i, (size, cid) in enumerate(large[:5]):
+            emoji = "🔴" if size >= DOCKER_LOG_WARN * 10 else "🟡"
+            branch = "└" if i == min(len(large), 5) - 1 else "├"
+            lines.append(f"{branch} {emoji} {html.escape(names.get(cid, cid[:12]))} {format_bytes(size)}")
+        if large:
+            lines.append("<i>Cap them with the json-file max-size log option</i>")
+
+    total = sum(item["reclaimable"] for item in summary.values())
     lines.append("")
-    lines.append("<b>Per Core:</b>")
-    for i, percent in enumerate(cpu_percent):
-        lines.append(f"  CPU{i}: [{make_bar(percent, 8)}] {percent:.0f}%")
+    lines.append(f"♻️ <b>Reclaimable</b>: {format_bytes(total)}")
+    return "\n".join(lines)
 
-    await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
+
+def build_prune_plan(df: dict) -> dict:
+    """What the safe prune removes: stopped non-compose containers, dangling images, unused build cache."""
+    containers, kept = [], []
+    for c in df.get("Containers") or []:
+        if c.get("State") == "running":
+            continue
+        # Compose containers may be stopped on purpose (/down), so they stay
+        if (c.get("Labels") or {}).get("com.docker.compose.project"):
+            kept.append(get_df_container_name(c))
+        else:
+            containers.append((c["Id"], get_df_container_name(c), c.get("SizeRw", 0)))
+    images = [(i["Id"], i["Id"].split(":")[-1][:12], i["Size"]) for i in df.get("Images") or [] if is_dangling_image(i)]
+    cache = summarize_docker_df(df)["build_cache"]["reclaimable"]
+    return {"containers": containers, "images": images, "build_cache": cache, "kept": kept}
+
+
+def format_prune_plan(plan: dict) -> str:
+    lines = ["🧹 <b>Prune Preview</b>", ""]
+    for key, label in (("containers", "Stopped containers"), ("images", "Dangling images")):
+        items = plan[key]
+        lines.append(f"<b>{label}</b>: {len(items)} ({format_bytes(sum(size for _, _, size in items))})")
+        for i, (_, name, size) in enumerate(items[:8]):
+            branch = "└" if i == len(items) - 1 else "├"
+            lines.append(f"{branch} {html.escape(name)} {format_bytes(size)}")
+        if len(items) > 8:
+            lines.append(f"└ ... and {len(items) - 8} more")
+    lines.append(f"<b>Build cache</b>: {format_bytes(plan['build_cache'])}")
+    if plan["kept"]:
+        lines.append(f"<i>Kept: {len(plan['kept'])} stopped compose containers</i>")
+    lines.append("<i>Volumes and container logs are not touched.</i>")
+    return "\n".join(lines)
 
 
-async def memory_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Show detailed memory information."""
+async def dockerdf_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show Docker disk usage with reclaimable space and large container logs."""
     if not is_authorized(update.effective_chat.id):
         await update.message.reply_text("⛔ Unauthorized access!")
         return
 
-    mem = psutil.virtual_memory()
-    swap = psutil.swap_memory()
+    try:
+        fresh = bool(context.args) and context.args[0].lower() == "refresh"
+        df = await get_docker_df(fresh)
+        buttons = [InlineKeyboardButton("🔄 Refresh", callback_data="dockerdf_refresh")]
+        if is_command_allowed(update.effective_chat.id, "prune"):
+            buttons.insert(0, InlineKeyboardButton("🧹 Prune preview", callback_data="dockerdf_preview"))
+        keyboard = [buttons]
+        await update.message.reply_text(
+            format_docker_df(df),
+            parse_mode=ParseMode.HTML,
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+    except Exception as e:
+        await update.message.reply_text(f"❌ Error: {str(e)}")
 
-    def make_bar(percent, width=10):
-        filled = int(percent / 100 * width)
-        return "█" * filled + "░" * (width - filled)
 
-    def get_status_emoji(percent):
-        if percent >= 90:
-            return "🔴"
-        elif percent >= 75:
-            return "🟡"
-        return "🟢"
+async def run_prune_plan(query, plan: dict) -> None:
+    """Remove exactly the previewed items, editing the message as it goes."""
+    loop = asyncio.get_running_loop()
+    done = []
+    last_edit = 0.0
 
-    text = f"""
-💾 <b>Memory Status</b> {get_status_emoji(mem.percent)}
+    async def progress(current: str, force: bool = False) -> None:
+        nonlocal last_edit
+        if not force and monotonic() - last_edit < 2:
+            return
+        last_edit = monotonic()
+        await query.edit_message_text("\n".join(["🧹 <b>Pruning...</b>", ""] + done + [current]), parse_mode=ParseMode.HTML)
 
-<b>RAM</b>
-├ [{make_bar(mem.percent)}] {mem.percent:.1f}%
-├ Used: {format_bytes(mem.used)}
-├ Available: {format_bytes(mem.available)}
-└ Total: {format_bytes(mem.total)}
+    # Without force, Docker refuses anything that started or got used since the preview
+    steps = (
+        ("Containers", plan["containers"], docker_client.api.remove_container),
+        ("Images", plan["images"], docker_client.api.remove_image),
+    )
+    for label, items, remove in steps:
+        removed, freed = 0, 0
+        for i, (item_id, _, size) in enumerate(items):
+            await progress(f"⏳ {label} {i}/{len(items)}", force=i == 0)
+            try:
+                await loop.run_in_executor(stats_executor, remove, item_id)
+                removed += 1
+                freed += size
+            except docker.errors.APIError as e:
+                logger.info(f"Prune skipped {item_id[:12]}: {e}")
+        done.append(f"✅ {label}: {removed}/{len(items)} removed, {format_bytes(freed)}")
 
-<b>Swap</b> {get_status_emoji(swap.percent) if swap.total > 0 else "⚪"}
-├ [{make_bar(swap.percent)}] {swap.percent:.1f}%
-├ Used: {format_bytes(swap.used)}
-└ Total: {format_bytes(swap.total)}
-"""
-    await update.message.reply_text(text, parse_mode=ParseMode.HTML)
+    if plan["build_cache"]:
+        await progress("⏳ Build cache", force=True)
+        result = await loop.run_in_executor(stats_executor, docker_client.api.prune_builds)
+        done.append(f"✅ Build cache: {format_bytes(result.get('SpaceReclaimed') or 0)}")
 
+    docker_df_cache.set("df", None, ttl=0)
+    await query.edit_message_text("\n".join(["🧹 <b>Prune finished</b>", ""] + done), parse_mode=ParseMode.HTML)
 
-async def disk_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Show detailed disk information."""
-    if not is_authorized(update.effective_chat.id):
-        await update.message.reply_text("⛔ Unauthorized access!")
-        return
 
-    partitions = psutil.disk_partitions()
+# ============================================
+# BACKUPS
+# ============================================
+
+# Strips the colour codes the backup scripts log with
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*m")
+
+backup_semaphore = asyncio.Semaphore(BACKUP_CONCURRENCY)
+backups_running: Dict[str, dict] = {}
+backup_started_at = monotonic()
+
 
-    def make_bar(percent, width=10):
-        filled = int(percent / 100 * width)
-        return "█" * filled + "░" * (width - filled)
+def get_new_files_size(path: str, since: float) -> int:
+    """Bytes in files under `path` modified since `since` (what a run wrote)."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                st = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            if st.st_mtime >= since:
+                total += st.st_size
+    return total
 
-    def get_status_emoji(percent):
-        if percent >= 90:
-            return "🔴"
-        elif percent >= 75:
-            return "🟡"
-        return "🟢"
 
-    lines = ["💿 <b>Disk Status</b>", ""]
+async def run_backup(target: str, progress=None) -> dict:
+    """Run a backup target as a subprocess and record the result in the state store.
 
-    for partition in partitions:
-        if partition.fstype and not partition.mountpoint.startswith(('/boot', '/snap')):
+    `progress(lines)` is called with the latest output lines as they arrive.
+    It is not awaited, so it must not block the output pump.
+    """
+    run = {"started": monotonic(), "lines": deque(maxlen=6)}
+    exit_code, error, proc = None, None, None
+    try:
+        # Registered before waiting for a slot, so a second request sees it as running
+        backups_running[target] = run
+        async with backup_semaphore:
+            run["started"] = monotonic()
+            started_at = datetime.now(TIMEZONE)
+            # The bot reports the result itself, so the script's own Telegram message is disabled
+            env = {k: v for k, v in os.environ.items() if not k.startswith("TELEGRAM_")}
+            env["BACKUP_DIR"] = BACKUP_DIR
             try:
-                usage = psutil.disk_usage(partition.mountpoint)
-                emoji = get_status_emoji(usage.percent)
-                lines.append(f"<b>{partition.mountpoint}</b> {emoji}")
-                lines.append(f"├ [{make_bar(usage.percent)}] {usage.percent:.1f}%")
-                lines.append(f"├ Used: {format_bytes(usage.used)}")
-                lines.append(f"├ Free: {format_bytes(usage.free)}")
-                lines.append(f"└ Total: {format_bytes(usage.total)}")
-                lines.append("")
-            except PermissionError:
-                continue
+                proc = await asyncio.create_subprocess_exec(
+                    *shlex.split(BACKUP_TARGETS[target]),
+                    stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT, env=env,
+                )
 
-    await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
+                async def pump():
+                    async for raw in proc.stdout:
+                        line = ANSI_ESCAPE.sub("", raw.decode(errors="replace")).strip()
+                        if line:
+                            run["lines"].append(line)
+                            if progress:
+                                progress(run["lines"])
+                    await proc.wait()
 
+                try:
+                    await asyncio.wait_for(pump(), BACKUP_TIMEOUT)
+                    exit_code = proc.returncode
+                except asyncio.TimeoutError:
+                    error = f"timed out after {format_uptime(BACKUP_TIMEOUT)}"
+                except (ValueError, asyncio.LimitOverrunError):
+                    # A line past the stream limit (64 KiB) can't be read, so the run is abandoned
+                    error = "output line too long"
+            except OSError as e:
+                error = str(e)
+            finally:
+                # Also on cancellation: never leave the script running unwatched
+                if proc is not None and proc.returncode is None:
+                    proc.kill()
+                    await proc.wait()
+    finally:
+        if backups_running.get(target) is run:
+            del backups_running[target]
+
+    ok = exit_code == 0
+    previous = (await state.get_backups()).get(target, {})
+    record = {
+        "target": target,
+        "started_at": started_at.isoformat(),
+        "duration": monotonic() - run["started"],
+        "exit_code": exit_code,
+        "error": error or (None if ok else (run["lines"][-1] if run["lines"] else "no output")),
+        "size": await asyncio.to_thread(get_new_files_size, BACKUP_DIR, started_at.timestamp()),
+        "ok": ok,
+        "last_success_at": started_at.isoformat() if ok else previous.get("last_success_at"),
+    }
+    await state.put_backup(target, record)
+    logger.info(f"Backup {target} finished: exit {exit_code}, {format_bytes(record['size'])}")
+
+    instance = f"{NODE_NAME}:{target}"
+    if ok:
+        await clear_bot_alert(f"backup:{target}:failed")
+        await clear_bot_alert(f"backup:{target}:stale")
+    elif f"backup:{target}:failed" not in bot_alerts:
+        await raise_bot_alert(
+            f"backup:{target}:failed", "BotBackupFailed", instance, f"Backup {target} failed",
+            f"Backup {target} failed: {record['error']}", category="backup", severity="critical",
+        )
+    return record
+
+
+def format_backup_record(target: str, record: Optional[dict]) -> List[str]:
+    if target in backups_running:
+        run = backups_running[target]
+        return [f"⏳ <b>{html.escape(target)}</b> running for {format_uptime(monotonic() - run['started'])}"]
+    if not record:
+        return [f"⚪ <b>{html.escape(target)}</b> - never run"]
+
+    emoji = "🟢" if record["ok"] else "🔴"
+    started = datetime.fromisoformat(record["started_at"])
+    lines = [
+        f"{emoji} <b>{html.escape(target)}</b> - {started.strftime('%d.%m %H:%M')}",
+        f"├ Duration: {format_uptime(record['duration'])}",
+        f"├ Size: {format_bytes(record['size'])}",
+    ]
+    if not record["ok"]:
+        lines.append(f"├ Error: {html.escape(str(record['error']))}")
+    if record.get("last_success_at"):
+        age = datetime.now(TIMEZONE) - datetime.fromisoformat(record["last_success_at"])
+        stale = " ⚠️" if age.total_seconds() > BACKUP_STALE_AFTER else ""
+        lines.append(f"└ Last success: {format_uptime(age.total_seconds())} ago{stale}")
+    else:
+        lines.append("└ Last success: never ⚠️")
+    return lines
 
-async def container_up(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Start a container."""
+
+async def backup_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show backup status, or run a backup target with live output."""
     if not is_authorized(update.effective_chat.id):
         await update.message.reply_text("⛔ Unauthorized access!")
         return
 
-    if not context.args:
-        await update.message.reply_text("❓ Usage: /up <container_name>")
-        return
-
-    name = context.args[0]
     try:
-        container = docker_client.containers.get(name)
-        if container.status == "running":
-            await update.message.reply_text(f"ℹ️ <b>{name}</b> is already running", parse_mode=ParseMode.HTML)
+        if not context.args:
+            records = await state.get_backups()
+            lines = ["💾 <b>Backups</b>", ""]
+            for target in BACKUP_TARGETS:
+                lines += format_backup_record(target, records.get(target)) + [""]
+            if BACKUP_TIME:
+                lines.append(f"<i>Scheduled daily at {BACKUP_TIME}</i>")
+            keyboard = [[InlineKeyboardButton(f"▶️ {t}", callback_data=f"backup_run_{t}") for t in BACKUP_TARGETS]]
+            await update.message.reply_text(
+                "\n".join(lines),
+                parse_mode=ParseMode.HTML,
+                reply_markup=InlineKeyboardMarkup(keyboard) if BACKUP_TARGETS else None
+            )
             return
 
-        await update.message.reply_text(f"▶️ <b>{name}</b> starting...", parse_mode=ParseMode.HTML)
-        container.start()
-        await asyncio.sleep(2)
-        container.reload()
-
-        if container.status == "running":
-            await update.message.reply_text(f"✅ <b>{name}</b> started successfully!", parse_mode=ParseMode.HTML)
-        else:
-            await update.message.reply_text(f"⚠️ <b>{name}</b> status: {container.status}", parse_mode=ParseMode.HTML)
+        target = context.args[0]
+        if target not in BACKUP_TARGETS:
+            await update.message.reply_text(f"❌ Unknown backup target. Targets: {', '.join(BACKUP_TARGETS) or 'none'}")
+            return
+        message = await update.message.reply_text(f"💾 <b>{html.escape(target)}</b> starting...", parse_mode=ParseMode.HTML)
+        # Runs in the background so other commands are answered meanwhile
+        spawn(run_backup_with_progress(message, target))
 
-    except docker.errors.NotFound:
-        await update.message.reply_text(f"❌ Container not found: {name}")
     except Exception as e:
         await update.message.reply_text(f"❌ Error: {str(e)}")
 
 
-async def container_down(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Stop a container."""
-    if not is_authorized(update.effective_chat.id):
-        await update.message.reply_text("⛔ Unauthorized access!")
+async def run_backup_with_progress(message, target: str) -> None:
+    """Run a target, editing `message` with its output at most every 3 seconds."""
+    if target in backups_running:
+        await message.edit_text(f"⏳ <b>{html.escape(target)}</b> is already running.", parse_mode=ParseMode.HTML)
         return
 
-    if not context.args:
-        await update.message.reply_text("❓ Usage: /down <container_name>")
-        return
+    last_edit = 0.0
+    editing: Optional[asyncio.Task] = None
 
-    name = context.args[0]
-    try:
-        container = docker_client.containers.get(name)
-        if container.status != "running":
-            await update.message.reply_text(f"ℹ️ <b>{name}</b> is already stopped", parse_mode=ParseMode.HTML)
+    async def edit(output: str) -> None:
+        try:
+            await message.edit_text(f"⏳ <b>{html.escape(target)}</b> running...\n<pre>{output}</pre>", parse_mode=ParseMode.HTML)
+        except Exception as e:
+            logger.debug(f"Backup progress edit skipped: {e}")
+
+    def progress(lines) -> None:
+        # Edits run beside the output pump, at most one at a time
+        nonlocal last_edit, editing
+        if monotonic() - last_edit < 3 or (editing and not editing.done()):
             return
+        last_edit = monotonic()
+        editing = spawn(edit(html.escape("\n".join(lines))))
 
-        await update.message.reply_text(f"🛑 <b>{name}</b> stopping...", parse_mode=ParseMode.HTML)
-        container.stop(timeout=30)
-        await asyncio.sleep(2)
-        container.reload()
+    try:
+        record = await run_backup(target, progress)
+        if editing:
+            editing.cancel()
+        await message.edit_text("\n".join(format_backup_record(target, record)), parse_mode=ParseMode.HTML)
+    except Exception as e:
+        logger.error(f"Backup {target} failed: {e}")
+        await message.edit_text(f"❌ Error: {str(e)}")
 
-        if container.status != "running":
-            await update.message.reply_text(f"✅ <b>{name}</b> stopped successfully!", parse_mode=ParseMode.HTML)
+
+async def scheduled_backup(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Run every backup target (job queue callback); the leader reports the results."""
+    if not is_leader:
+        return
+    records = await asyncio.gather(*(run_backup(target) for target in BACKUP_TARGETS if target not in backups_running))
+    if not records:
+        return
+    lines = ["💾 <b>Scheduled Backup</b>", ""]
+    for record in records:
+        lines += format_backup_record(record["target"], record) + [""]
+    for chat_id, topic in config["router"].default:
+        await spool.enqueue(chat_id, "\n".join(lines).strip(), parse_mode=ParseMode.HTML, **({"message_thread_id": topic} if topic else {}))
+
+
+async def check_backup_staleness(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Alert when a target's last success is older than BACKUP_STALE_AFTER."""
+    if not is_leader:
+        return
+    records = await state.get_backups()
+    now = datetime.now(TIMEZONE)
+    for target in BACKUP_TARGETS:
+        last_success = (records.get(target) or {}).get("last_success_at")
+        if last_success:
+            age = (now - datetime.fromisoformat(last_success)).total_seconds()
         else:
-            await update.message.reply_text(f"⚠️ <b>{name}</b> status: {container.status}", parse_mode=ParseMode.HTML)
+            # Never succeeded: give a fresh deployment one full period first
+            age = monotonic() - backup_started_at
+        key = f"backup:{target}:stale"
+        if age > BACKUP_STALE_AFTER and key not in bot_alerts:
+            when = f"{format_uptime(age)} ago" if last_success else "never"
+            await raise_bot_alert(
+                key, "BotBackupStale", f"{NODE_NAME}:{target}", f"Backup {target} is stale",
+                f"Last successful {target} backup: {when}", category="backup",
+            )
 
-    except docker.errors.NotFound:
-        await update.message.reply_text(f"❌ Container not found: {name}")
+
+# ============================================
+# SSL CERTIFICATE MONITORING
+# ============================================
+
+def get_ssl_targets() -> List[tuple]:
+    """Collect (host, port) pairs from project urls and SSL_DOMAINS."""
+    targets = []
+    for project_info in get_projects().values():
+        parsed = urlparse(project_info["url"] or "")
+        if parsed.scheme == "https" and parsed.hostname:
+            targets.append((parsed.hostname, parsed.port or 443))
+
+    for entry in SSL_DOMAINS:
+        host, _, port = entry.partition(":")
+        targets.append((host, int(port) if port else 443))
+
+    # Keep order, drop duplicates
+    return list(dict.fromkeys(targets))
+
+
+def parse_certificate(cert: dict) -> dict:
+    """Extract expiry, issuer and SAN data from a getpeercert() dict."""
+    issuer = {k: v for rdn in cert.get("issuer", ()) for k, v in rdn}
+    not_after = datetime.fromtimestamp(ssl.cert_time_to_seconds(cert["notAfter"]), pytz.UTC)
+    return {
+        "not_after": not_after,
+        "issuer": issuer.get("commonName") or issuer.get("organizationName", "?"),
+        "sans": [value for kind, value in cert.get("subjectAltName", ()) if kind == "DNS"],
+    }
+
+
+def parse_der_certificate(der: bytes) -> dict:
+    """Same fields as parse_certificate() from a DER certificate.
+
+    getpeercert() only returns the decoded dict after verification, so
+    unverified certificates are decoded here.
+    """
+    cert = x509.load_der_x509_certificate(der)
+    issuer = (cert.issuer.get_attributes_for_oid(NameOID.COMMON_NAME)
+              or cert.issuer.get_attributes_for_oid(NameOID.ORGANIZATION_NAME))
+    try:
+        sans = cert.extensions.get_extension_for_class(x509.SubjectAlternativeName).value.get_values_for_type(x509.DNSName)
+    except x509.ExtensionNotFound:
+        sans = []
+    return {
+        "not_after": cert.not_valid_after_utc.astimezone(pytz.UTC),
+        "issuer": issuer[0].value if issuer else "?",
+        "sans": sans,
+    }
+
+
+async def fetch_certificate(host: str, port: int = 443, timeout: float = SSL_SCAN_TIMEOUT,
+                            ssl_context: Optional[ssl.SSLContext] = None) -> dict:
+    """Connect to host:port and return certificate details.
+
+    Certificates that fail verification (expired, self-signed, wrong host)
+    are fetched again without verification so their expiry is still known.
+    """
+    # Only a completed, verified handshake marks the certificate as verified
+    result = {"host": host, "port": port, "verified": False, "error": None,
+              "checked_at": datetime.now(pytz.UTC)}
+
+    if ssl_context is None:
+        ssl_context = ssl.create_default_context()
+        if SSL_CA_FILE:
+            ssl_context.load_verify_locations(SSL_CA_FILE)
+
+    writer = None
+    try:
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, port, ssl=ssl_context, server_hostname=host),
+                timeout,
+            )
+            result.update(parse_certificate(writer.get_extra_info("peercert")))
+            result["verified"] = True
+        except ssl.SSLCertVerificationError as e:
+            result["error"] = e.verify_message or str(e)
+
+            insecure_context = ssl.create_default_context()
+            insecure_context.check_hostname = False
+            insecure_context.verify_mode = ssl.CERT_NONE
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, port, ssl=insecure_context, server_hostname=host),
+                timeout,
+            )
+            der = writer.get_extra_info("ssl_object").getpeercert(binary_form=True)
+            result.update(parse_der_certificate(der))
+    except asyncio.TimeoutError:
+        result["error"] = "timeout"
     except Exception as e:
-        await update.message.reply_text(f"❌ Error: {str(e)}")
+        result["error"] = str(e) or type(e).__name__
+    finally:
+        if writer:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
 
+    return result
 
-async def projects_list(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Show project status overview."""
+
+async def scan_ssl_certificates(targets: List[tuple], concurrency: int = SSL_SCAN_CONCURRENCY,
+                                **kwargs) -> Dict[str, dict]:
+    """Fetch certificates for all targets concurrently under a limit."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(host, port):
+        async with semaphore:
+            return await fetch_certificate(host, port, **kwargs)
+
+    results = await asyncio.gather(*(fetch(host, port) for host, port in targets))
+    return {f"{r['host']}:{r['port']}": r for r in results}
+
+
+async def refresh_ssl_cache(context: ContextTypes.DEFAULT_TYPE = None) -> None:
+    """Rescan all SSL targets and swap the cache (job queue callback)."""
+    global ssl_cert_cache, ssl_cache_updated_at
+
+    if ssl_scan_lock.locked():
+        return
+
+    async with ssl_scan_lock:
+        targets = get_ssl_targets()
+        results = await scan_ssl_certificates(targets)
+        ssl_cert_cache = results
+        ssl_cache_updated_at = datetime.now(pytz.UTC)
+        failed = sum(1 for r in results.values() if "not_after" not in r)
+        logger.info(f"SSL scan finished: {len(results)} targets, {failed} failed")
+
+
+def is_ssl_cache_stale() -> bool:
+    """Check whether the SSL cache is older than SSL_CACHE_TTL."""
+    if ssl_cache_updated_at is None:
+        return True
+    return (datetime.now(pytz.UTC) - ssl_cache_updated_at).total_seconds() > SSL_CACHE_TTL
+
+
+def get_ssl_days_left(result: dict) -> Optional[int]:
+    """Days until the certificate expires, None if it could not be read."""
+    if "not_after" not in result:
+        return None
+    return (result["not_after"] - datetime.now(pytz.UTC)).days
+
+
+async def ssl_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show cached SSL certificate status sorted by days remaining."""
     if not is_authorized(update.effective_chat.id):
         await update.message.reply_text("⛔ Unauthorized access!")
         return
 
-    lines = ["📁 <b>Projects</b>", ""]
+    force = bool(context.args) and context.args[0].lower() == "refresh"
 
-    for project_id, project_info in PROJECT_GROUPS.items():
-        if project_id in ["monitoring", "infra"]:
-            continue
+    if force or is_ssl_cache_stale():
+        context.job_queue.run_once(refresh_ssl_cache, when=0, name="ssl_refresh_now")
 
-        containers = project_info["containers"]
-        statuses = [get_container_status(c) for c in containers]
-        running = statuses.count("🟢")
-        total = len(containers)
+    if not ssl_cert_cache:
+        await update.message.reply_text(
+            "🔒 SSL scan started in background.\n"
+            "<i>Try /ssl again in a few seconds.</i>",
+            parse_mode=ParseMode.HTML
+        )
+        return
 
-        if running == total:
-            status = "🟢"
-        elif running == 0:
-            status = "🔴"
+    # Unreadable certificates first, then by days remaining
+    results = sorted(
+        ssl_cert_cache.values(),
+        key=lambda r: (get_ssl_days_left(r) is not None, get_ssl_days_left(r) or 0),
+    )
+
+    lines = [f"🔒 <b>SSL Certificates</b> ({len(results)})", ""]
+
+    for result in results:
+        name = result["host"] if result["port"] == 443 else f"{result['host']}:{result['port']}"
+        days_left = get_ssl_days_left(result)
+
+        if days_left is None:
+            lines.append(f"❌ <b>{html.escape(name)}</b>")
+            lines.append(f"   └ {html.escape(result['error'])}")
+            continue
+
+        if days_left < 3:
+            emoji = "🔴"
+        elif days_left < 14:
+            emoji = "🟡"
         else:
-            status = "🟡"
+            emoji = "🟢"
 
-        lines.append(f"{status} <b>{project_info['name']}</b>")
-        lines.append(f"   └ {running}/{total} | <a href=\"{project_info['url']}\">{project_info['url'].replace('https://', '')}</a>")
+        lines.append(f"{emoji} <b>{html.escape(name)}</b> - {days_left}d")
+        details = f"{html.escape(result['issuer'])} | {result['not_after'].strftime('%d.%m.%Y')}"
+        if len(result["sans"]) > 1:
+            details += f" | {len(result['sans'])} SANs"
+        lines.append(f"   └ {details}")
+        if not result["verified"]:
+            lines.append(f"   ⚠️ {html.escape(result['error'])}")
 
+    checked = ssl_cache_updated_at.astimezone(TIMEZONE).strftime("%H:%M")
     lines.append("")
-    lines.append("<i>Details: /project [name]</i>")
-
-    await update.message.reply_text(
-        "\n".join(lines),
-        parse_mode=ParseMode.HTML,
-        disable_web_page_preview=True
-    )
+    lines.append(f"<i>Checked at {checked} | /ssl refresh</i>")
 
+    await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
 
-async def settings_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Show bot settings."""
-    if not is_authorized(update.effective_chat.id):
-        await update.message.reply_text("⛔ Unauthorized access!")
-        return
 
-    settings_text = f"""
-⚙️ <b>Bot Settings</b>
+# ============================================
+# CHAT PERMISSIONS
+# ============================================
 
-<b>General</b>
-├ Bot Version: 3.0.0
-├ Timezone: {TIMEZONE}
-├ Daily Report: 09:00
-└ Chat ID: <code>{ALLOWED_CHAT_ID}</code>
+COMMAND_ALIASES = {"containers": "docker", "commands": "help"}
+
+# Callback data prefix -> command whose permission it needs
+CALLBACK_COMMANDS = [
+    ("refresh_status", "status"),
+    ("show_status", "status"),
+    ("fleet_status", "status"),
+    ("show_docker", "docker"),
+    ("fleet_docker", "docker"),
+    ("fleet_health", "health"),
+    ("refresh_alerts", "alerts"),
+    ("show_alerts", "alerts"),
+    ("clear_history", "settings"),
+    ("ack_", "ack"),
+    ("silence_", "silence"),
+    ("restart_", "restart"),
+    # Deleting is its own permission, not part of the read-only /dockerdf view
+    ("dockerdf_preview", "prune"),
+    ("dockerdf_prune_", "prune"),
+    ("dockerdf_", "dockerdf"),
+    ("backup_", "backup"),
+    ("stop_project_", "down"),
+    ("start_project_", "up"),
+]
+
+
+def get_callback_command(data: str) -> Optional[str]:
+    """Command whose permission a callback needs; the first matching prefix wins."""
+    return next((command for prefix, command in CALLBACK_COMMANDS if data.startswith(prefix)), None)
+
+
+async def check_command_permission(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Runs before every handler and stops commands a chat may not use.
+
+    Unknown chats pass through so the handlers answer them as before.
+    """
+    chat = update.effective_chat
+    if chat is None or not is_authorized(chat.id):
+        return
 
-<b>Connections</b>
-├ Prometheus: {PROMETHEUS_URL}
-├ Alertmanager: {ALERTMANAGER_URL}
-├ Grafana: {GRAFANA_URL}
-└ Webhook Port: {WEBHOOK_PORT}
+    command = None
+    if update.message and update.message.text and update.message.text.startswith("/"):
+        command = update.message.text.split()[0][1:].split("@")[0].lower()
+    elif update.callback_query and update.callback_query.data:
+        command = get_callback_command(update.callback_query.data)
 
-<b>Statistics</b>
-├ Alert History: {len(alert_history)} records
-└ Acknowledged: {len(acknowledged_alerts)} alerts
-"""
-    keyboard = [
-        [InlineKeyboardButton("🗑️ Clear Alert History", callback_data="clear_history")],
-        [InlineKeyboardButton("📊 Grafana", url=GRAFANA_URL)],
-    ]
+    command = COMMAND_ALIASES.get(command, command)
+    if command is None or is_command_allowed(chat.id, command):
+        return
 
-    await update.message.reply_text(
-        settings_text,
-        parse_mode=ParseMode.HTML,
-        reply_markup=InlineKeyboardMarkup(keyboard)
-    )
+    if update.callback_query:
+        await update.callback_query.answer("⛔ Not allowed in this chat")
+    else:
+        await update.message.reply_text(f"⛔ /{command} is not allowed in this chat")
+    raise ApplicationHandlerStop
 
 
 # ============================================
@@ -1491,16 +7115,76 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await status(update, context)
         return
 
+    # Fleet summaries and per-node drill-down
+    if data.startswith("fleet_"):
+        _, view, *node = data.split("_", 2)
+        text, keyboard = await render_fleet_view(view, node[0] if node else None)
+        await query.edit_message_text(text, parse_mode=ParseMode.HTML, reply_markup=keyboard)
+        return
+
+    # Docker disk usage and the preview-first prune
+    if data.startswith("dockerdf_"):
+        try:
+            if data == "dockerdf_refresh":
+                df = await get_docker_df(fresh=True)
+                await query.edit_message_text(format_docker_df(df), parse_mode=ParseMode.HTML, reply_markup=query.message.reply_markup)
+            elif data == "dockerdf_preview":
+                plan = build_prune_plan(await get_docker_df(fresh=True))
+                plan_id = hashlib.md5(f"{query.message.chat_id}{monotonic()}".encode()).hexdigest()[:8]
+                prune_plans.set(plan_id, plan)
+                keyboard = [[
+                    InlineKeyboardButton("✅ Prune", callback_data=f"dockerdf_prune_{plan_id}"),
+                    InlineKeyboardButton("❌ Cancel", callback_data="cancel"),
+                ]]
+                await query.edit_message_text(format_prune_plan(plan), parse_mode=ParseMode.HTML, reply_markup=InlineKeyboardMarkup(keyboard))
+            elif data.startswith("dockerdf_prune_"):
+                plan = prune_plans.get(data.replace("dockerdf_prune_", ""))
+                if not plan:
+                    await query.edit_message_text("⌛ This preview has expired, run /dockerdf again.")
+                    return
+                prune_plans.set(data.replace("dockerdf_prune_", ""), None, ttl=0)
+                await run_prune_plan(query, plan)
+        except Exception as e:
+            await query.edit_message_text(f"❌ Error: {str(e)}")
+        return
+
+    # Backup runs started from /backup
+    if data.startswith("backup_run_"):
+        target = data.replace("backup_run_", "")
+        if target in BACKUP_TARGETS:
+            message = await query.message.reply_text(f"💾 <b>{html.escape(target)}</b> starting...", parse_mode=ParseMode.HTML)
+            spawn(run_backup_with_progress(message, target))
+        return
+
+    # Paginated views
+    if data.startswith("page_"):
+        _, view_id, index = data.split("_")
+        view = paginated_views.get(view_id)
+        if not view:
+            await query.edit_message_text("⌛ This view has expired, run the command again.")
+            return
+        try:
+            text, keyboard = await view.render(int(index))
+            await query.edit_message_text(
+                text,
+                parse_mode=ParseMode.HTML,
+                reply_markup=keyboard,
+                disable_web_page_preview=True,
+            )
+        except Exception as e:
+            await query.edit_message_text(f"❌ Error: {str(e)}")
+        return
+
     if data == "clear_history":
-        alert_history.clear()
-        acknowledged_alerts.clear()
+        await state.clear_alerts()
         await query.edit_message_text("🗑️ Alert history cleared")
         return
 
     # Acknowledge alert
     if data.startswith("ack_"):
         alert_hash = data.replace("ack_", "")
-        acknowledged_alerts[alert_hash] = datetime.now(TIMEZONE)
+        await state.set_ack(alert_hash, datetime.now(TIMEZONE))
+        incident_stats.acknowledge(alert_hash, datetime.now().timestamp())
         await query.edit_message_text(
             query.message.text + "\n\n✅ <b>Alert acknowledged</b>",
             parse_mode=ParseMode.HTML
@@ -1514,7 +7198,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         alert_hash = parts[2]
 
         # Get alert info from history
-        alert_info = alert_history.get(alert_hash, {})
+        alert_info = await state.get_alert(alert_hash) or {}
         alert = alert_info.get("alert", {})
         alertname = alert.get("labels", {}).get("alertname", "unknown")
 
@@ -1567,41 +7251,44 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     # Project operations
     if data.startswith("restart_project_"):
         project_id = data.replace("restart_project_", "")
-        if project_id in PROJECT_GROUPS:
-            await query.edit_message_text(f"🔄 {PROJECT_GROUPS[project_id]['name']} restarting...")
-            for name in PROJECT_GROUPS[project_id]["containers"]:
+        projects = get_projects()
+        if project_id in projects:
+            await query.edit_message_text(f"🔄 {projects[project_id]['name']} restarting...")
+            for name in projects[project_id]["containers"]:
                 try:
                     container = docker_client.containers.get(name)
                     container.restart(timeout=30)
                 except Exception:
                     pass
-            await query.edit_message_text(f"✅ {PROJECT_GROUPS[project_id]['name']} restarted!")
+            await query.edit_message_text(f"✅ {projects[project_id]['name']} restarted!")
         return
 
     if data.startswith("stop_project_"):
         project_id = data.replace("stop_project_", "")
-        if project_id in PROJECT_GROUPS:
-            await query.edit_message_text(f"🛑 {PROJECT_GROUPS[project_id]['name']} stopping...")
-            for name in PROJECT_GROUPS[project_id]["containers"]:
+        projects = get_projects()
+        if project_id in projects:
+            await query.edit_message_text(f"🛑 {projects[project_id]['name']} stopping...")
+            for name in projects[project_id]["containers"]:
                 try:
                     container = docker_client.containers.get(name)
                     container.stop(timeout=30)
                 except Exception:
                     pass
-            await query.edit_message_text(f"✅ {PROJECT_GROUPS[project_id]['name']} stopped!")
+            await query.edit_message_text(f"✅ {projects[project_id]['name']} stopped!")
         return
 
     if data.startswith("start_project_"):
         project_id = data.replace("start_project_", "")
-        if project_id in PROJECT_GROUPS:
-            await query.edit_message_text(f"▶️ {PROJECT_GROUPS[project_id]['name']} starting...")
-            for name in PROJECT_GROUPS[project_id]["containers"]:
+        projects = get_projects()
+        if project_id in projects:
+            await query.edit_message_text(f"▶️ {projects[project_id]['name']} starting...")
+            for name in projects[project_id]["containers"]:
                 try:
                     container = docker_client.containers.get(name)
                     container.start()
                 except Exception:
                     pass
-            await query.edit_message_text(f"✅ {PROJECT_GROUPS[project_id]['name']} started!")
+            await query.edit_message_text(f"✅ {projects[project_id]['name']} started!")
         return
 
 
@@ -1609,67 +7296,176 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 # SCHEDULED REPORTS
 # ============================================
 
-async def send_daily_report(context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Send daily system report at 09:00."""
-    cpu_percent = psutil.cpu_percent(interval=1)
-    memory = psutil.virtual_memory()
-    disk = psutil.disk_usage("/")
-    uptime = datetime.now().timestamp() - psutil.boot_time()
-    load1, load5, load15 = psutil.getloadavg()
+# Report kind -> (period, comparisons as (label, shift)); windows end on the hour
+REPORT_PERIODS = {
+    "daily": (86400, [("d/d", 86400), ("w/w", 7 * 86400)]),
+    "weekly": (7 * 86400, [("w/w", 7 * 86400)]),
+}
 
-    containers = docker_client.containers.list(all=True)
-    running = sum(1 for c in containers if c.status == "running")
-    total = len(containers)
 
-    def get_emoji(percent, warn=70, crit=90):
-        if percent >= crit:
-            return "🔴"
-        elif percent >= warn:
-            return "🟡"
-        return "🟢"
+def format_deltas(current: Optional[float], previous: List[tuple], fmt=lambda v: f"{v:.1f}") -> str:
+    """" (▲+2.1 d/d, ▼0.4 w/w)" for each comparison window that has data."""
+    parts = []
+    for label, value in previous:
+        if current is None or value is None:
+            continue
+        diff = current - value
+        arrow = "▲" if diff > 0 else "▼" if diff < 0 else "="
+        parts.append(f"{arrow}{fmt(abs(diff))} {label}")
+    return f" ({', '.join(parts)})" if parts else ""
 
-    report = f"""
-📊 <b>Daily Report</b>
-<code>━━━━━━━━━━━━━━━━━━━━━</code>
-📅 {datetime.now(TIMEZONE).strftime("%d.%m.%Y %H:%M")}
 
-<b>🖥️ System</b>
-├ Uptime: {format_uptime(uptime)}
-├ Load: {load1:.2f} / {load5:.2f} / {load15:.2f}
-├ {get_emoji(cpu_percent)} CPU: {cpu_percent:.1f}%
-├ {get_emoji(memory.percent)} RAM: {memory.percent:.1f}%
-└ {get_emoji(disk.percent)} Disk: {disk.percent:.1f}%
+def format_period_report(kind: str) -> str:
+    """Daily or weekly report from the rollups and incident stats, with deltas to earlier periods."""
+    period, comparisons = REPORT_PERIODS[kind]
+    end = int(datetime.now().timestamp() // 3600) * 3600
+    windows = [(None, end - period, end)] + [(label, end - shift - period, end - shift) for label, shift in comparisons]
+    metrics = [host_rollups.window(start, stop) for _, start, stop in windows]
+    restarts = [host_rollups.event_counts(start, stop, "restart:") for _, start, stop in windows]
+    incidents = [incident_stats.between(start, stop).get(("all", ""), IncidentCounters()) for _, start, stop in windows]
+    labels = [label for label, _, _ in windows[1:]]
 
-<b>🐳 Docker</b> ({running}/{total})
-"""
+    def value(series: str, field: str) -> List[Optional[float]]:
+        return [(m.get(series) or {}).get(field) for m in metrics]
+
+    def growth(mountpoint: str) -> List[Optional[float]]:
+        return [m[f"disk_used:{mountpoint}"]["last"] - m[f"disk_used:{mountpoint}"]["first"] if f"disk_used:{mountpoint}" in m else None for m in metrics]
 
-    # Check projects
-    project_status = []
-    for project_id, project_info in PROJECT_GROUPS.items():
+    title = "Daily Report" if kind == "daily" else "Weekly Report"
+    uptime = datetime.now().timestamp() - psutil.boot_time()
+    lines = [
+        f"📊 <b>{title}</b>",
+        "<code>━━━━━━━━━━━━━━━━━━━━━</code>",
+        f"📅 {datetime.fromtimestamp(end, TIMEZONE).strftime('%d.%m.%Y %H:%M')} | last {format_uptime(period)}, change {' and '.join(labels)}",
+        "",
+        "<b>🖥️ System</b>",
+        f"├ Uptime: {format_uptime(uptime)}",
+    ]
+    for series, label in (("cpu", "CPU"), ("memory", "RAM")):
+        avg, peak = value(series, "avg"), value(series, "max")
+        if avg[0] is not None:
+            lines.append(
+                f"├ {get_threshold_emoji(series, peak[0])} {label}: avg {avg[0]:.1f}%"
+                f"{format_deltas(avg[0], list(zip(labels, avg[1:])))} | max {peak[0]:.1f}%"
+            )
+    load = value("load", "avg")
+    if load[0] is not None:
+        lines.append(f"├ Load: avg {load[0]:.2f}{format_deltas(load[0], list(zip(labels, load[1:])), lambda v: f'{v:.2f}')}")
+    disks = sorted(series[5:] for series in metrics[0] if series.startswith("disk:"))
+    for i, mountpoint in enumerate(disks):
+        usage = metrics[0][f"disk:{mountpoint}"]["last"]
+        grown = growth(mountpoint)
+        change = ""
+        if grown[0] is not None:
+            change = f", {'+' if grown[0] >= 0 else '-'}{format_bytes(abs(grown[0]))}{format_deltas(grown[0], list(zip(labels, grown[1:])), format_bytes)}"
+        branch = "└" if i == len(disks) - 1 else "├"
+        lines.append(f"{branch} {get_threshold_emoji('disk', usage)} Disk {html.escape(mountpoint)}: {usage:.1f}%{change}")
+    if not disks:
+        lines[-1] = "└" + lines[-1][1:]
+
+    # Projects straight from the event-maintained container index
+    running = sum(1 for c in container_index.values() if c["status"] == "running")
+    lines += ["", f"<b>🐳 Docker</b> ({running}/{len(container_index)})"]
+    for project_id, project_info in get_projects().items():
         if project_id in ["monitoring", "infra"]:
             continue
-
         statuses = [get_container_status(c) for c in project_info["containers"]]
-        running_count = statuses.count("🟢")
-        total_count = len(project_info["containers"])
+        running_count, total_count = statuses.count("🟢"), len(project_info["containers"])
+        emoji = "🟢" if running_count == total_count else "🔴" if running_count == 0 else "🟡"
+        lines.append(f"├ {emoji} {html.escape(project_info['name'])}: {running_count}/{total_count}")
+    total_restarts = [sum(r.values()) for r in restarts]
+    lines.append(f"└ 🔄 Restarts: {total_restarts[0]}{format_deltas(total_restarts[0], list(zip(labels, total_restarts[1:])), lambda v: f'{v:.0f}')}")
+    if restarts[0]:
+        top = sorted(restarts[0].items(), key=lambda r: r[1], reverse=True)[:5]
+        lines.append("   " + ", ".join(f"{html.escape(name)} ×{n}" for name, n in top))
+
+    _, ongoing = incident_stats.summary(period)
+    lines += ["", f"<b>🚨 Incidents ({format_uptime(period)})</b>"]
+    totals = format_incident_totals(incidents[0], ongoing.get(("all", ""), 0))
+    lines += totals[:-1] + ["├" + totals[-1][1:]]
+    fired = [c.fired for c in incidents]
+    mttr = [c.mttr for c in incidents]
+    lines.append(
+        f"└ Change: 🔥{format_deltas(fired[0], list(zip(labels, fired[1:])), lambda v: f'{v:.0f}') or ' no data'}"
+        f" | MTTR{format_deltas(mttr[0], list(zip(labels, mttr[1:])), format_stat_duration) or ' no data'}"
+    )
+    return "\n".join(lines)
 
-        if running_count == total_count:
-            emoji = "🟢"
-        elif running_count == 0:
-            emoji = "🔴"
-        else:
-            emoji = "🟡"
 
-        project_status.append(f"├ {emoji} {project_info['name']}: {running_count}/{total_count}")
+async def send_daily_report(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Send the daily report at 09:00, built from the running aggregates."""
+    if not is_leader:
+        return
+
+    report = format_period_report("daily")
+    for chat_id, topic in config["router"].default:
+        await spool.enqueue(chat_id, report, parse_mode=ParseMode.HTML, **({"message_thread_id": topic} if topic else {}))
+    logger.info("Daily report queued")
 
-    report += "\n".join(project_status)
 
-    await context.bot.send_message(
-        chat_id=ALLOWED_CHAT_ID,
-        text=report,
-        parse_mode=ParseMode.HTML
-    )
-    logger.info("Daily report sent")
+async def report_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show the daily or weekly report on demand."""
+    if not is_authorized(update.effective_chat.id):
+        await update.message.reply_text("⛔ Unauthorized access!")
+        return
+
+    kind = context.args[0].lower() if context.args else "daily"
+    if kind not in REPORT_PERIODS:
+        await update.message.reply_text("❓ Usage: /report [daily|weekly]")
+        return
+
+    try:
+        await update.message.reply_text(format_period_report(kind), parse_mode=ParseMode.HTML)
+    except Exception as e:
+        await update.message.reply_text(f"❌ Error: {str(e)}")
+
+
+def format_hourly_report(start: float, end: float) -> str:
+    """Report for [start, end) from the host rollups, Docker events and incident stats."""
+    metrics = host_rollups.window(start, end)
+    restarts = host_rollups.event_counts(start, end, "restart:")
+    incidents = incident_stats.between(start, end).get(("all", ""), IncidentCounters())
+    span = f"{datetime.fromtimestamp(start, TIMEZONE).strftime('%H:%M')}–{datetime.fromtimestamp(end, TIMEZONE).strftime('%H:%M')}"
+
+    lines = [f"🕐 <b>Hourly Report</b> | {span}", "<code>━━━━━━━━━━━━━━━━━━━━━</code>", "", "<b>🖥️ System</b>"]
+    system = []
+    for series, label, unit in (("cpu", "CPU", "%"), ("memory", "RAM", "%"), ("load", "Load", "")):
+        agg = metrics.get(series)
+        if agg:
+            emoji = get_threshold_emoji(series, agg["max"]) + " " if unit else ""
+            system.append(f"{emoji}{label}: avg {agg['avg']:.1f}{unit} | max {agg['max']:.1f}{unit}")
+    for series, agg in sorted(metrics.items()):
+        if series.startswith("disk:"):
+            mountpoint = series[5:]
+            used = metrics.get(f"disk_used:{mountpoint}")
+            delta = f" ({'+' if used['last'] >= used['first'] else '-'}{format_bytes(abs(used['last'] - used['first']))})" if used else ""
+            system.append(f"{get_threshold_emoji('disk', agg['last'])} Disk {html.escape(mountpoint)}: {agg['last']:.1f}%{delta}")
+    if not system:
+        system.append("No samples in this hour")
+    lines += [f"{'└' if i == len(system) - 1 else '├'} {line}" for i, line in enumerate(system)]
+
+    running = sum(1 for c in container_index.values() if c["status"] == "running")
+    lines += ["", f"<b>🐳 Docker</b> ({running}/{len(container_index)} running)"]
+    if restarts:
+        top = sorted(restarts.items(), key=lambda r: r[1], reverse=True)[:5]
+        lines.append(f"├ 🔄 Restarts: {sum(restarts.values())}")
+        lines.append("└ " + ", ".join(f"{html.escape(name)} ×{n}" for name, n in top))
+    else:
+        lines.append("└ 🔄 Restarts: 0")
+
+    lines += ["", "<b>🚨 Alerts</b>", f"└ 🔥 Fired: {incidents.fired} | ✅ Resolved: {incidents.resolved} | 👀 Acked: {incidents.acked}"]
+    return "\n".join(lines)
+
+
+async def send_hourly_report(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Send the report for the previous full hour (job queue callback)."""
+    if not is_leader:
+        return
+    end = int(datetime.now().timestamp() // 3600) * 3600
+    report = format_hourly_report(end - 3600, end)
+    for chat_id, topic in config["router"].default:
+        await spool.enqueue(chat_id, report, parse_mode=ParseMode.HTML, **({"message_thread_id": topic} if topic else {}))
+    logger.info("Hourly report queued")
 
 
 # ============================================
@@ -1683,10 +7479,31 @@ async def run_webhook_server(app: web.Application):
     site = web.TCPSite(runner, '0.0.0.0', WEBHOOK_PORT)
     await site.start()
     logger.info(f"Webhook server started on port {WEBHOOK_PORT}")
+    return runner
 
 
 def main() -> None:
     """Start the bot."""
+    global config, config_mtime
+
+    # Load the config file before anything reads it; taking the marker
+    # first means an edit racing the load is still picked up by the poll
+    config_mtime = config_file_mtime()
+    try:
+        loaded = load_config_file()
+    except Exception as e:
+        logger.error(f"Invalid config file {CONFIG_FILE}: {e}")
+        return
+    if loaded:
+        config = loaded
+        logger.info(f"Config loaded from {CONFIG_FILE}")
+
+    # Agent mode only serves snapshots to a hub, no Telegram involved
+    if BOT_MODE == "agent":
+        logger.info(f"Fleet agent {NODE_NAME} starting...")
+        asyncio.run(run_agent())
+        return
+
     if not BOT_TOKEN:
         logger.error("TELEGRAM_BOT_TOKEN not set!")
         return
@@ -1695,9 +7512,16 @@ def main() -> None:
         logger.error("TELEGRAM_CHAT_ID not set!")
         return
 
+    # Runbooks are answered from memory, so index them once up front
+    runbook_index.build(RUNBOOK_DIR, ALERT_RULES_FILE)
+    logger.info(f"Runbook index built: {len(runbook_index.runbooks)} runbooks, {len(runbook_index.sections)} sections, {len(runbook_index.rules)} alert rules")
+
     # Create application
     application = Application.builder().token(BOT_TOKEN).build()
 
+    # Per-chat command permissions, checked before any handler
+    application.add_handler(TypeHandler(Update, check_command_permission), group=-1)
+
     # Add handlers - Standard commands
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
@@ -1709,20 +7533,29 @@ def main() -> None:
     application.add_handler(CommandHandler("health", health_check))
     application.add_handler(CommandHandler("cpu", cpu_command))
     application.add_handler(CommandHandler("memory", memory_command))
+    application.add_handler(CommandHandler("procs", procs_command))
     application.add_handler(CommandHandler("disk", disk_command))
+    application.add_handler(CommandHandler("du", du_command))
 
     # Docker management commands
     application.add_handler(CommandHandler("docker", docker_list))
+    application.add_handler(CommandHandler("dockerdf", dockerdf_command))
     application.add_handler(CommandHandler("containers", docker_list))
     application.add_handler(CommandHandler("projects", projects_list))
+    application.add_handler(CommandHandler("top", top_command))
     application.add_handler(CommandHandler("up", container_up))
     application.add_handler(CommandHandler("down", container_down))
     application.add_handler(CommandHandler("restart", container_restart))
     application.add_handler(CommandHandler("logs", container_logs))
+    application.add_handler(CommandHandler("logsearch", logsearch_command))
+    application.add_handler(CommandHandler("db", db_command))
+    application.add_handler(CommandHandler("traffic", traffic_command))
 
     # Monitoring & Alerting commands
     application.add_handler(CommandHandler("alerts", alerts_command))
     application.add_handler(CommandHandler("grafana", grafana_command))
+    application.add_handler(CommandHandler("render", render_command))
+    application.add_handler(CommandHandler("graph", graph_command))
     application.add_handler(CommandHandler("silence", silence_command))
     application.add_handler(CommandHandler("ack", ack_command))
 
@@ -1732,6 +7565,11 @@ def main() -> None:
     application.add_handler(CommandHandler("resolve", resolve_command))
     application.add_handler(CommandHandler("oncall", oncall_command))
     application.add_handler(CommandHandler("history", history_command))
+    application.add_handler(CommandHandler("runbook", runbook_command))
+    application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(CommandHandler("report", report_command))
+    application.add_handler(CommandHandler("ssl", ssl_command))
+    application.add_handler(CommandHandler("backup", backup_command))
 
     # Callbacks
     application.add_handler(CallbackQueryHandler(button_callback))
@@ -1745,31 +7583,101 @@ def main() -> None:
     )
     logger.info("Daily report scheduled for 09:00")
 
+    # Backups replace the host cron entry; staleness is checked either way
+    if BACKUP_TIME and BACKUP_TARGETS:
+        hour, minute = (int(part) for part in BACKUP_TIME.split(":"))
+        job_queue.run_daily(scheduled_backup, time=time(hour=hour, minute=minute, tzinfo=TIMEZONE), name="backup")
+    if BACKUP_TARGETS:
+        job_queue.run_repeating(check_backup_staleness, interval=BACKUP_CHECK_INTERVAL, first=BACKUP_CHECK_INTERVAL, name="backup_stale")
+
+    # Pick up config file changes without a restart
+    job_queue.run_repeating(reload_config_if_changed, interval=CONFIG_POLL_INTERVAL, first=CONFIG_POLL_INTERVAL, name="config_reload")
+
+    # Keep the SSL certificate cache warm
+    job_queue.run_repeating(refresh_ssl_cache, interval=SSL_CACHE_TTL, first=10, name="ssl_refresh")
+
+    # Background process snapshots for /procs
+    job_queue.run_repeating(refresh_process_snapshot, interval=PROCS_SAMPLE_INTERVAL, first=1, name="procs_snapshot")
+
+    # Probe project URLs for /projects and /health
+    job_queue.run_repeating(probe_project_urls, interval=UPTIME_PROBE_INTERVAL, first=5, name="uptime_probe")
+
+    # Poll fleet agents for the hub's /status, /docker and /health
+    if BOT_MODE == "hub":
+        if not FLEET_AGENTS:
+            logger.warning("BOT_MODE=hub but FLEET_AGENTS is empty")
+        job_queue.run_repeating(poll_fleet, interval=FLEET_POLL_INTERVAL, first=1, name="fleet_poll")
+
+    # Host metric rollups for the reports, and early warnings from the same samples
+    job_queue.run_repeating(sample_host_metrics, interval=HOST_SAMPLE_INTERVAL, first=HOST_SAMPLE_INTERVAL, name="host_sampler")
+
+    # Hourly report just after each full hour, once its last samples are in
+    if HOURLY_REPORT:
+        next_hour = (int(datetime.now().timestamp() // 3600) + 1) * 3600
+        job_queue.run_repeating(send_hourly_report, interval=3600, first=next_hour + 30 - datetime.now().timestamp(), name="hourly_report")
+
+    # Directory size index for /du, rescanned incrementally
+    if DU_ROOTS:
+        job_queue.run_repeating(refresh_du_index, interval=DU_SCAN_INTERVAL, first=60, name="du_scan")
+
+    # Leader election: the leader polls Telegram and sends the reports
+    job_queue.run_repeating(renew_leadership, interval=max(LEADER_LEASE_TTL // 3, 1), first=0, name="leader_lease")
+
+    # Keep the bot's own alerts alive in Alertmanager while they fire
+    job_queue.run_repeating(refresh_bot_alerts, interval=BOT_ALERT_REFRESH, first=BOT_ALERT_REFRESH, name="bot_alerts_refresh")
+
+    # Persist incident stats so /stats and the daily report survive restarts
+    job_queue.run_repeating(save_incident_stats, interval=STATS_SAVE_INTERVAL, first=STATS_SAVE_INTERVAL, name="stats_save")
+
     # Health check endpoint for container healthcheck
     async def health_handler(request: web.Request) -> web.Response:
         """Health check endpoint for Docker healthcheck."""
+        # A state store outage must not get every replica restarted
+        try:
+            alerts_tracked, alerts_acked = len(await state.list_alerts()), len(await state.get_acks())
+        except Exception:
+            alerts_tracked = alerts_acked = None
         return web.json_response({
             "status": "healthy",
             "version": "3.0.0",
             "timestamp": datetime.now(TIMEZONE).isoformat(),
-            "alerts_tracked": len(alert_history),
-            "alerts_acked": len(acknowledged_alerts),
+            "alerts_tracked": alerts_tracked,
+            "alerts_acked": alerts_acked,
+            "leader": is_leader,
         })
 
     # Create webhook server
     webhook_app = web.Application()
     webhook_app.router.add_post("/webhook/alertmanager", handle_alertmanager_webhook)
     webhook_app.router.add_get("/health", health_handler)
+    webhook_app.router.add_get("/metrics", metrics_handler)
     webhook_app["bot"] = application.bot
 
     # Run both the bot and webhook server
     async def run_all():
+        # Build the project index, then follow Docker events to keep it current
+        loop = asyncio.get_running_loop()
+        since = int(datetime.now().timestamp())
+        apply_container_states(await loop.run_in_executor(None, load_container_states))
+        threading.Thread(target=watch_docker_events, args=(loop, since), daemon=True, name="docker-events").start()
+        logger.info(f"Project index built: {len(container_index)} containers, {len(project_index)} projects")
+
+        incident_stats.load(STATS_FILE)
+        host_rollups.load(ROLLUP_FILE)
+        load_du_index()
+
+        # Replay messages left in the spool by a previous run
+        replayed = spool.load()
+        if replayed:
+            logger.info(f"Replaying {replayed} spooled message(s)")
+
         # Start webhook server
-        await run_webhook_server(webhook_app)
+        webhook_runner = await run_webhook_server(webhook_app)
         # Run bot
         await application.initialize()
         await application.start()
-        await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+        # Polling starts once this replica holds the leader lease (renew_leadership)
+        spool_tasks = [spawn(spool.run_flusher()), spawn(spool.run_sender(application.bot))]
 
         # Set bot commands for menu (Enterprise standard)
         commands = [
@@ -1778,22 +7686,49 @@ def main() -> None:
             ("status", "System status"),
             ("docker", "Container list"),
             ("projects", "Project status"),
+            ("top", "Busiest containers"),
+            ("db", "Database health"),
+            ("traffic", "Router traffic"),
             ("alerts", "Active alerts"),
             ("ack", "Acknowledge alert"),
             ("silence", "Silence alert"),
             ("snooze", "Snooze alerts"),
             ("resolve", "Resolve alert"),
             ("escalate", "Escalate alert"),
+            ("runbook", "Runbook search"),
+            ("stats", "Incident stats"),
+            ("report", "Daily/weekly report"),
             ("grafana", "Dashboards"),
+            ("graph", "Quick chart"),
+            ("ssl", "SSL certificates"),
+            ("backup", "Backups"),
             ("health", "Health check"),
             ("settings", "Bot settings"),
         ]
         await application.bot.set_my_commands(commands)
         logger.info("Bot commands menu set successfully")
 
-        # Keep running
-        while True:
-            await asyncio.sleep(3600)
+        # Run until SIGTERM (forwarded by tini) or SIGINT
+        stop = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop.set)
+        await stop.wait()
+
+        # Stop intake first, then drain the spool while the bot can still send
+        logger.info("Shutting down...")
+        await webhook_runner.cleanup()
+        if application.updater.running:
+            await application.updater.stop()
+        await application.stop()
+        await spool.close(SPOOL_DRAIN_TIMEOUT)
+        await save_incident_stats()
+        for task in spool_tasks:
+            task.cancel()
+        await application.shutdown()
+        await state.close()
+        if http_session is not None and not http_session.closed:
+            await http_session.close()
+        logger.info("Bot stopped")
 
     logger.info("Bot starting...")
     asyncio.run(run_all())
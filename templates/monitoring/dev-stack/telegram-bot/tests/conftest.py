@@ -0,0 +1,24 @@
+"""Shared setup: import bot.py without a Docker daemon, isolate bot-raised alerts."""
+import os
+import sys
+from unittest import mock
+
+import docker
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# bot.py connects to Docker at import time; none of the tests use it
+with mock.patch.object(docker, "from_env", return_value=mock.MagicMock()):
+    import bot  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def isolated_alerts(monkeypatch):
+    """Bot-raised alerts start empty, and nothing reaches a real Alertmanager."""
+    monkeypatch.setattr(bot, "ALERTMANAGER_URL", "http://127.0.0.1:9")
+    monkeypatch.setattr(bot, "bot_alerts", {})
+    monkeypatch.setattr(bot, "bot_alerts_direct", set())
+    yield
+    # The shared HTTP session belongs to the test's (closed) event loop
+    bot.http_session = None
@@ -0,0 +1,140 @@
+"""Alert notifications across replicas sharing one state store, and the bot's own alerts."""
+import asyncio
+from datetime import datetime
+from unittest import mock
+
+import pytest
+import pytz
+from aiohttp import web
+
+import bot
+
+ALERT = {
+    "status": "firing",
+    "labels": {"alertname": "HighCPU", "severity": "critical", "category": "host", "instance": "vps"},
+    "annotations": {"summary": "CPU high"},
+    "startsAt": "2026-10-19T08:00:00Z",
+}
+
+
+@pytest.fixture
+def replicas(tmp_path, monkeypatch):
+    """Two stores on one SQLite file stand in for two replicas, neither holding the lease."""
+    path = str(tmp_path / "state.db")
+    stores = [bot.SQLiteStateStore(path), bot.SQLiteStateStore(path)]
+    enqueue = mock.AsyncMock()
+    monkeypatch.setattr(bot, "is_leader", False)
+    monkeypatch.setattr(bot.spool, "enqueue", enqueue)
+    yield stores, enqueue
+    for store in stores:
+        asyncio.run(store.close())
+
+
+def deliver(store, alerts, status):
+    with mock.patch.object(bot, "state", store):
+        asyncio.run(bot.process_alerts(alerts, status))
+
+
+def test_standby_replicas_notify_once(replicas):
+    stores, enqueue = replicas
+
+    # Alertmanager sends the same group to both replicas, then retries one
+    for store in stores + stores[:1]:
+        deliver(store, [ALERT], "firing")
+
+    assert enqueue.await_count == 1
+    assert "HighCPU" in enqueue.await_args.args[1]
+    assert len(asyncio.run(stores[1].list_alerts())) == 1
+
+    # The resolution is a new notification
+    deliver(stores[1], [{**ALERT, "status": "resolved"}], "resolved")
+    assert enqueue.await_count == 2
+
+
+def test_failed_enqueue_releases_the_claim(replicas):
+    stores, enqueue = replicas
+    enqueue.side_effect = [OSError("disk full"), None]
+
+    with mock.patch.object(bot, "state", stores[0]):
+        assert asyncio.run(bot.process_alerts([ALERT], "firing")) is False
+    # Alertmanager's retry (or the other replica's copy) still gets it out
+    with mock.patch.object(bot, "state", stores[1]):
+        assert asyncio.run(bot.process_alerts([ALERT], "firing")) is True
+    deliver(stores[0], [ALERT], "firing")
+
+    assert enqueue.await_count == 2
+
+
+async def start_alertmanager(posted: list, status: int = 200):
+    async def alerts_handler(request):
+        posted.append(await request.json())
+        return web.json_response({}, status=status)
+
+    app = web.Application()
+    app.router.add_post("/api/v2/alerts", alerts_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}"
+
+
+def ends_in(alert: dict) -> float:
+    return (datetime.fromisoformat(alert["endsAt"]) - datetime.now(pytz.UTC)).total_seconds()
+
+
+def test_bot_alerts_go_through_alertmanager(replicas, monkeypatch):
+    stores, enqueue = replicas
+    posted = []
+
+    async def scenario():
+        runner, url = await start_alertmanager(posted)
+        monkeypatch.setattr(bot, "ALERTMANAGER_URL", url)
+        try:
+            with mock.patch.object(bot, "state", stores[0]):
+                await bot.raise_bot_alert("cpu:spike", "HostCPUAnomaly", "vps", "Unusual CPU level", "CPU at 99%")
+                await bot.refresh_bot_alerts()
+                await bot.clear_bot_alert("cpu:spike")
+                await bot.refresh_bot_alerts()
+        finally:
+            await runner.cleanup()
+            await bot.http_session.close()
+
+    asyncio.run(scenario())
+
+    # Raised, refreshed, then ended; nothing after it cleared
+    assert len(posted) == 3
+    raised, refreshed, cleared = (batch[0] for batch in posted)
+    assert raised["labels"] == {"alertname": "HostCPUAnomaly", "severity": "warning", "category": "host", "instance": "vps"}
+    assert raised["annotations"]["description"] == "CPU at 99%"
+    assert bot.BOT_ALERT_TTL - 10 < ends_in(raised) <= bot.BOT_ALERT_TTL
+    assert refreshed["startsAt"] == raised["startsAt"]
+    assert ends_in(cleared) <= 0
+    # The notification comes back through the webhook, not from here
+    enqueue.assert_not_awaited()
+    assert asyncio.run(stores[0].list_alerts()) == {}
+
+
+def test_bot_alerts_are_notified_directly_without_alertmanager(replicas, monkeypatch):
+    stores, enqueue = replicas
+    monkeypatch.setattr(bot, "is_leader", True)
+
+    with mock.patch.object(bot, "state", stores[0]):
+        asyncio.run(bot.raise_bot_alert("cpu:spike", "HostCPUAnomaly", "vps", "Unusual CPU level", "CPU at 99%"))
+        asyncio.run(bot.clear_bot_alert("cpu:spike"))
+
+    assert enqueue.await_count == 2
+    assert "HostCPUAnomaly" in enqueue.await_args_list[0].args[1]
+    assert bot.bot_alerts_direct == set()
+
+
+def test_direct_bot_alerts_are_left_to_the_leader(replicas):
+    stores, enqueue = replicas
+
+    with mock.patch.object(bot, "state", stores[0]):
+        asyncio.run(bot.raise_bot_alert("cpu:spike", "HostCPUAnomaly", "vps", "Unusual CPU level", "CPU at 99%"))
+        asyncio.run(bot.clear_bot_alert("cpu:spike"))
+
+    enqueue.assert_not_awaited()
+    assert len(asyncio.run(stores[0].list_alerts())) == 1
@@ -0,0 +1,69 @@
+"""Anomaly detector: the EWMA baseline and the decaying trend fit."""
+import random
+
+import pytest
+
+import bot
+
+T0 = 1_700_000_000.0  # epoch-sized times exercise the re-centring
+
+
+def ramp(stream, n, slope, start=10.0, step=15.0, jitter=0.0):
+    t = T0
+    for i in range(n):
+        t += step + (random.uniform(-jitter, jitter) if jitter else 0)
+        x = start + slope * (t - T0)
+        stream.add(t, x)
+    return t, x
+
+
+@pytest.mark.parametrize("halflife", [600, 3600, 86400])
+def test_linear_ramp_gives_exact_slope_and_eta(halflife):
+    stream = bot.MetricStream(std_floor=0.5, halflife=halflife)
+    _, last = ramp(stream, 500, slope=0.01)
+
+    assert stream.slope() == pytest.approx(0.01, rel=1e-6)
+    assert stream.time_to(100) == pytest.approx((100 - last) / 0.01, rel=1e-6)
+    assert stream.time_to(last - 1) == 0
+
+
+def test_uneven_sample_spacing_keeps_the_fit_exact():
+    random.seed(7)
+    stream = bot.MetricStream(std_floor=0.5, halflife=1800)
+    _, last = ramp(stream, 300, slope=0.002, step=20, jitter=15)
+
+    assert stream.slope() == pytest.approx(0.002, rel=1e-6)
+    assert stream.time_to(95) == pytest.approx((95 - last) / 0.002, rel=1e-6)
+
+
+def test_no_trend_before_warmup_or_when_not_rising():
+    stream = bot.MetricStream(std_floor=0.5, halflife=3600)
+    ramp(stream, bot.ANOMALY_WARMUP - 1, slope=0.01)
+    assert stream.slope() is None
+    assert stream.time_to(100) is None
+
+    flat = bot.MetricStream(std_floor=0.5, halflife=3600)
+    ramp(flat, 200, slope=0.0)
+    assert flat.slope() == pytest.approx(0, abs=1e-12)
+    # Rounding can leave a tiny slope; it must not produce a usable ETA
+    eta = flat.time_to(100)
+    assert eta is None or eta > 90 * 86400
+
+    falling = bot.MetricStream(std_floor=0.5, halflife=3600)
+    ramp(falling, 200, slope=-0.01, start=90)
+    assert falling.slope() == pytest.approx(-0.01, rel=1e-6)
+    assert falling.time_to(100) is None
+
+
+def test_spike_scores_against_the_prior_baseline():
+    random.seed(3)
+    stream = bot.MetricStream(std_floor=0.5, halflife=3600)
+    t = T0
+    for _ in range(200):
+        t += 15
+        assert abs(stream.add(t, 40 + random.gauss(0, 1))) < bot.ANOMALY_Z_THRESHOLD + 1
+
+    mean = stream.mean
+    assert stream.add(t + 15, 80) > bot.ANOMALY_Z_THRESHOLD
+    # The clipped update keeps one burst from dragging the baseline along
+    assert stream.mean - mean < 0.5
@@ -0,0 +1,82 @@
+"""Backup runs with real subprocesses."""
+import asyncio
+import sys
+
+import pytest
+
+import bot
+
+
+@pytest.fixture(autouse=True)
+def backups(tmp_path, monkeypatch):
+    monkeypatch.setattr(bot, "state", bot.MemoryStateStore())
+    monkeypatch.setattr(bot, "BACKUP_DIR", str(tmp_path))
+    monkeypatch.setattr(bot, "backups_running", {})
+    monkeypatch.setattr(bot, "bot_alerts", {})
+    monkeypatch.setattr(bot, "is_leader", False)
+
+
+def target(monkeypatch, code: str) -> str:
+    monkeypatch.setattr(bot, "BACKUP_TARGETS", {"db": f"{sys.executable} -c '{code}'"})
+    return "db"
+
+
+def test_successful_run_is_recorded(monkeypatch):
+    name = target(monkeypatch, 'print("\\x1b[32mdumping\\x1b[0m"); print("done")')
+    seen = []
+
+    record = asyncio.run(bot.run_backup(name, lambda lines: seen.append(list(lines))))
+
+    assert record["ok"] and record["exit_code"] == 0 and record["error"] is None
+    assert seen[-1] == ["dumping", "done"]
+    assert asyncio.run(bot.state.get_backups())["db"]["last_success_at"] == record["started_at"]
+    assert bot.backups_running == {}
+
+
+def test_overlong_output_line_fails_the_run(monkeypatch):
+    name = target(monkeypatch, 'import sys, time; sys.stdout.write("x" * 200000); sys.stdout.flush(); time.sleep(60)')
+
+    record = asyncio.run(asyncio.wait_for(bot.run_backup(name), 30))
+
+    assert not record["ok"]
+    assert record["error"] == "output line too long"
+    assert "backup:db:failed" in bot.bot_alerts
+    assert bot.backups_running == {}
+
+
+def test_cancelled_run_kills_the_script_and_unregisters(monkeypatch):
+    name = target(monkeypatch, 'import time; print("started", flush=True); time.sleep(60)')
+
+    async def scenario():
+        started = asyncio.Event()
+        task = asyncio.ensure_future(bot.run_backup(name, lambda lines: started.set()))
+        await asyncio.wait_for(started.wait(), 10)
+        assert name in bot.backups_running
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+
+    assert bot.backups_running == {}
+    assert asyncio.run(bot.state.get_backups()) == {}
+
+
+def test_slow_progress_edits_do_not_hold_up_the_run(monkeypatch):
+    name = target(monkeypatch, 'print("\\n".join(map(str, range(50000))))')
+
+    class Message:
+        def __init__(self):
+            self.texts = []
+
+        async def edit_text(self, text, **kwargs):
+            self.texts.append(text)
+            if "running" in text:
+                await asyncio.sleep(60)  # Telegram being very slow
+
+    message = Message()
+    asyncio.run(asyncio.wait_for(bot.run_backup_with_progress(message, name), 30))
+
+    assert len(message.texts) == 2
+    assert "running" in message.texts[0]
+    assert message.texts[-1].startswith("🟢 <b>db</b>")
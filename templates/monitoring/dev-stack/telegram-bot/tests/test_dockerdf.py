@@ -0,0 +1,142 @@
+"""/dockerdf: log sizes through the helper container, and the prune plan."""
+import asyncio
+from unittest import mock
+
+import docker
+import pytest
+
+import bot
+
+CID = "a" * 64
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = mock.MagicMock()
+    client.df.return_value = {"Containers": [{"Id": CID, "Names": ["/web"], "State": "running"}]}
+    client.info.return_value = {"DockerRootDir": "/srv/docker"}
+    monkeypatch.setattr(bot, "docker_client", client)
+    return client
+
+
+def test_log_sizes_come_from_the_helper_container(client):
+    client.containers.run.return_value = (
+        f"157286400 /logs/{CID}/{CID}-json.log\n12 /logs/{'b' * 64}/{'b' * 64}-json.log\n".encode()
+    )
+
+    df = bot.read_docker_df()
+
+    assert df["LogSizes"] == {CID: 157286400, "b" * 64: 12}
+    kwargs = client.containers.run.call_args.kwargs
+    assert kwargs["volumes"] == {"/srv/docker/containers": {"bind": "/logs", "mode": "ro"}}
+    assert kwargs["remove"] and kwargs["network_disabled"]
+    text = bot.format_docker_df(df)
+    assert "🟡 web" in text
+
+
+def test_helper_failure_is_reported(client):
+    client.containers.run.side_effect = docker.errors.ImageNotFound("pull access denied for alpine")
+
+    df = bot.read_docker_df()
+
+    assert df["LogSizes"] is None
+    assert "helper container failed: pull access denied for alpine" in bot.format_docker_df(df)
+
+
+def test_prune_needs_its_own_permission(monkeypatch):
+    monkeypatch.setattr(bot, "config", bot.build_config({
+        "chats": {"dev": {"id": -100, "commands": ["dockerdf"]}},
+    }))
+
+    assert bot.get_callback_command("dockerdf_refresh") == "dockerdf"
+    assert bot.get_callback_command("dockerdf_preview") == "prune"
+    assert bot.get_callback_command("dockerdf_prune_1a2b3c4d") == "prune"
+    assert bot.is_command_allowed(-100, "dockerdf")
+    assert not bot.is_command_allowed(-100, "prune")
+
+
+def fake_df():
+    def container(cid, name, state, project=None, size=0):
+        labels = {"com.docker.compose.project": project} if project else {}
+        return {"Id": cid, "Names": [f"/{name}"], "State": state, "Labels": labels, "SizeRw": size}
+
+    return {
+        "Containers": [
+            container("c1", "web", "running"),
+            container("c2", "shop-db", "exited", project="shop", size=500),
+            container("c3", "one-off", "exited", size=100),
+            container("c4", "crashed", "dead", size=200),
+            container("c5", "api", "running", project="shop"),
+        ],
+        "Images": [
+            {"Id": "sha256:" + "1" * 64, "RepoTags": ["nginx:latest"], "Size": 1000, "SharedSize": 0, "Containers": 1},
+            {"Id": "sha256:" + "2" * 64, "RepoTags": None, "Size": 300, "SharedSize": 0, "Containers": 0},
+            {"Id": "sha256:" + "3" * 64, "RepoTags": ["<none>:<none>"], "Size": 400, "SharedSize": 0, "Containers": 0},
+            {"Id": "sha256:" + "4" * 64, "RepoTags": ["redis:7"], "Size": 700, "SharedSize": 0, "Containers": 0},
+        ],
+        "BuildCache": [
+            {"Size": 50, "InUse": False, "Shared": False},
+            {"Size": 70, "InUse": True, "Shared": False},
+        ],
+        "Volumes": [],
+        "LayersSize": 2400,
+    }
+
+
+def test_prune_plan_picks_only_safe_items():
+    plan = bot.build_prune_plan(fake_df())
+
+    # Running containers are skipped, stopped compose containers are kept
+    assert plan["containers"] == [("c3", "one-off", 100), ("c4", "crashed", 200)]
+    assert plan["kept"] == ["shop-db"]
+    # Only untagged images; an unused tagged image is not dangling
+    assert plan["images"] == [("sha256:" + "2" * 64, "2" * 12, 300), ("sha256:" + "3" * 64, "3" * 12, 400)]
+    assert plan["build_cache"] == 50
+
+    text = bot.format_prune_plan(plan)
+    assert "Stopped containers</b>: 2 (300.0 B)" in text
+    assert "Kept: 1 stopped compose containers" in text
+
+
+def test_prune_removes_the_previewed_items_without_force(client):
+    plan = bot.build_prune_plan(fake_df())
+    client.api.remove_container.side_effect = [None, docker.errors.APIError("container is running")]
+    client.api.prune_builds.return_value = {"SpaceReclaimed": 50}
+    query = mock.MagicMock()
+    query.edit_message_text = mock.AsyncMock()
+
+    asyncio.run(bot.run_prune_plan(query, plan))
+
+    assert client.api.remove_container.call_args_list == [mock.call("c3"), mock.call("c4")]
+    assert client.api.remove_image.call_args_list == [mock.call("sha256:" + "2" * 64), mock.call("sha256:" + "3" * 64)]
+    client.api.prune_builds.assert_called_once_with()
+    final = query.edit_message_text.await_args.args[0]
+    assert "Containers: 1/2 removed, 100.0 B" in final
+    assert "Images: 2/2 removed, 700.0 B" in final
+    assert "Build cache: 50.0 B" in final
+
+
+def test_prune_skips_build_cache_when_none_was_previewed(client):
+    plan = {"containers": [], "images": [], "build_cache": 0, "kept": []}
+    query = mock.MagicMock()
+    query.edit_message_text = mock.AsyncMock()
+
+    asyncio.run(bot.run_prune_plan(query, plan))
+
+    client.api.prune_builds.assert_not_called()
+
+
+def test_largest_volumes_are_listed():
+    df = {**fake_df(), "LogSizes": {}, "Volumes": [
+        {"Name": "pg_data", "UsageData": {"Size": 5000, "RefCount": 1}},
+        {"Name": "old_cache", "UsageData": {"Size": 800, "RefCount": 0}},
+        {"Name": "not_sized", "UsageData": {"Size": -1, "RefCount": 0}},
+    ]}
+
+    volumes = bot.summarize_docker_df(df)["volumes"]
+    text = bot.format_docker_df(df)
+
+    assert [v["name"] for v in volumes["largest"]] == ["pg_data", "old_cache"]
+    assert "├ pg_data 4.9 KB" in text
+    assert "├ old_cache 800.0 B (unused)" in text
+    assert "not_sized" not in text
@@ -0,0 +1,181 @@
+"""Fleet hub polling real agent handlers on localhost."""
+import asyncio
+import collections
+import contextvars
+import socket
+from unittest import mock
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+import bot
+
+TOKEN = "fleet-secret"
+
+# Which node is answering; every agent runs in this process, so the fake
+# snapshot reads its identity from the request context
+serving_node = contextvars.ContextVar("serving_node", default="hub")
+
+
+def fake_snapshot(cpu_percent: float) -> dict:
+    name = serving_node.get()
+    running = {"status": "running", "project": "monitoring"}
+    return {
+        "node": name,
+        "cpu": 97.0 if name == "busy" else 12.0,
+        "memory": {"percent": 40.0},
+        "disk": {"percent": 50.0},
+        "containers": {c: dict(running) for c in ("traefik", "prometheus", "grafana", "alertmanager")},
+        "projects": {},
+    }
+
+
+@pytest.fixture(autouse=True)
+def fleet(monkeypatch):
+    monkeypatch.setattr(bot, "collect_local_snapshot", fake_snapshot)
+    monkeypatch.setattr(bot, "fleet_nodes", {})
+    monkeypatch.setattr(bot, "FLEET_TOKEN", TOKEN)
+    monkeypatch.setattr(bot, "FLEET_TIMEOUT", 2)
+    monkeypatch.setattr(bot, "NODE_NAME", "hub")
+
+
+async def start_agent(name: str, token: str = TOKEN) -> tuple:
+    @web.middleware
+    async def as_node(request, handler):
+        serving_node.set(name)
+        # The handler checks the module-level token synchronously
+        with mock.patch.object(bot, "FLEET_TOKEN", token):
+            return await handler(request)
+
+    app = web.Application(middlewares=[as_node])
+    app.router.add_get("/agent/snapshot", bot.agent_snapshot_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def poll(agents: dict) -> None:
+    with mock.patch.object(bot, "FLEET_AGENTS", agents):
+        await bot.poll_fleet()
+
+
+def run(coro):
+    async def wrapper():
+        try:
+            return await coro
+        finally:
+            # The shared session is bound to this test's event loop
+            if bot.http_session is not None:
+                await bot.http_session.close()
+                bot.http_session = None
+
+    return asyncio.run(wrapper())
+
+
+def test_hub_merges_agent_snapshots():
+    async def scenario():
+        agents = {}
+        runners = []
+        for name in ("web", "db", "busy"):
+            runner, agents[name] = await start_agent(name)
+            runners.append(runner)
+        try:
+            await poll(agents)
+            return bot.format_fleet_status(), bot.format_fleet_health()
+        finally:
+            for runner in runners:
+                await runner.cleanup()
+
+    status, health = run(scenario())
+
+    assert list(bot.fleet_nodes) == ["hub", "web", "db", "busy"]
+    for name in ("web", "db", "busy"):
+        node = bot.fleet_nodes[name]
+        assert node["error"] is None
+        assert node["snapshot"]["node"] == name
+    assert "(4 nodes)" in status
+    assert "🟢 <b>web</b>" in status
+    assert "🔴 <b>busy</b>" in status
+    assert "CPU 97%" in status
+    assert "[busy] 🔴 CPU critical" in health
+    assert "[web]" not in health
+
+
+def test_agent_rejects_missing_or_wrong_token():
+    async def scenario():
+        runner, url = await start_agent("web")
+        try:
+            statuses = []
+            async with aiohttp.ClientSession() as session:
+                for headers in ({}, {"Authorization": "Bearer wrong"}, {"Authorization": f"Bearer {TOKEN}"}):
+                    async with session.get(f"{url}/agent/snapshot", headers=headers) as resp:
+                        statuses.append(resp.status)
+            return statuses
+        finally:
+            await runner.cleanup()
+
+    assert run(scenario()) == [401, 401, 200]
+
+
+def test_hub_reports_agent_with_other_token_as_unreachable():
+    async def scenario():
+        runner, url = await start_agent("web", token="rotated")
+        try:
+            await poll({"web": url})
+            return bot.format_fleet_status()
+        finally:
+            await runner.cleanup()
+
+    status = run(scenario())
+
+    assert bot.fleet_nodes["web"]["snapshot"] is None
+    assert bot.fleet_nodes["web"]["error"] == "HTTP 401"
+    assert "⚫ <b>web</b> <i>unreachable: HTTP 401</i>" in status
+
+
+def test_unreachable_agent_does_not_break_the_poll():
+    async def scenario():
+        runner, url = await start_agent("web")
+        agents = {"web": url, "gone": f"http://127.0.0.1:{free_port()}"}
+        try:
+            await poll(agents)
+            first = bot.format_fleet_status()
+        finally:
+            await runner.cleanup()
+
+        # The agent goes away: its last snapshot is kept but shown as stale
+        await poll(agents)
+        return first, bot.format_fleet_status(), bot.format_fleet_health()
+
+    first, second, health = run(scenario())
+
+    assert "🟢 <b>web</b>" in first
+    assert "⚫ <b>gone</b> <i>unreachable:" in first
+    assert bot.fleet_nodes["web"]["snapshot"]["node"] == "web"
+    assert bot.fleet_nodes["web"]["error"]
+    assert "⚫ <b>web</b> <i>stale" in second
+    assert "⚫ gone: unreachable" in health
+    assert "⚫ web: stale" in health
+
+
+
+def test_cpu_meters_keep_their_own_window(monkeypatch):
+    Times = collections.namedtuple("Times", "user idle iowait")
+    samples = iter([Times(100, 900, 0), Times(100, 900, 0), Times(150, 950, 0), Times(250, 950, 0)])
+    monkeypatch.setattr(bot.psutil, "cpu_times", lambda: next(samples))
+    hub, agent = bot.CpuMeter(), bot.CpuMeter()
+
+    assert hub.read() is None and agent.read() is None
+    # The hub's read doesn't restart the agent's window
+    assert hub.read() == 50.0
+    assert agent.read() == 75.0
@@ -0,0 +1,50 @@
+"""Dashboard uids and panel ids the bot uses exist in the provisioned dashboards."""
+import json
+import os
+
+import pytest
+import yaml
+
+import bot
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DASHBOARD_DIR = os.path.join(HERE, "..", "..", "grafana", "provisioning", "dashboards", "json")
+
+
+def panel_ids(panels):
+    for panel in panels:
+        yield panel.get("id")
+        yield from panel_ids(panel.get("panels", []))
+
+
+@pytest.fixture(scope="module")
+def dashboards():
+    found = {}
+    for name in os.listdir(DASHBOARD_DIR):
+        with open(os.path.join(DASHBOARD_DIR, name)) as f:
+            dashboard = json.load(f)
+        found[dashboard["uid"]] = set(panel_ids(dashboard.get("panels", [])))
+    return found
+
+
+def example_config():
+    with open(os.path.join(HERE, "..", "config", "bot.example.yml")) as f:
+        return yaml.safe_load(f)
+
+
+def test_dashboard_uids_are_provisioned(dashboards):
+    example = example_config()
+    uids = {
+        **{f"GRAFANA_DASHBOARDS[{k}]": v for k, v in bot.GRAFANA_DASHBOARDS.items()},
+        **{f"GRAFANA_LINKS[{label}]": uid for label, uid in bot.GRAFANA_LINKS},
+        **{f"bot.example.yml dashboards.{k}": v for k, v in example["dashboards"].items()},
+    }
+    missing = {where: uid for where, uid in uids.items() if uid not in dashboards}
+    assert not missing
+
+
+def test_alert_panels_exist_on_their_dashboards(dashboards):
+    config = bot.build_config(example_config())
+    for category, panel_id in config["alert_panels"].items():
+        uid = config["dashboards"].get(category, config["dashboards"]["default"])
+        assert panel_id in dashboards[uid], f"{category}: panel {panel_id} not on {uid}"
@@ -0,0 +1,35 @@
+"""/procs with fields the bot may not read."""
+import asyncio
+from datetime import datetime
+from unittest import mock
+
+import bot
+
+
+def row(pid, name, io, fds):
+    return {"pid": pid, "name": name, "user": "root", "cpu": 1.0, "mem": 1024, "mem_pct": 0.1,
+            "io": io, "fds": fds, "container": None}
+
+
+def run_procs(monkeypatch, *args):
+    monkeypatch.setattr(bot, "process_snapshot", [row(1, "init", None, None), row(200, "bot", 2048.0, 12)])
+    monkeypatch.setattr(bot, "process_snapshot_at", datetime.now())
+    monkeypatch.setattr(bot, "is_authorized", lambda chat_id: True)
+    update = mock.MagicMock()
+    update.message.reply_text = mock.AsyncMock()
+    context = mock.MagicMock(args=list(args))
+    asyncio.run(bot.procs_command(update, context))
+    return update.message.reply_text.await_args.args[0]
+
+
+def test_denied_fields_show_as_na_and_sort_last(monkeypatch):
+    text = run_procs(monkeypatch, "io")
+
+    assert text.index("<b>bot</b>") < text.index("<b>init</b>")
+    assert "I/O 2.0 KB/s | FDs 12" in text
+    assert "I/O n/a | FDs n/a" in text
+    assert "Disk I/O not readable for 1 processes" in text
+
+
+def test_cpu_view_has_no_warning(monkeypatch):
+    assert "not readable" not in run_procs(monkeypatch, "cpu")
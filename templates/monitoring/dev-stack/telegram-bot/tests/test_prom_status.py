@@ -0,0 +1,84 @@
+"""/status thresholds parsed from the real prometheus/alerts.yml."""
+import os
+
+import pytest
+
+import bot
+
+STACK = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+
+# What alerts.yml says today; update together with the rules
+EXPECTED_LEVELS = {
+    "CPU": [("warning", ">", 70), ("critical", ">", 90)],
+    "Memory": [("warning", ">", 75), ("critical", ">", 90)],
+    "Disk free /": [("warning", "<", 25), ("critical", "<", 10)],
+    "Load (5m)": [("warning", ">", 4)],
+    "Network in": [("warning", ">", 100e6)],
+    "Top CPU": [("warning", ">", 80)],
+    "Top memory of limit": [("warning", ">", 85)],
+    "Restarts (1h)": [("warning", ">", 3)],
+    "5xx rate": [("warning", ">", 5), ("critical", ">", 20)],
+    "p95 latency": [("warning", ">", 2)],
+    "Slowest probe": [("warning", ">", 3)],
+    "SSL expiry": [("warning", "<", 86400 * 14), ("critical", "<", 86400 * 3)],
+    "Postgres cache hit": [("warning", "<", 0.9)],
+    "Postgres longest tx": [("warning", ">", 300)],
+    "Redis memory": [("warning", ">", 80), ("critical", ">", 95)],
+    "Redis hit rate": [("warning", "<", 0.8)],
+    "Redis clients": [("warning", ">", 100)],
+}
+
+
+@pytest.fixture(scope="module")
+def rules_index():
+    index = bot.RunbookIndex()
+    index.build(os.path.join(STACK, "runbooks"), os.path.join(STACK, "prometheus", "alerts.yml"))
+    return index
+
+
+def test_every_status_row_is_graded_from_alerts_yml(rules_index, monkeypatch):
+    monkeypatch.setattr(bot, "runbook_index", rules_index)
+
+    rows = {label: names for _, label, names, _ in bot.PROM_STATUS_ROWS}
+
+    assert set(rows) == set(EXPECTED_LEVELS)
+    for label, names in rows.items():
+        found = bot.get_rule_levels(names)
+        assert found is not None, f"{label}: rules missing or not a single constant comparison"
+        assert found["levels"] == EXPECTED_LEVELS[label], label
+        # The value query is the rule expression without its comparison
+        for name in names:
+            assert rules_index.rules[name]["expr"].strip().startswith(found["query"])
+
+
+def test_grading_matches_the_rules(rules_index, monkeypatch):
+    monkeypatch.setattr(bot, "runbook_index", rules_index)
+    cpu = bot.get_rule_levels(("HighCPU", "CriticalCPU"))["levels"]
+    disk = bot.get_rule_levels(("LowDisk", "CriticalDisk"))["levels"]
+
+    assert [bot.grade_value(v, cpu) for v in (50, 70, 70.1, 95)] == ["🟢", "🟢", "🟡", "🔴"]
+    assert [bot.grade_value(v, disk) for v in (40, 20, 5)] == ["🟢", "🟡", "🔴"]
+
+
+@pytest.mark.parametrize("expr, expected", [
+    ("node_load5 > 4", ("node_load5", ">", 4.0)),
+    ("x >= 1.5", ("x", ">=", 1.5)),
+    ("probe_ssl_earliest_cert_expiry - time() < 86400 * 14", ("probe_ssl_earliest_cert_expiry - time()", "<", 1209600.0)),
+    ('rate(http{code=~"5..", path!="/a>b"}[5m]) != 0', ('rate(http{code=~"5..", path!="/a>b"}[5m])', "!=", 0.0)),
+    ("(a / b) * 100 > (10 + 5)", ("(a / b) * 100", ">", 15.0)),
+    ("x < -1", ("x", "<", -1.0)),
+])
+def test_split_rule_condition(expr, expected):
+    assert bot.split_rule_condition(expr) == expected
+
+
+@pytest.mark.parametrize("expr", [
+    "up == 0 or absent(up)",                  # comparison not at the end
+    "absent(up) or up > 1",                   # "or" in the query
+    "a > 1 and b > 2",
+    "rate(x[5m]) > on(instance) y",           # not a constant
+    "changes(x[1h])",                         # no comparison
+    "x > 1 / 0",
+])
+def test_split_rule_condition_rejects(expr):
+    assert bot.split_rule_condition(expr) is None
@@ -0,0 +1,111 @@
+"""Certificate scanner against a local TLS server with a self-signed certificate."""
+import asyncio
+import shutil
+import socket
+import ssl
+import subprocess
+from datetime import datetime, timedelta
+
+import pytest
+import pytz
+
+import bot
+
+
+@pytest.fixture(scope="module")
+def self_signed(tmp_path_factory):
+    if not shutil.which("openssl"):
+        pytest.skip("openssl not available")
+    path = tmp_path_factory.mktemp("cert")
+    cert, key = path / "cert.pem", path / "key.pem"
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "30",
+         "-subj", "/CN=localhost", "-addext", "subjectAltName=DNS:localhost,DNS:test.local",
+         "-keyout", str(key), "-out", str(cert)],
+        check=True, capture_output=True,
+    )
+    return str(cert), str(key)
+
+
+async def start_tls_server(cert: str, key: str):
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+
+    async def handle(reader, writer):
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0, ssl=context)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_self_signed_certificate_is_read_but_not_verified(self_signed):
+    async def run():
+        server, port = await start_tls_server(*self_signed)
+        async with server:
+            return await bot.fetch_certificate("localhost", port, timeout=5)
+
+    result = asyncio.run(run())
+
+    assert result["verified"] is False
+    assert result["error"]
+    assert result["issuer"] == "localhost"
+    assert sorted(result["sans"]) == ["localhost", "test.local"]
+    expected = datetime.now(pytz.UTC) + timedelta(days=30)
+    assert abs((result["not_after"] - expected).total_seconds()) < 3600
+
+
+def test_trusted_certificate_is_verified(self_signed):
+    cert, key = self_signed
+    context = ssl.create_default_context(cafile=cert)
+
+    async def run():
+        server, port = await start_tls_server(cert, key)
+        async with server:
+            return await bot.fetch_certificate("localhost", port, timeout=5, ssl_context=context)
+
+    result = asyncio.run(run())
+
+    assert result["verified"] is True
+    assert result["error"] is None
+    assert "localhost" in result["sans"]
+
+
+def test_verified_and_unverified_paths_read_the_same_fields(self_signed):
+    cert, key = self_signed
+
+    async def run():
+        server, port = await start_tls_server(cert, key)
+        async with server:
+            trusted = ssl.create_default_context(cafile=cert)
+            return (await bot.fetch_certificate("localhost", port, timeout=5, ssl_context=trusted),
+                    await bot.fetch_certificate("localhost", port, timeout=5))
+
+    verified, unverified = asyncio.run(run())
+
+    assert (verified["verified"], unverified["verified"]) == (True, False)
+    for field in ("not_after", "issuer", "sans"):
+        assert verified[field] == unverified[field]
+
+
+def test_scan_reports_unreachable_target_as_unverified(self_signed):
+    closed = free_port()
+
+    async def run():
+        server, port = await start_tls_server(*self_signed)
+        async with server:
+            return port, await bot.scan_ssl_certificates([("localhost", port), ("127.0.0.1", closed)], timeout=5)
+
+    port, results = asyncio.run(run())
+
+    assert set(results) == {f"localhost:{port}", f"127.0.0.1:{closed}"}
+    failed = results[f"127.0.0.1:{closed}"]
+    assert failed["verified"] is False
+    assert failed["error"]
+    assert "not_after" not in failed
+    assert results[f"localhost:{port}"]["issuer"] == "localhost"
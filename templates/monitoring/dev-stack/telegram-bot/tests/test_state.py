@@ -0,0 +1,278 @@
+"""State store primitives on every backend; Redis runs against a small fake RESP server."""
+import asyncio
+from datetime import datetime
+
+import pytest
+
+import bot
+
+
+class Clock:
+    """Controls the time the stores (and the fake Redis) see."""
+
+    def __init__(self):
+        self.t = 1_800_000_000.0
+
+    def advance(self, seconds: float) -> None:
+        self.t += seconds
+
+
+class FakeRedis:
+    """Enough of RESP and the Redis commands RedisStateStore sends."""
+
+    def __init__(self, clock: Clock, password: str):
+        self.clock = clock
+        self.password = password
+        self.keys = {}  # key -> (value, expires_at_ms or None)
+        self.hashes = {}
+        self.commands = []
+        self.clients = []
+
+    async def start(self) -> int:
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self.drop_clients()
+        self.server.close()
+        await self.server.wait_closed()
+
+    def drop_clients(self) -> None:
+        for writer in self.clients:
+            writer.close()
+        self.clients.clear()
+
+    def get(self, key):
+        entry = self.keys.get(key)
+        if entry and entry[1] is not None and entry[1] <= self.clock.t * 1000:
+            del self.keys[key]
+            return None
+        return entry
+
+    def set(self, key, value, px):
+        self.keys[key] = (value, self.clock.t * 1000 + int(px) if px else None)
+
+    def execute(self, name: str, args: list):
+        if name == "AUTH":
+            return ("+", "OK") if args[-1] == self.password else ("-", "WRONGPASS invalid password")
+        if name == "SELECT":
+            return "+", "OK"
+        if name == "SET":
+            key, value, *options = args
+            if "NX" in options and self.get(key):
+                return "$", None
+            self.set(key, value, options[options.index("PX") + 1] if "PX" in options else None)
+            return "+", "OK"
+        if name == "EVAL":
+            script, _, key, *argv = args
+            entry = self.get(key)
+            if script == bot.RedisStateStore.LEASE_SCRIPT:
+                if entry is None or entry[0] == argv[0]:
+                    self.set(key, argv[0], argv[1])
+                    return ":", 1
+                return ":", 0
+            if script == bot.RedisStateStore.HIT_SCRIPT:
+                count = int(entry[0]) + 1 if entry else 1
+                self.keys[key] = (str(count), entry[1] if entry else None)
+                if count == 1:
+                    self.set(key, "1", argv[0])
+                return ":", count
+            return "-", "ERR unknown script"
+        if name == "HSET":
+            self.hashes.setdefault(args[0], {})[args[1]] = args[2]
+            return ":", 1
+        if name == "HGET":
+            return "$", self.hashes.get(args[0], {}).get(args[1])
+        if name == "HGETALL":
+            return "*", [item for pair in self.hashes.get(args[0], {}).items() for item in pair]
+        if name == "DEL":
+            return ":", sum(1 for key in args if (self.hashes.pop(key, None), self.keys.pop(key, None)) != (None, None))
+        return "-", f"ERR unknown command {name}"
+
+    @staticmethod
+    def encode(kind: str, value) -> bytes:
+        if kind == "$":
+            return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value.encode()), value.encode())
+        if kind == "*":
+            return b"*%d\r\n" % len(value) + b"".join(FakeRedis.encode("$", item) for item in value)
+        return f"{kind}{value}\r\n".encode()
+
+    async def handle(self, reader, writer):
+        self.clients.append(writer)
+        try:
+            while True:
+                count = int((await reader.readuntil(b"\r\n"))[1:-2])
+                args = []
+                for _ in range(count):
+                    size = int((await reader.readuntil(b"\r\n"))[1:-2])
+                    args.append((await reader.readexactly(size + 2))[:-2].decode())
+                self.commands.append(args)
+                writer.write(self.encode(*self.execute(args[0].upper(), args[1:])))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime.fromtimestamp(clock.t, tz)
+
+    monkeypatch.setattr(bot, "datetime", FrozenDatetime)
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def with_store(request, clock, tmp_path):
+    """Run scenario(store, server) on one event loop; server is the fake Redis or None."""
+    def run(scenario):
+        async def main():
+            server = None
+            if request.param == "memory":
+                store = bot.MemoryStateStore()
+            elif request.param == "sqlite":
+                store = bot.SQLiteStateStore(str(tmp_path / "state.db"))
+            else:
+                server = FakeRedis(clock, password="secret")
+                port = await server.start()
+                store = bot.RedisStateStore(f"redis://:secret@127.0.0.1:{port}/2")
+            try:
+                return await scenario(store, server)
+            finally:
+                await store.close()
+                if server:
+                    await server.stop()
+
+        return asyncio.run(main())
+
+    return run
+
+
+def test_state_store_is_abstract():
+    with pytest.raises(TypeError):
+        bot.StateStore()
+
+
+def test_claim_is_won_once_until_it_expires(with_store, clock):
+    async def scenario(store, server):
+        results = [await store.claim("notified:a", 60), await store.claim("notified:a", 60)]
+        results.append(await store.claim("notified:b", 60))
+        clock.advance(59)
+        results.append(await store.claim("notified:a", 60))
+        clock.advance(2)
+        results.append(await store.claim("notified:a", 60))
+        return results
+
+    assert with_store(scenario) == [True, False, True, False, True]
+
+
+def test_released_claim_can_be_won_again(with_store):
+    async def scenario(store, server):
+        results = [await store.claim("notified:a", 60), await store.claim("notified:b", 60)]
+        await store.release("notified:a")
+        await store.release("notified:missing")
+        results += [await store.claim("notified:a", 60), await store.claim("notified:b", 60)]
+        return results
+
+    assert with_store(scenario) == [True, True, True, False]
+
+
+def test_hit_counts_within_its_window(with_store, clock):
+    async def scenario(store, server):
+        counts = [await store.hit("rate:1", 60) for _ in range(3)]
+        counts.append(await store.hit("rate:2", 60))
+        # The window runs from the first hit, later hits don't extend it
+        clock.advance(59)
+        counts.append(await store.hit("rate:1", 60))
+        clock.advance(2)
+        counts.append(await store.hit("rate:1", 60))
+        return counts
+
+    assert with_store(scenario) == [1, 2, 3, 1, 4, 1]
+
+
+def test_lease_renewal_expiry_and_takeover(with_store, clock):
+    async def scenario(store, server):
+        steps = [
+            await store.acquire_lease("leader", "a", 15),
+            await store.acquire_lease("leader", "b", 15),
+        ]
+        clock.advance(10)
+        steps.append(await store.acquire_lease("leader", "a", 15))  # renewed until t+25
+        clock.advance(10)
+        steps.append(await store.acquire_lease("leader", "b", 15))
+        # a stops renewing; b takes over once the lease runs out
+        clock.advance(6)
+        steps.append(await store.acquire_lease("leader", "b", 15))
+        steps.append(await store.acquire_lease("leader", "a", 15))
+        return steps
+
+    assert with_store(scenario) == [True, False, True, False, True, False]
+
+
+def test_alerts_acks_and_backups_round_trip(with_store):
+    async def scenario(store, server):
+        await store.put_alert("h2", {"status": "firing", "received_at": "2026-10-19T09:00:00"})
+        await store.put_alert("h1", {"status": "firing", "received_at": "2026-10-19T08:00:00"})
+        await store.set_ack("h1", datetime(2026, 10, 19, 8, 5))
+        await store.put_backup("db", {"ok": True, "exit_code": 0})
+        before = (await store.get_alert("h1"), list(await store.list_alerts()), await store.get_acks(), await store.get_backups())
+        await store.clear_alerts()
+        return before, await store.list_alerts(), await store.get_acks(), await store.get_backups()
+
+    (alert, order, acks, backups), alerts_after, acks_after, backups_after = with_store(scenario)
+
+    assert alert["status"] == "firing"
+    assert order == ["h1", "h2"]
+    assert acks == {"h1": "2026-10-19T08:05:00"}
+    assert backups == {"db": {"ok": True, "exit_code": 0}}
+    assert alerts_after == {} and acks_after == {}
+    assert backups_after == backups
+
+
+def test_redis_authenticates_selects_and_reconnects(clock):
+    async def scenario():
+        server = FakeRedis(clock, password="secret")
+        port = await server.start()
+        store = bot.RedisStateStore(f"redis://:secret@127.0.0.1:{port}/2")
+        try:
+            first = await store.claim("k", 60)
+            server.drop_clients()
+            await asyncio.sleep(0)
+            # The dropped connection is re-opened and the command retried
+            second = await store.claim("k", 60)
+            return first, second, server.commands
+        finally:
+            await store.close()
+            await server.stop()
+
+    first, second, commands = asyncio.run(scenario())
+
+    assert (first, second) == (True, False)
+    assert [c[0] for c in commands] == ["AUTH", "SELECT", "SET", "AUTH", "SELECT", "SET"]
+    assert commands[1] == ["SELECT", "2"]
+    assert commands[2] == ["SET", "vpsbot:k", "1", "NX", "PX", "60000"]
+
+
+def test_redis_wrong_password_is_an_error(clock):
+    async def scenario():
+        server = FakeRedis(clock, password="secret")
+        port = await server.start()
+        store = bot.RedisStateStore(f"redis://:wrong@127.0.0.1:{port}/0")
+        try:
+            for _ in range(2):
+                with pytest.raises(RuntimeError, match="WRONGPASS"):
+                    await store.claim("k", 60)
+            return server.commands
+        finally:
+            await store.close()
+            await server.stop()
+
+    # The half-open connection is not reused without AUTH
+    assert [c[0] for c in asyncio.run(scenario())] == ["AUTH", "AUTH"]
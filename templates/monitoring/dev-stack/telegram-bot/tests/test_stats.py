@@ -0,0 +1,158 @@
+"""Incident stats: the quantile sketch and the hourly counters."""
+import json
+import random
+from datetime import datetime, timezone
+
+import pytest
+
+import bot
+
+HOUR = 3600
+
+
+def iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def alert(name="HighCPU", started=None, ended=None, category="host"):
+    data = {"labels": {"alertname": name, "category": category, "instance": "vps"}, "startsAt": iso(started)}
+    if ended is not None:
+        data["endsAt"] = iso(ended)
+    return data
+
+
+@pytest.fixture
+def base():
+    # Start of an hour, recent enough to survive prune()
+    return (int(datetime.now().timestamp() // HOUR) - 5) * HOUR
+
+
+def test_sketch_quantiles_are_within_the_relative_error():
+    rng = random.Random(7)
+    values = sorted(rng.lognormvariate(5, 1.5) + 1 for _ in range(5000))
+    sketch = bot.QuantileSketch()
+    for value in values:
+        sketch.add(value)
+
+    for q in (0.5, 0.9, 0.95, 0.99):
+        exact = values[int(q * (len(values) - 1))]
+        assert abs(sketch.quantile(q) - exact) / exact <= bot.STATS_SKETCH_ACCURACY + 1e-9
+
+
+def test_sketch_merge_matches_a_single_sketch():
+    values = [float(v) for v in range(1, 2001)]
+    whole, left, right = bot.QuantileSketch(), bot.QuantileSketch(), bot.QuantileSketch()
+    for value in values:
+        whole.add(value)
+        (left if value % 2 else right).add(value)
+    left.merge(right)
+
+    assert left.count == whole.count == 2000
+    assert dict(left.buckets) == dict(whole.buckets)
+    assert left.quantile(0.95) == whole.quantile(0.95)
+    assert bot.QuantileSketch().quantile(0.5) is None
+
+
+def test_repeated_firing_notifications_count_once(base):
+    stats = bot.IncidentStats()
+    firing = alert(started=base + 60)
+    for _ in range(3):
+        stats.record("h1", firing, "firing")
+    # A new incident of the same alert is a new fire
+    stats.record("h1", alert(started=base + 2 * HOUR), "firing")
+
+    totals = stats.between(base, base + 3 * HOUR)
+    assert totals[("all", "")].fired == 2
+    assert totals[("alertname", "HighCPU")].fired == 2
+    assert stats.between(base, base + HOUR)[("all", "")].fired == 1
+
+
+def test_ack_and_resolve_times(base):
+    stats = bot.IncidentStats()
+    stats.record("h1", alert(started=base), "firing")
+    stats.acknowledge("h1", base + 120)
+    stats.acknowledge("h1", base + 600)  # second ack is ignored
+    stats.record("h1", alert(started=base, ended=base + 900), "resolved")
+    stats.record("h1", alert(started=base, ended=base + 900), "resolved")  # repeated resolve
+
+    counters = stats.between(base, base + HOUR)[("all", "")]
+    assert (counters.fired, counters.acked, counters.resolved) == (1, 1, 1)
+    assert counters.mtta == 120
+    assert counters.mttr == 900
+    assert counters.ttr.quantile(0.5) == pytest.approx(900, rel=bot.STATS_SKETCH_ACCURACY)
+
+
+def test_resolve_without_fire_counts_the_incident(base):
+    stats = bot.IncidentStats()
+    # e.g. the bot restarted after the firing notification
+    stats.record("h2", alert("DiskFull", started=base + 10, ended=base + HOUR + 10, category="disk"), "resolved")
+
+    assert stats.between(base, base + HOUR)[("category", "disk")].fired == 1
+    resolved = stats.between(base + HOUR, base + 2 * HOUR)[("category", "disk")]
+    assert resolved.resolved == 1
+    assert resolved.mttr == HOUR
+
+
+def test_round_trip_through_the_stats_file(base, tmp_path):
+    stats = bot.IncidentStats()
+    stats.record("h1", alert(started=base), "firing")
+    stats.acknowledge("h1", base + 300)
+    stats.record("h3", alert("HighMemory", started=base + HOUR), "firing")
+    path = tmp_path / "stats.json"
+    path.write_text(json.dumps(stats.to_dict()))
+
+    loaded = bot.IncidentStats()
+    loaded.load(str(path))
+
+    before, after = stats.between(base, base + 2 * HOUR), loaded.between(base, base + 2 * HOUR)
+    assert set(before) == set(after)
+    for dim in before:
+        assert after[dim].to_dict() == before[dim].to_dict()
+    # Open incidents continue after the reload: no double fire, resolve still counts
+    loaded.record("h3", alert("HighMemory", started=base + HOUR), "firing")
+    loaded.record("h3", alert("HighMemory", started=base + HOUR, ended=base + HOUR + 60), "resolved")
+    counters = loaded.between(base, base + 2 * HOUR)[("alertname", "HighMemory")]
+    assert (counters.fired, counters.resolved) == (1, 1)
+
+
+def test_load_ignores_a_missing_or_broken_file(tmp_path):
+    stats = bot.IncidentStats()
+    stats.load(str(tmp_path / "missing.json"))
+    (tmp_path / "broken.json").write_text("{not json")
+    stats.load(str(tmp_path / "broken.json"))
+    assert stats.hours == {} and stats.incidents == {}
+
+
+@pytest.fixture
+def rollups(monkeypatch):
+    monkeypatch.setattr(bot, "host_rollups", bot.HostRollups())
+    monkeypatch.setattr(bot, "container_exits", {})
+    monkeypatch.setattr(bot, "container_index", {})
+    monkeypatch.setattr(bot, "project_index", {})
+    return bot.host_rollups
+
+
+def replay(base, name, *actions):
+    for i, action in enumerate(actions):
+        action, _, signal = action.partition(":")
+        attributes = {"name": name, "signal": signal} if signal else {"name": name}
+        bot.apply_container_event({"Action": action, "Actor": {"ID": "c1", "Attributes": attributes}, "time": base + i})
+
+
+@pytest.mark.parametrize("actions, restarts", [
+    # docker restart and /restart
+    (["kill:15", "die", "stop", "start", "restart"], 1),
+    # Restart policy after a crash, and after an OOM kill
+    (["die", "start"], 1),
+    (["oom", "die", "start", "die", "start"], 2),
+    # /down then /up, compose stop/start, docker kill then start
+    (["kill:15", "die", "stop", "start"], 0),
+    (["kill:9", "die", "start"], 0),
+    # A reload signal doesn't make the next crash a wanted stop
+    (["kill:1", "die", "start"], 1),
+    # compose down/up recreates the container
+    (["kill:15", "die", "stop", "destroy", "create", "start"], 0),
+])
+def test_restart_counting_from_docker_events(rollups, base, actions, restarts):
+    replay(base, "web", *actions)
+    assert rollups.event_counts(base, base + HOUR, "restart:").get("web", 0) == restarts